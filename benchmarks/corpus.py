@@ -0,0 +1,421 @@
+"""Generate a deterministic corpus of files for every supported format
+
+    python -m benchmarks.corpus -o path/to/corpus [-n files] [--size bytes] [--tags n]
+
+The same arguments always produce byte for byte the same files. Containers are
+written by hand instead of with the tagging libraries, so upgrading those does
+not change the corpus either. --size is the payload of every file, eg. the scan
+data of a JPEG or the media of a document, --tags the number of text values.
+"""
+import argparse
+import os
+import random
+import struct
+import zipfile
+import zlib
+
+FORMATS = ["jpeg", "png", "mp3", "mp4", "pdf", "docx", "xlsx", "pptx"]
+EXTENSIONS = {
+    "jpeg": ".jpg",
+    "png": ".png",
+    "mp3": ".mp3",
+    "mp4": ".mp4",
+    "pdf": ".pdf",
+    "docx": ".docx",
+    "xlsx": ".xlsx",
+    "pptx": ".pptx",
+}
+
+WORDS = [
+    "report",
+    "draft",
+    "final",
+    "quarterly",
+    "studio",
+    "camera",
+    "holiday",
+    "meeting",
+    "archive",
+    "review",
+]
+
+# fixed timestamp of the zip members, so documents do not depend on the clock
+ZIP_DATE = (2021, 1, 1, 0, 0, 0)
+
+
+def text(rnd, index):
+    words = " ".join(rnd.choice(WORDS) for _ in range(3))
+    return f"{words} {index} {rnd.getrandbits(32):08x}"
+
+
+# JPEG
+
+
+# ASCII tags of IFD0 the exif library knows, DateTime needs its own format
+EXIF_TAGS = [0x010E, 0x010F, 0x0110, 0x0131, 0x013B, 0x8298]
+EXIF_DATETIME = 0x0132
+
+
+def exif(rnd, tags):
+    values = {tag: text(rnd, i).encode() for i, tag in enumerate(EXIF_TAGS[:tags])}
+    if tags > len(EXIF_TAGS):
+        values[EXIF_DATETIME] = b"2021:01:01 10:00:00"
+
+    # values longer than 4 bytes are stored after the IFD
+    data = bytearray()
+    base = 8 + 2 + 12 * len(values) + 4
+    entries = b""
+    for tag, value in sorted(values.items()):
+        value += b"\0"
+        if len(value) <= 4:
+            entries += struct.pack(">HHI", tag, 2, len(value)) + value.ljust(4, b"\0")
+            continue
+        entries += struct.pack(">HHII", tag, 2, len(value), base + len(data))
+        data += value + b"\0" * (len(value) % 2)
+
+    ifd = struct.pack(">H", len(values)) + entries + b"\0\0\0\0"
+    return b"Exif\0\0" + b"MM\0*" + struct.pack(">I", 8) + ifd + bytes(data)
+
+
+def jpeg(rnd, size, tags):
+    app1 = exif(rnd, tags)
+    head = b"\xff\xd8"
+    head += b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\0\x01\x01\0\0\x01\0\x01\0\0"
+    head += b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1
+    head += b"\xff\xdb" + struct.pack(">H", 67) + b"\0" + bytes(range(1, 65))
+    head += b"\xff\xda" + struct.pack(">H", 8) + b"\x01\x01\x00\x00\x3f\x00"
+    # 0xff bytes of the scan data have to be stuffed
+    scan = rnd.randbytes(size).replace(b"\xff", b"\xff\x00")
+    return head + scan + b"\xff\xd9"
+
+
+# PNG
+
+
+def png_chunk(kind, data):
+    crc = zlib.crc32(kind + data)
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+
+def png(rnd, size, tags):
+    # a single row of grey pixels, as wide as the payload
+    width = max(size, 1)
+    header = struct.pack(">IIBBBBB", width, 1, 8, 0, 0, 0, 0)
+    out = b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", header)
+    for i in range(tags):
+        out += png_chunk(b"tEXt", f"Comment{i}\0{text(rnd, i)}".encode("latin-1"))
+    pixels = zlib.compress(b"\0" + rnd.randbytes(width))
+    return out + png_chunk(b"IDAT", pixels) + png_chunk(b"IEND", b"")
+
+
+# MP3
+
+
+ID3_TEXT_FRAMES = [b"TIT2", b"TPE1", b"TALB", b"TPE2", b"TCOM", b"TPUB", b"TENC"]
+# MPEG-1 layer III, 128 kbit/s, 44.1 kHz
+MP3_FRAME_HEADER = b"\xff\xfb\x90\x00"
+MP3_FRAME_SIZE = 417
+
+
+def id3_size(size):
+    # sizes of ID3v2 tags are stored in 7 bit bytes
+    return bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+def id3_frame(kind, data):
+    return kind + struct.pack(">IH", len(data), 0) + data
+
+
+def mp3(rnd, size, tags):
+    frames = b""
+    for i in range(tags):
+        value = text(rnd, i).encode("latin-1")
+        if i < len(ID3_TEXT_FRAMES):
+            frames += id3_frame(ID3_TEXT_FRAMES[i], b"\0" + value)
+        else:
+            # comments can repeat with different descriptions
+            comment = b"\0eng" + f"comment {i}".encode() + b"\0" + value
+            frames += id3_frame(b"COMM", comment)
+    cover = b"\xff\xd8\xff\xe0" + rnd.randbytes(1024)
+    frames += id3_frame(b"APIC", b"\0image/jpeg\0\x03cover\0" + cover)
+
+    tag = b"ID3\x03\x00\x00" + id3_size(len(frames)) + frames
+    count = max(size // MP3_FRAME_SIZE, 1)
+    frame = MP3_FRAME_HEADER + b"\0" * (MP3_FRAME_SIZE - len(MP3_FRAME_HEADER))
+    return tag + frame * count
+
+
+# MP4
+
+
+MP4_ATOMS = [
+    b"\xa9nam",
+    b"\xa9alb",
+    b"\xa9ART",
+    b"aART",
+    b"\xa9cmt",
+    b"desc",
+    b"\xa9grp",
+    b"\xa9gen",
+    b"cprt",
+]
+
+
+def box(kind, payload):
+    return struct.pack(">I", len(payload) + 8) + kind + payload
+
+
+def mp4_item(kind, value):
+    # type 1 is UTF-8 text
+    return box(kind, box(b"data", struct.pack(">II", 1, 0) + value))
+
+
+def mp4(rnd, size, tags):
+    items = b""
+    for i in range(tags):
+        value = text(rnd, i).encode()
+        if i < len(MP4_ATOMS):
+            items += mp4_item(MP4_ATOMS[i], value)
+            continue
+        freeform = box(b"mean", b"\0\0\0\0com.apple.iTunes")
+        freeform += box(b"name", f"\0\0\0\0Tag {i}".encode())
+        freeform += box(b"data", struct.pack(">II", 1, 0) + value)
+        items += box(b"----", freeform)
+
+    hdlr = box(b"hdlr", b"\0" * 8 + b"mdirappl" + b"\0" * 9)
+    meta = box(b"meta", b"\0\0\0\0" + hdlr + box(b"ilst", items))
+    matrix = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    mvhd = box(
+        b"mvhd",
+        b"\0" * 4
+        + struct.pack(">IIII", 0, 0, 1000, 0)
+        + struct.pack(">IH", 0x10000, 0x100)
+        + b"\0" * 10
+        + matrix
+        + b"\0" * 24
+        + struct.pack(">I", 2),
+    )
+    ftyp = box(b"ftyp", b"isom\0\0\x02\0isomiso2avc1mp41")
+    moov = box(b"moov", mvhd + box(b"udta", meta))
+    return ftyp + moov + box(b"mdat", rnd.randbytes(size))
+
+
+# PDF
+
+
+PDF_KEYS = ["Title", "Author", "Subject", "Keywords", "Creator", "Producer"]
+
+
+def pdf_string(value):
+    escaped = value.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({escaped})"
+
+
+def pdf(rnd, size, tags):
+    keys = (PDF_KEYS + [f"Custom{i}" for i in range(len(PDF_KEYS), tags)])[:tags]
+    info = " ".join(f"/{key} {pdf_string(text(rnd, i))}" for i, key in enumerate(keys))
+    # the payload is a content stream of comments, which renders nothing
+    lines = (f"% {text(rnd, i)}" for i in range(size // 40 + 1))
+    content = "\n".join(lines)[:size].encode()
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        f"<< {info} /CreationDate (D:20210101100000Z) >>".encode(),
+    ]
+    out = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    trailer = b"<< /Size %d /Root 1 0 R /Info %d 0 R >>" % (len(objects) + 1, 5)
+    return out + b"trailer\n" + trailer + b"\nstartxref\n%d\n%%%%EOF\n" % xref
+
+
+# OpenXML
+
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+OFFICE_RELATIONSHIPS = "http://schemas.openxmlformats.org/officeDocument/2006"
+PACKAGE_RELATIONSHIPS = "http://schemas.openxmlformats.org/package/2006"
+DOCUMENT_TYPES = "application/vnd.openxmlformats-officedocument"
+
+# main part, its content type and its content of every document type
+DOCUMENTS = {
+    "docx": (
+        "word/document.xml",
+        f"{DOCUMENT_TYPES}.wordprocessingml.document.main+xml",
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/'
+        '2006/main"><w:body><w:p><w:r><w:t>Hello</w:t></w:r></w:p></w:body>'
+        "</w:document>",
+    ),
+    "xlsx": (
+        "xl/workbook.xml",
+        f"{DOCUMENT_TYPES}.spreadsheetml.sheet.main+xml",
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/'
+        'main"><sheets/></workbook>',
+    ),
+    "pptx": (
+        "ppt/presentation.xml",
+        f"{DOCUMENT_TYPES}.presentationml.presentation.main+xml",
+        '<p:presentation xmlns:p="http://schemas.openxmlformats.org/presentationml/'
+        '2006/main"/>',
+    ),
+}
+
+# core properties in the order they are filled in, the rest become custom ones
+CORE_PROPERTIES = [
+    "dc:title",
+    "dc:subject",
+    "dc:creator",
+    "cp:keywords",
+    "dc:description",
+    "cp:lastModifiedBy",
+    "cp:category",
+]
+
+
+def content_types(part, content_type):
+    return (
+        XML_HEADER
+        + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/'
+        'vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Default Extension="png" ContentType="image/png"/>'
+        f'<Override PartName="/{part}" ContentType="{content_type}"/>'
+        '<Override PartName="/docProps/core.xml" ContentType="application/'
+        'vnd.openxmlformats-package.core-properties+xml"/>'
+        '<Override PartName="/docProps/app.xml" ContentType="'
+        f'{DOCUMENT_TYPES}.extended-properties+xml"/>'
+        '<Override PartName="/docProps/custom.xml" ContentType="'
+        f'{DOCUMENT_TYPES}.custom-properties+xml"/>'
+        "</Types>"
+    )
+
+
+def relationships(part):
+    return (
+        XML_HEADER + f'<Relationships xmlns="{PACKAGE_RELATIONSHIPS}/relationships">'
+        f'<Relationship Id="rId1" Type="{OFFICE_RELATIONSHIPS}/relationships/'
+        f'officeDocument" Target="{part}"/>'
+        f'<Relationship Id="rId2" Type="{PACKAGE_RELATIONSHIPS}/relationships/'
+        'metadata/core-properties" Target="docProps/core.xml"/>'
+        f'<Relationship Id="rId3" Type="{OFFICE_RELATIONSHIPS}/relationships/'
+        'extended-properties" Target="docProps/app.xml"/>'
+        f'<Relationship Id="rId4" Type="{OFFICE_RELATIONSHIPS}/relationships/'
+        'custom-properties" Target="docProps/custom.xml"/>'
+        "</Relationships>"
+    )
+
+
+def core_properties(values):
+    elements = "".join(f"<{name}>{value}</{name}>" for name, value in values)
+    return (
+        XML_HEADER + f'<cp:coreProperties xmlns:cp="{PACKAGE_RELATIONSHIPS}/metadata/'
+        'core-properties" xmlns:dc="http://purl.org/dc/elements/1.1/" '
+        'xmlns:dcterms="http://purl.org/dc/terms/" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+        + elements
+        + "<cp:revision>1</cp:revision>"
+        '<dcterms:created xsi:type="dcterms:W3CDTF">2021-01-01T10:00:00Z'
+        "</dcterms:created>"
+        '<dcterms:modified xsi:type="dcterms:W3CDTF">2021-02-01T10:00:00Z'
+        "</dcterms:modified></cp:coreProperties>"
+    )
+
+
+def app_properties():
+    return (
+        XML_HEADER + f'<Properties xmlns="{OFFICE_RELATIONSHIPS}/extended-properties">'
+        "<Application>metaparser benchmarks</Application>"
+        "<Company>ACME Corp</Company><TotalTime>12</TotalTime></Properties>"
+    )
+
+
+def custom_properties(values):
+    properties = "".join(
+        '<property fmtid="{D5CDD505-2E9C-101B-9397-08002B2CF9AE}" '
+        f'pid="{pid}" name="{name}"><vt:lpwstr>{value}</vt:lpwstr></property>'
+        for pid, (name, value) in enumerate(values, start=2)
+    )
+    return (
+        XML_HEADER + f'<Properties xmlns="{OFFICE_RELATIONSHIPS}/custom-properties" '
+        f'xmlns:vt="{OFFICE_RELATIONSHIPS}/docPropsVTypes">{properties}</Properties>'
+    )
+
+
+def openxml(rnd, size, tags, kind):
+    part, content_type, content = DOCUMENTS[kind]
+    values = [text(rnd, i) for i in range(tags)]
+    core = list(zip(CORE_PROPERTIES, values))
+    custom = [(f"Property{i}", value) for i, value in enumerate(values[len(core) :])]
+    members = [
+        ("[Content_Types].xml", content_types(part, content_type)),
+        ("_rels/.rels", relationships(part)),
+        (part, XML_HEADER + content),
+        ("docProps/core.xml", core_properties(core)),
+        ("docProps/app.xml", app_properties()),
+        ("docProps/custom.xml", custom_properties(custom)),
+    ]
+
+    path = os.path.join(os.path.dirname(part), "media", "image1.png")
+    members.append((path, rnd.randbytes(size)))
+    return members
+
+
+def write_zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for name, data in members:
+            z.writestr(zipfile.ZipInfo(name, ZIP_DATE), data, zipfile.ZIP_DEFLATED)
+
+
+GENERATORS = {"jpeg": jpeg, "png": png, "mp3": mp3, "mp4": mp4, "pdf": pdf}
+
+
+def generate(directory, formats=FORMATS, count=1, size=64 * 1024, tags=8, seed=0):
+    """Write count files of every format to directory, return their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for kind in formats:
+        for i in range(count):
+            # every file has its own generator, so files do not depend on each other
+            rnd = random.Random(f"{seed}-{kind}-{i}")
+            path = os.path.join(directory, f"{kind}-{i:05d}{EXTENSIONS[kind]}")
+            if kind in DOCUMENTS:
+                write_zip(path, openxml(rnd, size, tags, kind))
+            else:
+                with open(path, "wb") as f:
+                    f.write(GENERATORS[kind](rnd, size, tags))
+            paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("-n", "--count", type=int, default=10)
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--tags", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    options = parser.parse_args()
+
+    paths = generate(
+        options.output,
+        options.formats,
+        options.count,
+        options.size,
+        options.tags,
+        options.seed,
+    )
+    print(f"Generated {len(paths)} files in {options.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""Measure the throughput and peak memory of every parser on a generated corpus
+
+    python -m benchmarks.parsers [-n files] [--size bytes] [--tags n]
+        [-o results.json] [--baseline baseline.json] [--tolerance 0.25]
+
+Every format is measured in a fresh process, so its peak RSS only covers its own
+parser. Throughputs are in files per second, the best of --repeat runs. With
+--baseline the results are compared against an earlier results file and the
+exit status is 1 if any of them regressed by more than --tolerance.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks import corpus
+
+# field every parser is benchmarked setting, PNG files have no writable fields
+SET_FIELDS = {
+    "jpeg": "artist",
+    "png": None,
+    "mp3": "title",
+    "mp4": "title",
+    "pdf": "/Title",
+    "docx": "title",
+    "xlsx": "title",
+    "pptx": "title",
+}
+OPERATIONS = ["parse", "get_all_values", "set", "write"]
+WALK_OPERATIONS = ["detect", "parse"]
+# peak memory is better when lower, everything else is a throughput
+MEMORY = "peak_rss_kib"
+
+
+def peak_rss():
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def throughput(count, seconds):
+    return count / seconds if seconds > 0 else None
+
+
+def measure_format(kind, directory, repeat):
+    """Run every operation on the files of one format, in a copy of the corpus"""
+    from metaparser.modules import atomic
+    from metaparser.modules.auto import ParserFactory
+
+    field = SET_FIELDS[kind]
+    with tempfile.TemporaryDirectory() as work:
+        paths = []
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(kind + "-"):
+                paths.append(shutil.copy(os.path.join(directory, name), work))
+        detections = [ParserFactory.detect(path) for path in paths]
+
+        best = {}
+        parser_name = None
+        for run in range(repeat):
+            start = time.perf_counter()
+            parsers = []
+            errors = 0
+            for path, detection in zip(paths, detections):
+                parser = ParserFactory.create_parser(detection)
+                try:
+                    parser.parse(path)
+                except Exception:
+                    # reported, the other operations skip the file
+                    errors += 1
+                    continue
+                parsers.append(parser)
+            timings = {"parse": time.perf_counter() - start}
+            parser_name = type(parsers[0]).__name__ if parsers else None
+
+            start = time.perf_counter()
+            for parser in parsers:
+                parser.get_all_values()
+            timings["get_all_values"] = time.perf_counter() - start
+
+            if field is not None:
+                start = time.perf_counter()
+                for i, parser in enumerate(parsers):
+                    parser.set_field(field, f"benchmark value {run} {i}")
+                timings["set"] = time.perf_counter() - start
+
+                # written like the CLI does, syncing the files together
+                start = time.perf_counter()
+                with atomic.batch() as writes:
+                    for parser in parsers:
+                        parser.write()
+                    writes.commit()
+                timings["write"] = time.perf_counter() - start
+
+            for operation, seconds in timings.items():
+                best[operation] = min(best.get(operation, seconds), seconds)
+
+    result = {"parser": parser_name, "files": len(paths), "errors": errors}
+    for operation in OPERATIONS:
+        seconds = best.get(operation)
+        result[operation] = None if seconds is None else throughput(len(paths), seconds)
+    result[MEMORY] = peak_rss()
+    return result
+
+
+def measure_walk(directory, repeat):
+    """Run whole directories through the engine, as the detect and print commands"""
+    from metaparser import engine, tasks, walker
+
+    created = {"detect": tasks.DetectTask, "parse": tasks.PrintTask}
+    result = {}
+    for operation in WALK_OPERATIONS:
+        best = float("inf")
+        for _ in range(repeat):
+            task = created[operation](quiet=True)
+            start = time.perf_counter()
+            count = sum(1 for _ in engine.run(task, walker.walk(directory)))
+            best = min(best, time.perf_counter() - start)
+        result[operation] = throughput(count, best)
+    result["files"] = count
+    result[MEMORY] = peak_rss()
+    return result
+
+
+def in_fresh_process(function, *args):
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(function, *args).result()
+
+
+def compare(results, baseline, tolerance):
+    """Return a message for every result that regressed against the baseline"""
+    regressions = []
+    for name, metrics in baseline["results"].items():
+        for metric, expected in metrics.items():
+            actual = results["results"].get(name, {}).get(metric)
+            if not isinstance(expected, (int, float)) or actual is None:
+                continue
+            if metric in ("files", "errors"):
+                continue
+            if metric == MEMORY:
+                regressed = actual > expected * (1 + tolerance)
+            else:
+                regressed = actual < expected * (1 - tolerance)
+            if regressed:
+                regressions.append(f"{name} {metric}: {actual:.1f} vs {expected:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--count", type=int, default=50)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--tags", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument(
+        "--formats", nargs="+", choices=corpus.FORMATS, default=corpus.FORMATS
+    )
+    parser.add_argument("-o", "--output", help="file to save the results to")
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    options = parser.parse_args()
+
+    results = {
+        "corpus": {
+            "count": options.count,
+            "size": options.size,
+            "tags": options.tags,
+            "seed": options.seed,
+        },
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        corpus.generate(
+            directory,
+            options.formats,
+            options.count,
+            options.size,
+            options.tags,
+            options.seed,
+        )
+        for kind in options.formats:
+            results["results"][kind] = in_fresh_process(
+                measure_format, kind, directory, options.repeat
+            )
+        results["results"]["walk"] = in_fresh_process(
+            measure_walk, directory, options.repeat
+        )
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(results, json.load(f), options.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
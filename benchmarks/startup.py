@@ -0,0 +1,87 @@
+"""Measure the startup time of metaparser and check which modules it imports
+
+    python -m benchmarks.startup -f path/to/file [-n runs] [command]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+# imported by the parsers, none of them may be loaded by the detect command
+FORMAT_LIBRARIES = ["exif", "eyed3", "mutagen", "PyPDF2"]
+
+RUN_CLI = "from metaparser.__main__ import entry_point; entry_point()"
+
+LIST_IMPORTS = """
+import json, sys
+from metaparser.__main__ import cli
+try:
+    cli(sys.argv[1:])
+except SystemExit:
+    pass
+print(json.dumps(sorted(sys.modules)), file=sys.stderr)
+"""
+
+
+def time_runs(args, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", RUN_CLI, *args],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def imported_modules(args):
+    process = subprocess.run(
+        [sys.executable, "-c", LIST_IMPORTS, *args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    return json.loads(process.stderr.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-f", "--file", required=True)
+    parser.add_argument("-n", "--runs", type=int, default=20)
+    parser.add_argument("command", nargs="?", default="detect")
+    options = parser.parse_args()
+
+    args = [options.command, "-f", options.file]
+    timings = time_runs(args, options.runs)
+    modules = imported_modules(args)
+    loaded = [
+        library
+        for library in FORMAT_LIBRARIES
+        if any(m == library or m.startswith(library + ".") for m in modules)
+    ]
+
+    print(
+        json.dumps(
+            {
+                "command": args,
+                "runs": options.runs,
+                "median_s": statistics.median(timings),
+                "min_s": min(timings),
+                "modules": len(modules),
+                "format_libraries": loaded,
+            },
+            indent=2,
+        )
+    )
+    if options.command == "detect" and loaded:
+        print(f"detect imported format libraries: {loaded}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""Read and edit the metadata of images, audio, video and documents
+
+The Python API is imported on first use, so the CLI and the server client do not
+pay for importing the engine and the parsers. See api.py.
+"""
+from typing import Any
+
+__all__ = [
+    "File",
+    "Record",
+    "UnsupportedFileError",
+    "apply",
+    "clear",
+    "delete_field",
+    "open",
+    "open_file",
+    "scan",
+    "set_field",
+]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in __all__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    from . import api
+
+    return getattr(api, name)
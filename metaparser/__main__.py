@@ -1,10 +1,26 @@
+import contextlib
+import functools
 import logging
 import os
+from typing import Any, Callable, Dict, Iterable, Optional, Sized
 
 import click
-import magic
 
-from .modules.auto import ParserFactory
+import metaparser.cache as cache
+import metaparser.client as client
+import metaparser.deep as deep
+import metaparser.engine as engine
+import metaparser.journal as journal
+import metaparser.manifest as manifest
+import metaparser.output as output
+import metaparser.profile_report as profile_report
+import metaparser.query as query
+import metaparser.stats as stats
+import metaparser.tasks as tasks
+import metaparser.walker as walker
+from metaparser.modules.auto import ParserFactory
+from metaparser.modules.base import DEFAULT_PADDING, BaseParser, print_values
+from metaparser.modules.detect import sniff
 
 logging.basicConfig(
     format="[%(asctime)s][%(levelname)s]: %(message)s",
@@ -12,6 +28,375 @@ logging.basicConfig(
     level="ERROR",
 )
 
+jobs_option = click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help="number of worker processes used for directories, 0 uses all CPUs",
+)
+
+compact_option = click.option(
+    "--compact",
+    is_flag=True,
+    default=False,
+    help="fully rewrite documents so removed values are not kept in older revisions",
+)
+
+padding_option = click.option(
+    "--padding",
+    type=click.IntRange(min=0),
+    default=DEFAULT_PADDING,
+    show_default=True,
+    help="bytes of free space reserved when the tags of a file have to grow, so "
+    "later edits are written in place",
+)
+
+journal_option = click.option(
+    "--journal",
+    "journal_file",
+    type=click.Path(dir_okay=False),
+    help="record the files completed by directory and manifest runs to this file",
+)
+
+resume_option = click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="skip the files the journal records as done and not modified since",
+)
+
+
+cache_option = click.option(
+    "--cache",
+    "use_cache",
+    is_flag=True,
+    default=False,
+    help="reuse the metadata of unchanged files from the cache file",
+)
+
+cache_file_option = click.option(
+    "--cache-file",
+    type=click.Path(dir_okay=False),
+    default=cache.default_path(),
+    show_default=True,
+    help="path to the metadata cache",
+)
+
+
+format_option = click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(output.FORMATS),
+    default=output.FORMAT_TEXT,
+    show_default=True,
+    help="output format, the structured ones write a record per file",
+)
+
+
+server_option = click.option(
+    "--server",
+    type=click.Path(dir_okay=False),
+    envvar=client.SOCKET_ENV,
+    help="socket of a running metaparser server to send single files to",
+)
+
+
+profile_option = click.option(
+    "--profile",
+    is_flag=True,
+    default=False,
+    help="report latency histograms, bytes read and written and the slowest files "
+    "of directory and manifest runs",
+)
+
+profile_slowest_option = click.option(
+    "--profile-slowest",
+    type=click.IntRange(min=0),
+    default=profile_report.DEFAULT_SLOWEST,
+    show_default=True,
+    help="number of slowest files listed by --profile",
+)
+
+profile_stats_option = click.option(
+    "--profile-stats",
+    type=click.Path(dir_okay=False),
+    help="also run cProfile and save its pstats to this file, implies --profile",
+)
+
+
+class SizeType(click.ParamType):
+    name = "size"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return walker.parse_size(value)
+        except (OverflowError, ValueError):
+            self.fail(f"{value!r} is not a size, eg. 4096, 64k or 1.5G", param, ctx)
+
+
+filter_options = [
+    click.option(
+        "--include",
+        multiple=True,
+        help="only process files matching this glob, matched against the path "
+        "relative to the directory if it has a slash and the name otherwise",
+    ),
+    click.option(
+        "--exclude",
+        multiple=True,
+        help="skip files and directories matching this glob",
+    ),
+    click.option(
+        "--mime",
+        multiple=True,
+        help="only process files whose name suggests a MIME type matching this glob, "
+        "eg. image/*",
+    ),
+    click.option(
+        "--max-depth",
+        type=click.IntRange(min=1),
+        help="directory levels to walk, 1 only walks the files of the directory",
+    ),
+    click.option("--min-size", type=SizeType(), help="skip smaller files, eg. 1k"),
+    click.option("--max-size", type=SizeType(), help="skip larger files, eg. 100M"),
+    click.option(
+        "--symlinks",
+        type=click.Choice(walker.SYMLINK_POLICIES),
+        default=walker.SYMLINKS_FILES,
+        show_default=True,
+        help="skip links, only follow the ones to files or follow all of them",
+    ),
+    click.option(
+        "--one-file-system",
+        is_flag=True,
+        default=False,
+        help="do not descend into directories on other file systems",
+    ),
+]
+
+
+def walk_filters(command: Callable) -> Callable:
+    """Add the filter options of directory walks, passed to command as filters"""
+
+    @functools.wraps(command)
+    def wrapper(
+        *args,
+        include,
+        exclude,
+        mime,
+        max_depth,
+        min_size,
+        max_size,
+        symlinks,
+        one_file_system,
+        **kwargs,
+    ):
+        filters = walker.Filters(
+            list(include),
+            list(exclude),
+            list(mime),
+            max_depth,
+            min_size,
+            max_size,
+            symlinks,
+            one_file_system,
+        )
+        return command(*args, filters=filters, **kwargs)
+
+    for option in reversed(filter_options):
+        wrapper = option(wrapper)
+    return wrapper
+
+
+def open_profiler(
+    profile: bool, slowest: int, stats_file: Optional[str]
+) -> Optional[profile_report.Profiler]:
+    if not profile and stats_file is None:
+        return None
+    return profile_report.Profiler(slowest, stats_file)
+
+
+def open_journal(path: Optional[str], resume: bool) -> Optional[journal.Journal]:
+    if resume and path is None:
+        raise click.UsageError("--resume needs a --journal")
+    return journal.Journal(path, resume) if path is not None else None
+
+
+def open_cache(enabled: bool, cache_file: str) -> Optional[cache.MetadataCache]:
+    return cache.MetadataCache(cache_file) if enabled else None
+
+
+def invalidate(enabled: bool, cache_file: str, file: str) -> None:
+    if enabled:
+        with cache.MetadataCache(cache_file) as metadata_cache:
+            metadata_cache.invalidate(file)
+
+
+def report(
+    task: engine.Task,
+    result: engine.FileResult,
+    writer: Optional[output.RecordWriter] = None,
+) -> None:
+    if result.skipped:
+        name = os.path.basename(result.path)
+        logging.info(f"Skipping {name} as no parser have been found")
+    if writer is None:
+        print(result.output, end="")
+    else:
+        writer.write(output.create_record(result, result.values))
+    if result.error is not None:
+        logging.error(f"Failed to process {result.path}: {result.error}")
+        logging.debug(result.traceback)
+
+
+def run_tree(
+    task: engine.Task,
+    directory: str,
+    jobs: int,
+    metadata_cache: Optional[cache.MetadataCache] = None,
+    writer: Optional[output.RecordWriter] = None,
+    run_profiler: Optional[profile_report.Profiler] = None,
+    run_journal: Optional[journal.Journal] = None,
+    filters: Optional[walker.Filters] = None,
+) -> None:
+    run_paths(
+        task,
+        walker.walk(directory, filters),
+        jobs,
+        metadata_cache,
+        writer,
+        run_profiler,
+        run_journal,
+    )
+
+
+def run_paths(
+    task: engine.Task,
+    paths: Iterable[str],
+    jobs: int,
+    metadata_cache: Optional[cache.MetadataCache] = None,
+    writer: Optional[output.RecordWriter] = None,
+    run_profiler: Optional[profile_report.Profiler] = None,
+    run_journal: Optional[journal.Journal] = None,
+    limit: Optional[int] = None,
+) -> None:
+    """Run the task on the paths, reporting every result
+
+    With a limit, the run stops once that many files printed something.
+    """
+    # the files skipped as done are counted once the walk is over
+    walked = False
+    if run_journal is not None and run_journal.resuming:
+        if isinstance(paths, Sized):
+            paths = list(run_journal.pending(paths))
+            print(f"{run_journal.done_count} file(s) already done, {len(paths)} left")
+        else:
+            # filtered as the walk goes, huge trees are never held in memory
+            print(f"{run_journal.recorded} file(s) recorded as done in the journal")
+            paths = run_journal.pending(paths)
+            walked = True
+
+    failed = 0
+    modified = 0
+    in_place = 0
+    unchanged = 0
+    found = 0
+    results = engine.run(task, paths, jobs, metadata_cache, run_profiler)
+    # closing the run early cancels the files queued for the workers
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(contextlib.closing(results))
+        if run_profiler is not None:
+            stack.enter_context(run_profiler)
+        if run_journal is not None:
+            stack.enter_context(run_journal)
+        for result in results:
+            report(task, result, writer)
+            if run_profiler is not None:
+                run_profiler.add(result)
+            if run_journal is not None:
+                run_journal.record(result)
+            if result.error is not None:
+                failed += 1
+            elif result.modified:
+                modified += 1
+                in_place += result.in_place
+            elif not result.skipped:
+                unchanged += 1
+            if limit is not None and result.output:
+                found += 1
+                if found >= limit:
+                    break
+    if failed:
+        logging.error(f"{failed} file(s) could not be processed")
+    if run_journal is not None and walked:
+        print(f"{run_journal.done_count} file(s) already done")
+    if task.modifies:
+        print(
+            f"{modified} file(s) modified ({in_place} in place), {unchanged} unchanged"
+        )
+    if metadata_cache is not None:
+        logging.info(f"{metadata_cache.hits} file(s) processed from the cache")
+        metadata_cache.close()
+    if run_profiler is not None:
+        for line in run_profiler.report():
+            click.echo(line, err=True)
+
+
+def request(
+    server: str,
+    command: str,
+    file: str,
+    writer: Optional[output.RecordWriter] = None,
+    **arguments: Any,
+) -> Dict[str, Any]:
+    """Process a single file on the server, raising if no parser supports it"""
+    message = {"command": command, "file": os.path.abspath(file), **arguments}
+    record = client.request(server, message)
+    if writer is not None:
+        writer.write(record)
+    if record["error"] is not None:
+        raise Exception(record["error"])
+    if record["parser"] is None and command != client.COMMAND_DETECT:
+        raise Exception("Cannot find parser for file")
+    return record
+
+
+def request_write(
+    server: str,
+    command: str,
+    file: str,
+    use_cache: bool,
+    cache_file: str,
+    **arguments: Any,
+) -> None:
+    record = request(server, command, file, **arguments)
+    if record["modified"]:
+        invalidate(use_cache, cache_file, file)
+        logging.info(f"Updated {file} {write_method(record['in_place'])}")
+    else:
+        logging.info(f"Not updating {file} as no value changed")
+
+
+def write_method(in_place: bool) -> str:
+    return "in place" if in_place else "by rewriting it"
+
+
+def write_file(parser: BaseParser, file: str, use_cache: bool, cache_file: str) -> None:
+    if parser.write():
+        invalidate(use_cache, cache_file, file)
+        logging.info(f"Updated {file} {write_method(parser.written_in_place)}")
+    else:
+        logging.info(f"Not updating {file} as no value changed")
+
+
+def run_file(task: engine.Task, file: str, writer: output.RecordWriter) -> None:
+    """Process a single file for structured output"""
+    report(task, engine.process_file(task, file), writer)
+
 
 @click.group()
 def cli():
@@ -40,23 +425,53 @@ def cli():
     default=False,
     help="print debug messages",
 )
-def detect_file(file, verbose, debug):
+@jobs_option
+@format_option
+@server_option
+@profile_option
+@profile_slowest_option
+@profile_stats_option
+@walk_filters
+def detect_file(
+    file,
+    verbose,
+    debug,
+    jobs,
+    output_format,
+    server,
+    profile,
+    profile_slowest,
+    profile_stats,
+    filters,
+):
     """detect the file type"""
     if verbose:
         logging.getLogger().setLevel("INFO")
     if debug:
         logging.getLogger().setLevel("DEBUG")
 
+    writer = output.create_writer(output_format)
+    task = tasks.DetectTask(quiet=writer is not None)
     if os.path.isdir(file):
         logging.info(f"{file} is a directory")
-        for root, _, files in os.walk(file):
-            for file in files:
-                path = os.path.join(root, file)
-                mime = magic.from_file(path, mime=True)
-                print(f"{path}: {mime}")
+        run_tree(
+            task,
+            file,
+            jobs,
+            writer=writer,
+            run_profiler=open_profiler(profile, profile_slowest, profile_stats),
+            filters=filters,
+        )
+    elif server is not None:
+        record = request(server, client.COMMAND_DETECT, file, writer)
+        if writer is None:
+            print(f"{file}: {record['mime']}")
+    elif writer is not None:
+        run_file(task, file, writer)
     else:
-        mime = magic.from_file(file, mime=True)
-        print(f"{file}: {mime}")
+        print(f"{file}: {sniff(file).mime}")
+    if writer is not None:
+        writer.close()
 
 
 @cli.command("fields")
@@ -81,20 +496,29 @@ def detect_file(file, verbose, debug):
     default=False,
     help="print debug messages",
 )
-def list_fields(file, verbose, debug):
+@format_option
+def list_fields(file, verbose, debug, output_format):
     """list all fields in the file"""
     if verbose:
         logging.getLogger().setLevel("INFO")
     if debug:
         logging.getLogger().setLevel("DEBUG")
 
-    parser_cls = ParserFactory.get_parser_for_file(file)
-    if parser_cls is None:
+    parser = ParserFactory.create_parser_for_file(file)
+    if parser is None:
         raise Exception("Cannot find parser for file")
-    parser = parser_cls()
     parser.parse(file)
-    for field in parser.get_fields():
-        print(field)
+    writer = output.create_writer(output_format)
+    if writer is None:
+        for field in parser.get_fields():
+            print(field)
+        return
+
+    result = engine.FileResult(file)
+    result.mime = parser.mime
+    result.parser = type(parser).__name__
+    writer.write(output.create_record(result, parser.get_fields()))
+    writer.close()
 
 
 @cli.command("set")
@@ -119,39 +543,74 @@ def list_fields(file, verbose, debug):
     default=False,
     help="print debug messages",
 )
+@jobs_option
+@compact_option
+@padding_option
+@cache_option
+@cache_file_option
+@server_option
+@profile_option
+@profile_slowest_option
+@profile_stats_option
+@journal_option
+@resume_option
 @click.argument("field")
 @click.argument("value")
-def set_field(file, verbose, debug, field, value):
+@walk_filters
+def set_field(
+    file,
+    verbose,
+    debug,
+    jobs,
+    compact,
+    padding,
+    use_cache,
+    cache_file,
+    server,
+    profile,
+    profile_slowest,
+    profile_stats,
+    journal_file,
+    resume,
+    field,
+    value,
+    filters,
+):
     """set FIELD VALUE"""
     if verbose:
         logging.getLogger().setLevel("INFO")
     if debug:
         logging.getLogger().setLevel("DEBUG")
 
+    options = {"compact": compact, "padding": padding}
     if os.path.isdir(file):
-        for root, _, files in os.walk(file):
-            for file in files:
-                path = os.path.join(root, file)
-                parser_cls = ParserFactory.get_parser_for_file(path)
-                if parser_cls is None:
-                    logging.info(f"Skipping {file} as no parser have been found")
-                    continue
-                parser = parser_cls()
-                parser.parse(path)
-                try:
-                    parser.set_field(field, value)
-                except KeyError:
-                    logging.warn(f"Field {field} not present in {file}")
-                print(f"Updating {file}")
-                parser.write()
+        run_tree(
+            tasks.SetTask(field, value, options),
+            file,
+            jobs,
+            open_cache(use_cache, cache_file),
+            run_profiler=open_profiler(profile, profile_slowest, profile_stats),
+            run_journal=open_journal(journal_file, resume),
+            filters=filters,
+        )
+    elif server is not None:
+        request_write(
+            server,
+            client.COMMAND_SET,
+            file,
+            use_cache,
+            cache_file,
+            field=field,
+            value=value,
+            options=options,
+        )
     else:
-        parser_cls = ParserFactory.get_parser_for_file(file)
-        if parser_cls is None:
+        parser = ParserFactory.create_parser_for_file(file, options)
+        if parser is None:
             raise Exception("Cannot find parser for file")
-        parser = parser_cls()
         parser.parse(file)
         parser.set_field(field, value)
-        parser.write()
+        write_file(parser, file, use_cache, cache_file)
 
 
 @cli.command("delete")
@@ -176,38 +635,71 @@ def set_field(file, verbose, debug, field, value):
     default=False,
     help="print debug messages",
 )
+@jobs_option
+@compact_option
+@padding_option
+@cache_option
+@cache_file_option
+@server_option
+@profile_option
+@profile_slowest_option
+@profile_stats_option
+@journal_option
+@resume_option
 @click.argument("field")
-def delete_field(file, verbose, debug, field):
+@walk_filters
+def delete_field(
+    file,
+    verbose,
+    debug,
+    jobs,
+    compact,
+    padding,
+    use_cache,
+    cache_file,
+    server,
+    profile,
+    profile_slowest,
+    profile_stats,
+    journal_file,
+    resume,
+    field,
+    filters,
+):
     """delete FIELD"""
     if verbose:
         logging.getLogger().setLevel("INFO")
     if debug:
         logging.getLogger().setLevel("DEBUG")
 
+    options = {"compact": compact, "padding": padding}
     if os.path.isdir(file):
-        for root, _, files in os.walk(file):
-            for file in files:
-                path = os.path.join(root, file)
-                parser_cls = ParserFactory.get_parser_for_file(path)
-                if parser_cls is None:
-                    logging.info(f"Skipping {file} as no parser have been found")
-                    continue
-                parser = parser_cls()
-                parser.parse(path)
-                try:
-                    parser.delete_field(field)
-                except KeyError:
-                    logging.warn(f"Field {field} not present in {file}")
-                print(f"Updating {file}")
-                parser.write()
+        run_tree(
+            tasks.DeleteTask(field, options),
+            file,
+            jobs,
+            open_cache(use_cache, cache_file),
+            run_profiler=open_profiler(profile, profile_slowest, profile_stats),
+            run_journal=open_journal(journal_file, resume),
+            filters=filters,
+        )
+    elif server is not None:
+        request_write(
+            server,
+            client.COMMAND_DELETE,
+            file,
+            use_cache,
+            cache_file,
+            field=field,
+            options=options,
+        )
     else:
-        parser_cls = ParserFactory.get_parser_for_file(file)
-        if parser_cls is None:
+        parser = ParserFactory.create_parser_for_file(file, options)
+        if parser is None:
             raise Exception("Cannot find parser for file")
-        parser = parser_cls()
         parser.parse(file)
         parser.delete_field(field)
-        parser.write()
+        write_file(parser, file, use_cache, cache_file)
 
 
 @cli.command("delete-all")
@@ -232,34 +724,140 @@ def delete_field(file, verbose, debug, field):
     default=False,
     help="print debug messages",
 )
-def delete_all_fields(file, verbose, debug):
+@jobs_option
+@compact_option
+@padding_option
+@cache_option
+@cache_file_option
+@server_option
+@profile_option
+@profile_slowest_option
+@profile_stats_option
+@journal_option
+@resume_option
+@walk_filters
+def delete_all_fields(
+    file,
+    verbose,
+    debug,
+    jobs,
+    compact,
+    padding,
+    use_cache,
+    cache_file,
+    server,
+    profile,
+    profile_slowest,
+    profile_stats,
+    journal_file,
+    resume,
+    filters,
+):
     """delete all fields"""
     if verbose:
         logging.getLogger().setLevel("INFO")
     if debug:
         logging.getLogger().setLevel("DEBUG")
 
+    options = {"compact": compact, "padding": padding}
     if os.path.isdir(file):
-        for root, _, files in os.walk(file):
-            for file in files:
-                path = os.path.join(root, file)
-                parser_cls = ParserFactory.get_parser_for_file(path)
-                if parser_cls is None:
-                    logging.info(f"Skipping {file} as no parser have been found")
-                    continue
-                parser = parser_cls()
-                parser.parse(path)
-                parser.clear()
-                print(f"Updating {file}")
-                parser.write()
+        run_tree(
+            tasks.ClearTask(options),
+            file,
+            jobs,
+            open_cache(use_cache, cache_file),
+            run_profiler=open_profiler(profile, profile_slowest, profile_stats),
+            run_journal=open_journal(journal_file, resume),
+            filters=filters,
+        )
+    elif server is not None:
+        request_write(
+            server, client.COMMAND_CLEAR, file, use_cache, cache_file, options=options
+        )
     else:
-        parser_cls = ParserFactory.get_parser_for_file(file)
-        if parser_cls is None:
+        parser = ParserFactory.create_parser_for_file(file, options)
+        if parser is None:
             raise Exception("Cannot find parser for file")
-        parser = parser_cls()
         parser.parse(file)
         parser.clear()
-        parser.write()
+        write_file(parser, file, use_cache, cache_file)
+
+
+@cli.command("apply")
+@click.option(
+    "-f",
+    "--file",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+    help="path to the CSV or JSONL manifest with file, action, field and value",
+    required=True,
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="print info messages",
+)
+@click.option(
+    "-d",
+    "--debug",
+    is_flag=True,
+    default=False,
+    help="print debug messages",
+)
+@jobs_option
+@compact_option
+@padding_option
+@cache_option
+@cache_file_option
+@click.option(
+    "--manifest-format",
+    type=click.Choice(manifest.FORMATS),
+    default=manifest.FORMAT_AUTO,
+    show_default=True,
+    help="format of the manifest, auto uses csv for .csv files and jsonl otherwise",
+)
+@profile_option
+@profile_slowest_option
+@profile_stats_option
+@journal_option
+@resume_option
+def apply_manifest(
+    file,
+    verbose,
+    debug,
+    jobs,
+    compact,
+    padding,
+    use_cache,
+    cache_file,
+    manifest_format,
+    profile,
+    profile_slowest,
+    profile_stats,
+    journal_file,
+    resume,
+):
+    """apply the set, delete and clear actions of a manifest, writing every file once"""
+    if verbose:
+        logging.getLogger().setLevel("INFO")
+    if debug:
+        logging.getLogger().setLevel("DEBUG")
+
+    try:
+        operations = manifest.read(file, manifest_format)
+    except manifest.ManifestError as e:
+        raise click.BadParameter(str(e), param_hint="MANIFEST")
+    logging.info(f"Applying operations to {len(operations)} file(s)")
+    task = tasks.ApplyTask(operations, {"compact": compact, "padding": padding})
+    run_paths(
+        task,
+        operations,
+        jobs,
+        open_cache(use_cache, cache_file),
+        run_profiler=open_profiler(profile, profile_slowest, profile_stats),
+        run_journal=open_journal(journal_file, resume),
+    )
 
 
 @cli.command("print")
@@ -284,36 +882,115 @@ def delete_all_fields(file, verbose, debug):
     default=False,
     help="print debug messages",
 )
-def print_file(file, verbose, debug):
+@jobs_option
+@cache_option
+@cache_file_option
+@format_option
+@server_option
+@profile_option
+@profile_slowest_option
+@profile_stats_option
+@walk_filters
+def print_file(
+    file,
+    verbose,
+    debug,
+    jobs,
+    use_cache,
+    cache_file,
+    output_format,
+    server,
+    profile,
+    profile_slowest,
+    profile_stats,
+    filters,
+):
     """print the file"""
     if verbose:
         logging.getLogger().setLevel("INFO")
     if debug:
         logging.getLogger().setLevel("DEBUG")
 
+    writer = output.create_writer(output_format)
+    task = tasks.PrintTask(quiet=writer is not None)
     if os.path.isdir(file):
-        for root, _, files in os.walk(file):
-            for file in files:
-                path = os.path.join(root, file)
-                parser_cls = ParserFactory.get_parser_for_file(path)
-                if parser_cls is None:
-                    logging.info(f"Skipping {file} as no parser have been found")
-                    continue
-                parser = parser_cls()
-                parser.parse(path)
-                print(f"{file}:")
-                parser.print()
-                print()
+        metadata_cache = open_cache(use_cache, cache_file)
+        run_tree(
+            task,
+            file,
+            jobs,
+            metadata_cache,
+            writer,
+            open_profiler(profile, profile_slowest, profile_stats),
+            filters=filters,
+        )
+    elif server is not None:
+        record = request(server, client.COMMAND_PRINT, file, writer)
+        if writer is None:
+            parser_class = ParserFactory.get_parser(record["mime"])
+            if parser_class is None:
+                raise Exception("Cannot find parser for file")
+            # the fields are encoded like cached values, printed like local ones
+            print_values(parser_class.decode_values(record["fields"]))
+    elif writer is not None:
+        run_file(task, file, writer)
     else:
-        parser_cls = ParserFactory.get_parser_for_file(file)
-        if parser_cls is None:
+        parser = ParserFactory.create_parser_for_file(file)
+        if parser is None:
             raise Exception("Cannot find parser for file")
-        parser = parser_cls()
         parser.parse(file)
         parser.print()
+    if writer is not None:
+        writer.close()
 
 
-# analyze entropy, default entropy value is 6
+@cli.command("extract-images")
+@click.option(
+    "-f",
+    "--file",
+    type=click.Path(exists=True, dir_okay=True, resolve_path=True),
+    help="path to the file/directory to extract the embedded images of",
+    required=True,
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(file_okay=False, resolve_path=True),
+    default=".",
+    show_default=True,
+    help="directory to save the images to",
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="print info messages",
+)
+@click.option(
+    "-d",
+    "--debug",
+    is_flag=True,
+    default=False,
+    help="print debug messages",
+)
+@jobs_option
+@walk_filters
+def extract_images(file, output, verbose, debug, jobs, filters):
+    """save the embedded images, eg. the cover art of mp3 files"""
+    if verbose:
+        logging.getLogger().setLevel("INFO")
+    if debug:
+        logging.getLogger().setLevel("DEBUG")
+
+    if os.path.isdir(file):
+        run_tree(tasks.ExtractImagesTask(output, file), file, jobs, filters=filters)
+    else:
+        task = tasks.ExtractImagesTask(output, os.path.dirname(file))
+        run_paths(task, [file], 1)
+
+
+# analyze entropy, default entropy value is 6, or deep.DEFAULT_MIN_ENTROPY with --deep
 @cli.command("entropy")
 @click.option(
     "-f",
@@ -336,43 +1013,361 @@ def print_file(file, verbose, debug):
     default=False,
     help="print debug messages",
 )
-@click.option("-e", "--entropy", type=float, default=6)
-def entropy(file, verbose, debug, entropy):
-    """print the file"""
+@jobs_option
+@cache_option
+@cache_file_option
+@format_option
+@click.option("-e", "--entropy", type=float, default=None)
+@click.option(
+    "--deep",
+    "deep_scan",
+    is_flag=True,
+    default=False,
+    help="scan the embedded data and trailing bytes in sliding windows",
+)
+@click.option(
+    "--window",
+    type=click.IntRange(min=1),
+    default=deep.DEFAULT_WINDOW,
+    show_default=True,
+    help="bytes of a window, with --deep",
+)
+@click.option(
+    "--step",
+    type=click.IntRange(min=1),
+    default=deep.DEFAULT_STEP,
+    show_default=True,
+    help="bytes between the starts of two windows, with --deep",
+)
+@profile_option
+@profile_slowest_option
+@profile_stats_option
+@walk_filters
+def entropy(
+    file,
+    verbose,
+    debug,
+    jobs,
+    use_cache,
+    cache_file,
+    output_format,
+    entropy,
+    deep_scan,
+    window,
+    step,
+    profile,
+    profile_slowest,
+    profile_stats,
+    filters,
+):
+    """print the values, or with --deep the regions of the files, of high entropy"""
     if verbose:
         logging.getLogger().setLevel("INFO")
     if debug:
         logging.getLogger().setLevel("DEBUG")
 
+    writer = output.create_writer(output_format)
+    task: engine.Task
+    if deep_scan:
+        if window % step:
+            raise click.BadParameter(
+                "the window has to be a multiple of the step", param_hint="--window"
+            )
+        if entropy is None:
+            entropy = deep.DEFAULT_MIN_ENTROPY
+        task = tasks.DeepEntropyTask(window, step, entropy, quiet=writer is not None)
+    else:
+        if entropy is None:
+            entropy = 6
+        task = tasks.EntropyTask(entropy, quiet=writer is not None)
     if os.path.isdir(file):
-        for root, _, files in os.walk(file):
-            for file in files:
-                path = os.path.join(root, file)
-                parser_cls = ParserFactory.get_parser_for_file(path)
-                if parser_cls is None:
-                    logging.info(f"Skipping {file} as no parser have been found")
-                    continue
-                parser = parser_cls()
-
-                parser.parse(path)
-
-                d = parser.analyze_entropy(entropy).items()
-                if len(d) == 0:
-                    continue
-
-                print(f"{file}:")
-                for k, v in d:
-                    print(f"{k}: {v}")
-                print()
+        # the findings are not metadata values, the cache is left alone
+        metadata_cache = None if deep_scan else open_cache(use_cache, cache_file)
+        run_tree(
+            task,
+            file,
+            jobs,
+            metadata_cache,
+            writer,
+            open_profiler(profile, profile_slowest, profile_stats),
+            filters=filters,
+        )
+    elif writer is not None:
+        run_file(task, file, writer)
+    elif deep_scan:
+        run_paths(task, [file], 1)
     else:
-        parser_cls = ParserFactory.get_parser_for_file(file)
-        if parser_cls is None:
+        parser = ParserFactory.create_parser_for_file(file)
+        if parser is None:
             raise Exception("Cannot find parser for file")
 
-        parser = parser_cls()
         parser.parse(file)
         for k, v in parser.analyze_entropy(entropy).items():
             print(f"{k}: {v}")
+    if writer is not None:
+        writer.close()
+
+
+@cli.command("find")
+@click.option(
+    "-f",
+    "--file",
+    type=click.Path(exists=True, dir_okay=True, resolve_path=True),
+    help="path to the file/directory to search",
+    required=True,
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="print info messages",
+)
+@click.option(
+    "-d",
+    "--debug",
+    is_flag=True,
+    default=False,
+    help="print debug messages",
+)
+@jobs_option
+@cache_option
+@cache_file_option
+@click.option(
+    "--limit",
+    type=click.IntRange(min=1),
+    default=None,
+    help="stop after this many matching files",
+)
+@click.option(
+    "-0",
+    "--print0",
+    is_flag=True,
+    default=False,
+    help="end the paths with a NUL instead of a newline, for xargs -0",
+)
+@click.option(
+    "--sniff-all",
+    is_flag=True,
+    default=False,
+    help="sniff every file, instead of skipping the ones whose extension names a"
+    " format that cannot hold the fields",
+)
+@click.argument("predicates", nargs=-1, required=True)
+@walk_filters
+def find(
+    file,
+    verbose,
+    debug,
+    jobs,
+    use_cache,
+    cache_file,
+    limit,
+    print0,
+    sniff_all,
+    predicates,
+    filters,
+):
+    """print the paths of the files matching all the PREDICATES
+
+    A predicate is FIELD=REGEX, "FIELD exists" or "entropy(FIELD)>X", see
+    metaparser.query. Formats that cannot hold the fields are not parsed, and
+    files whose extension names such a format are not even opened, so a file
+    with a misleading extension is only found with --sniff-all.
+    """
+    if verbose:
+        logging.getLogger().setLevel("INFO")
+    if debug:
+        logging.getLogger().setLevel("DEBUG")
+
+    try:
+        parsed = [query.parse(p) for p in predicates]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="PREDICATES")
+
+    task = tasks.FindTask(parsed, sniff_all, "\0" if print0 else "\n")
+    paths = walker.walk(file, filters) if os.path.isdir(file) else [file]
+    run_paths(task, paths, jobs, open_cache(use_cache, cache_file), limit=limit)
+
+
+@cli.command("stats")
+@click.option(
+    "-f",
+    "--file",
+    type=click.Path(exists=True, dir_okay=True, resolve_path=True),
+    help="path to the file/directory to summarize",
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="print info messages",
+)
+@click.option(
+    "-d",
+    "--debug",
+    is_flag=True,
+    default=False,
+    help="print debug messages",
+)
+@jobs_option
+@cache_option
+@cache_file_option
+@click.option(
+    "--top",
+    type=click.IntRange(min=0),
+    default=5,
+    show_default=True,
+    help="number of most frequent values printed per field",
+)
+@click.option(
+    "--save",
+    "save_file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="save the statistics to this file, to merge them with other runs",
+)
+@click.option(
+    "--merge",
+    "merge_files",
+    type=click.Path(exists=True, dir_okay=False),
+    multiple=True,
+    help="merge statistics saved by other runs, can be given several times",
+)
+@walk_filters
+def print_stats(
+    file,
+    verbose,
+    debug,
+    jobs,
+    use_cache,
+    cache_file,
+    top,
+    save_file,
+    merge_files,
+    filters,
+):
+    """count the fields, their distinct and most frequent values per MIME type
+
+    Distinct counts are estimates, counts of frequent values may be printed as
+    a range of what they can be.
+    """
+    if verbose:
+        logging.getLogger().setLevel("INFO")
+    if debug:
+        logging.getLogger().setLevel("DEBUG")
+    if file is None and not merge_files:
+        raise click.UsageError("give a --file to summarize or statistics to --merge")
+
+    statistics = stats.Statistics()
+    for merge_file in merge_files:
+        try:
+            statistics.merge(stats.Statistics.load(merge_file))
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--merge")
+
+    if file is not None:
+        paths = walker.walk(file, filters) if os.path.isdir(file) else [file]
+        metadata_cache = open_cache(use_cache, cache_file)
+        for result in engine.run(tasks.ReadTask(), paths, jobs, metadata_cache):
+            if result.error is not None:
+                logging.error(f"Failed to process {result.path}: {result.error}")
+                logging.debug(result.traceback)
+            statistics.add(result)
+        if metadata_cache is not None:
+            metadata_cache.close()
+
+    if save_file is not None:
+        statistics.save(save_file)
+    for line in statistics.report(top):
+        print(line)
+
+
+@cli.group("cache")
+def cache_group():
+    """inspect and prune the metadata cache"""
+    pass
+
+
+@cache_group.command("stats")
+@cache_file_option
+def cache_stats(cache_file):
+    """print the size of the cache"""
+    if not os.path.exists(cache_file):
+        print(f"No cache at {cache_file}")
+        return
+
+    with cache.MetadataCache(cache_file) as metadata_cache:
+        for k, v in metadata_cache.stats().items():
+            print(f"{k}: {v}")
+
+
+@cache_group.command("prune")
+@cache_file_option
+@click.option(
+    "--max-size",
+    type=click.IntRange(min=0),
+    default=cache.DEFAULT_MAX_SIZE // (1024 * 1024),
+    show_default=True,
+    help="size of the stored metadata in MiB to evict down to",
+)
+def cache_prune(cache_file, max_size):
+    """remove entries of changed or deleted files and evict old ones"""
+    if not os.path.exists(cache_file):
+        print(f"No cache at {cache_file}")
+        return
+
+    with cache.MetadataCache(cache_file, max_size * 1024 * 1024) as metadata_cache:
+        stale, evicted = metadata_cache.prune()
+    print(f"Removed {stale} stale and {evicted} evicted entries")
+
+
+@cli.command("serve")
+@click.option(
+    "-s",
+    "--socket",
+    type=click.Path(dir_okay=False),
+    default=client.default_socket(),
+    show_default=True,
+    help="path of the Unix domain socket to listen on",
+)
+@click.option(
+    "-v",
+    "--verbose",
+    is_flag=True,
+    default=False,
+    help="print info messages",
+)
+@click.option(
+    "-d",
+    "--debug",
+    is_flag=True,
+    default=False,
+    help="print debug messages",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="number of worker processes handling requests, 0 uses all CPUs",
+)
+def serve(socket, verbose, debug, jobs):
+    """serve detect, print, set, delete and clear requests from other processes"""
+    if verbose:
+        logging.getLogger().setLevel("INFO")
+    if debug:
+        logging.getLogger().setLevel("DEBUG")
+
+    # asyncio is only imported by the server, it would slow down every command
+    from metaparser.server import Server
+
+    try:
+        Server(socket, jobs).serve()
+    except FileExistsError as e:
+        raise click.ClickException(str(e))
 
 
 def entry_point():
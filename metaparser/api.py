@@ -0,0 +1,225 @@
+"""Python API, for reading and editing metadata without going through the CLI
+
+Files are processed by the same engine as the commands, with the same worker
+processes, cache and atomic writes. Nothing is printed, every file is reported as
+a Record holding what the task would have printed.
+
+With jobs=1 the files are processed in the calling process, and the engine
+captures that output by redirecting sys.stdout while it processes a file. The
+redirection is process wide, output of other threads meanwhile ends up in the
+record too. Runs with several jobs only redirect in the worker processes, and
+open_file never redirects.
+
+    import metaparser
+
+    for record in metaparser.scan(["photos", "report.pdf"], jobs=4):
+        print(record.path, record.fields)
+
+    with metaparser.open("song.mp3") as file:
+        file.set("title", "New title")
+"""
+import contextlib
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from . import engine, tasks, utils, walker
+from .cache import MetadataCache
+from .manifest import Operation
+from .modules.auto import ParserFactory
+from .modules.base import BaseParser
+
+# a path or several, directories are walked
+Paths = Union[str, Iterable[str]]
+
+
+class UnsupportedFileError(ValueError):
+    pass
+
+
+class Record:
+    """What was read from or done to a file"""
+
+    __slots__ = ("path", "mime", "parser", "fields", "error", "modified", "output")
+
+    def __init__(
+        self,
+        path: str,
+        mime: Optional[str] = None,
+        parser: Optional[str] = None,
+        fields: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        modified: bool = False,
+        output: str = "",
+    ) -> None:
+        self.path = path
+        self.mime = mime
+        # class name of the parser, None if no parser supports the file
+        self.parser = parser
+        # values encoded with utils.encode_values, None if they were not read
+        self.fields = fields
+        self.error = error
+        # the file was written
+        self.modified = modified
+        # what the task printed, eg. the Updating line of an edit
+        self.output = output
+
+    @staticmethod
+    def from_result(result: engine.FileResult) -> "Record":
+        return Record(
+            result.path,
+            result.mime,
+            result.parser,
+            result.values,
+            result.error,
+            result.modified,
+            result.output,
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"Record(path={self.path!r}, mime={self.mime!r}, parser={self.parser!r}, "
+            f"fields={self.fields!r}, error={self.error!r}, modified={self.modified!r}, "
+            f"output={self.output!r})"
+        )
+
+
+def _expand(paths: Paths, filters: Optional[walker.Filters] = None) -> Iterator[str]:
+    """Yield the given files and the files under the given directories"""
+    for path in [paths] if isinstance(paths, str) else paths:
+        if os.path.isdir(path):
+            yield from walker.walk(path, filters)
+        else:
+            yield path
+
+
+def _run(
+    task: engine.Task,
+    paths: Iterable[str],
+    jobs: int = 1,
+    cache: Optional[MetadataCache] = None,
+) -> Iterator[Record]:
+    for result in engine.run(task, paths, jobs, cache):
+        yield Record.from_result(result)
+
+
+def scan(
+    paths: Paths,
+    jobs: int = 1,
+    filters: Optional[walker.Filters] = None,
+    cache: Optional[MetadataCache] = None,
+) -> Iterator[Record]:
+    """Read the metadata of the files, yielding their records in order"""
+    return _run(tasks.ReadTask(), _expand(paths, filters), jobs, cache)
+
+
+# the edits below are made before they return, the writes of a chunk of files are
+# made durable together
+
+
+def set_field(
+    paths: Paths,
+    field: str,
+    value: Any,
+    jobs: int = 1,
+    filters: Optional[walker.Filters] = None,
+    options: Optional[Dict[str, Any]] = None,
+) -> List[Record]:
+    """Set the field of the files, returns their records in order"""
+    task = tasks.SetTask(field, value, options)
+    return list(_run(task, _expand(paths, filters), jobs))
+
+
+def delete_field(
+    paths: Paths,
+    field: str,
+    jobs: int = 1,
+    filters: Optional[walker.Filters] = None,
+    options: Optional[Dict[str, Any]] = None,
+) -> List[Record]:
+    """Delete the field of the files, returns their records in order"""
+    task = tasks.DeleteTask(field, options)
+    return list(_run(task, _expand(paths, filters), jobs))
+
+
+def clear(
+    paths: Paths,
+    jobs: int = 1,
+    filters: Optional[walker.Filters] = None,
+    options: Optional[Dict[str, Any]] = None,
+) -> List[Record]:
+    """Delete every field of the files, returns their records in order"""
+    return list(_run(tasks.ClearTask(options), _expand(paths, filters), jobs))
+
+
+def apply(
+    operations: Dict[str, List[Operation]],
+    jobs: int = 1,
+    options: Optional[Dict[str, Any]] = None,
+) -> List[Record]:
+    """Apply the operations of every file, see manifest.read, returns their records"""
+    return list(_run(tasks.ApplyTask(operations, options), operations, jobs))
+
+
+class File:
+    """A parsed file, returned by open_file
+
+    Parsers only print when asked to, so its calls run without capturing stdout.
+    """
+
+    def __init__(self, path: str, parser: BaseParser) -> None:
+        self.path = path
+        self.__parser = parser
+
+    @property
+    def mime(self) -> Optional[str]:
+        return self.__parser.mime
+
+    @property
+    def parser(self) -> str:
+        return type(self.__parser).__name__
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        """The current values, encoded with utils.encode_values"""
+        return utils.encode_values(self.__parser.get_all_values())
+
+    def field_names(self) -> List[str]:
+        return self.__parser.get_fields()
+
+    def set(self, field: str, value: Any) -> None:
+        self.__parser.set_field(field, value)
+
+    def delete(self, field: str) -> None:
+        self.__parser.delete_field(field)
+
+    def clear(self) -> None:
+        self.__parser.clear()
+
+    def save(self) -> bool:
+        """Write the file if any value changed, returns False if nothing was"""
+        return self.__parser.write()
+
+    def record(self) -> Record:
+        return Record(
+            self.path, self.mime, self.parser, self.fields, None, self.__parser.written
+        )
+
+
+@contextlib.contextmanager
+def open_file(path: str, options: Optional[Dict[str, Any]] = None) -> Iterator[File]:
+    """Parse a file, the changes are saved when the block exits without an error
+
+    Raises UnsupportedFileError if no parser supports the file.
+    """
+    parser = ParserFactory.create_parser_for_file(path, options)
+    if parser is None:
+        raise UnsupportedFileError(f"No parser supports {path}")
+    parser.parse(path)
+
+    file = File(path, parser)
+    yield file
+    file.save()
+
+
+# named like the builtin it mirrors, metaparser.open
+open = open_file
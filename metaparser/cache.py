@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# entries are evicted, least recently used first, once the stored metadata grows
+# past this many bytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+# bumped whenever the table layout, the value encoding or the values read by a
+# parser change, older caches are dropped
+SCHEMA_VERSION = 4
+# stored entries are committed in batches of this size
+COMMIT_INTERVAL = 1000
+# entries checked at once by prune, bounds its memory on large caches
+PRUNE_PAGE_SIZE = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    mime TEXT NOT NULL,
+    -- JSON object of encoded values, NULL if no parser supports the file
+    fields TEXT,
+    bytes INTEGER NOT NULL,
+    used REAL NOT NULL,
+    PRIMARY KEY (dev, ino)
+);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+"""
+
+
+def default_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "metaparser", "metadata.sqlite")
+
+
+class CacheEntry:
+    def __init__(self, mime: str, values: Optional[Dict[str, Any]]) -> None:
+        self.mime = mime
+        # None when no parser supported the file
+        self.values = values
+
+
+class MetadataCache:
+    """Detected MIME types and metadata values of files, kept in a SQLite database
+
+    Entries are keyed by device and inode, and are only valid while the size,
+    modification and change times of the file match the ones stored with them.
+    The change time catches files that were patched in place with their
+    modification time restored.
+    """
+
+    def __init__(self, path: str, max_size: int = DEFAULT_MAX_SIZE) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # keys of the entries that were hit, their use time is updated on close
+        self.__used: List[Tuple[int, int]] = []
+        self.__uncommitted = 0
+
+        # imported here, runs without --cache do not pay for it
+        import sqlite3
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.__db = sqlite3.connect(path)
+        self.__db.execute("PRAGMA journal_mode=WAL")
+        self.__db.execute("PRAGMA synchronous=NORMAL")
+        (version,) = self.__db.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            logging.debug(f"Recreating cache {path} with schema {SCHEMA_VERSION}")
+            self.__db.execute("DROP TABLE IF EXISTS files")
+            self.__db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self.__db.executescript(SCHEMA)
+        self.__db.commit()
+
+    def __enter__(self) -> "MetadataCache":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def lookup(self, st: os.stat_result) -> Optional[CacheEntry]:
+        row = self.__db.execute(
+            "SELECT size, mtime_ns, ctime_ns, mime, fields FROM files"
+            " WHERE dev=? AND ino=?",
+            (st.st_dev, st.st_ino),
+        ).fetchone()
+        if row is None or row[:3] != (st.st_size, st.st_mtime_ns, st.st_ctime_ns):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__used.append((st.st_dev, st.st_ino))
+        values = None if row[4] is None else json.loads(row[4])
+        return CacheEntry(row[3], values)
+
+    def store(
+        self,
+        path: str,
+        st: os.stat_result,
+        mime: str,
+        values: Optional[Dict[str, Any]],
+    ) -> None:
+        """Store the MIME type and encoded values the file had when it was stat'ed"""
+        fields = None if values is None else json.dumps(values, ensure_ascii=False)
+        size = len(path) + len(mime) + len(fields or "")
+        self.__db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                st.st_dev,
+                st.st_ino,
+                st.st_size,
+                st.st_mtime_ns,
+                st.st_ctime_ns,
+                path,
+                mime,
+                fields,
+                size,
+                time.time(),
+            ),
+        )
+        self.__uncommitted += 1
+        if self.__uncommitted >= COMMIT_INTERVAL:
+            self.commit()
+
+    def invalidate(self, path: str) -> None:
+        """Drop the entry of a file, called after the file has been written"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        if st is not None:
+            self.__db.execute(
+                "DELETE FROM files WHERE dev=? AND ino=?", (st.st_dev, st.st_ino)
+            )
+        # the file may have been replaced by a new inode
+        self.__db.execute("DELETE FROM files WHERE path=?", (path,))
+        self.__uncommitted += 1
+
+    def stats(self) -> Dict[str, int]:
+        entries, size = self.__db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM files"
+        ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "file_bytes": os.path.getsize(self.path),
+        }
+
+    def prune(self) -> Tuple[int, int]:
+        """Remove entries of missing or changed files, then evict down to max_size
+
+        Returns the number of stale and evicted entries.
+        """
+        stale = 0
+        # the entries are walked a page at a time in key order, the stale ones
+        # of a page are deleted before the next one is read
+        last = (-1, -1)
+        while True:
+            rows = self.__db.execute(
+                "SELECT dev, ino, size, mtime_ns, ctime_ns, path FROM files"
+                " WHERE dev > ? OR (dev = ? AND ino > ?)"
+                " ORDER BY dev, ino LIMIT ?",
+                (last[0], last[0], last[1], PRUNE_PAGE_SIZE),
+            ).fetchall()
+            if not rows:
+                break
+            keys = []
+            for dev, ino, size, mtime_ns, ctime_ns, path in rows:
+                try:
+                    st = os.stat(path)
+                    current: Optional[Tuple[int, ...]] = (
+                        st.st_dev,
+                        st.st_ino,
+                        st.st_size,
+                        st.st_mtime_ns,
+                        st.st_ctime_ns,
+                    )
+                except OSError:
+                    current = None
+                if current != (dev, ino, size, mtime_ns, ctime_ns):
+                    keys.append((dev, ino))
+            self.__db.executemany("DELETE FROM files WHERE dev=? AND ino=?", keys)
+            stale += len(keys)
+            last = rows[-1][:2]
+        evicted = self.evict()
+        self.__db.commit()
+        self.__db.execute("VACUUM")
+        return stale, evicted
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until they fit in max_size"""
+        (size,) = self.__db.execute(
+            "SELECT COALESCE(SUM(bytes), 0) FROM files"
+        ).fetchone()
+        if size <= self.max_size:
+            return 0
+
+        # find the last entry to evict while streaming the rows, then delete it
+        # and every entry before it in a single statement
+        evicted = 0
+        last = None
+        rows = self.__db.execute(
+            "SELECT used, dev, ino, bytes FROM files ORDER BY used, dev, ino"
+        )
+        for used, dev, ino, entry_size in rows:
+            if size <= self.max_size:
+                break
+            last = (used, dev, ino)
+            size -= entry_size
+            evicted += 1
+        rows.close()
+        if last is not None:
+            used, dev, ino = last
+            self.__db.execute(
+                "DELETE FROM files WHERE used < ?"
+                " OR (used = ? AND (dev < ? OR (dev = ? AND ino <= ?)))",
+                (used, used, dev, dev, ino),
+            )
+        logging.debug(f"Evicted {evicted} cache entries")
+        return evicted
+
+    def commit(self) -> None:
+        if self.__used:
+            now = time.time()
+            self.__db.executemany(
+                "UPDATE files SET used=? WHERE dev=? AND ino=?",
+                [(now, dev, ino) for dev, ino in self.__used],
+            )
+            self.__used.clear()
+        self.__db.commit()
+        self.__uncommitted = 0
+
+    def close(self) -> None:
+        self.evict()
+        self.commit()
+        self.__db.close()
@@ -0,0 +1,53 @@
+"""Thin client of the metaparser server
+
+Requests and responses are JSON objects, one per line, sent over a Unix domain
+socket. This module only depends on the standard library, so sending a request
+does not import any of the format libraries.
+"""
+import json
+import os
+import socket
+from typing import Any, Dict
+
+COMMAND_DETECT = "detect"
+COMMAND_PRINT = "print"
+COMMAND_SET = "set"
+COMMAND_DELETE = "delete"
+COMMAND_CLEAR = "clear"
+COMMANDS = [COMMAND_DETECT, COMMAND_PRINT, COMMAND_SET, COMMAND_DELETE, COMMAND_CLEAR]
+
+# environment variable holding the socket of a running server, used by the CLI
+SOCKET_ENV = "METAPARSER_SERVER"
+# a single response holds the metadata of one file, images included
+MAX_LINE = 64 * 1024 * 1024
+
+
+def default_socket() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "metaparser.sock")
+    return os.path.join("/tmp", f"metaparser-{os.getuid()}.sock")
+
+
+class ServerError(Exception):
+    pass
+
+
+def request(path: str, message: Dict[str, Any]) -> Dict[str, Any]:
+    """Send a request to the server listening on path and return its record
+
+    Raises ServerError when the server rejects the request, failures to process
+    the file are reported in the "error" key of the record instead.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall(json.dumps(message).encode("utf-8") + b"\n")
+        with s.makefile("rb") as f:
+            line = f.readline(MAX_LINE)
+
+    if not line:
+        raise ServerError("connection closed by the server")
+    response = json.loads(line)
+    if "record" not in response:
+        raise ServerError(response.get("error"))
+    return response["record"]
@@ -0,0 +1,173 @@
+"""Sliding-window byte entropy of the regions of a file, for entropy --deep
+
+The file is memory-mapped and every region the parser reports, see
+BaseParser.regions, is cut into windows starting every step bytes. With numpy,
+the byte histogram of every step-sized block is counted in one pass over a chunk
+of the region and the histograms of a window are summed from them, so each byte
+is only read once whatever the overlap of the windows. Windows with an entropy
+above the threshold are merged into findings when they overlap or touch.
+"""
+import collections
+import itertools
+import math
+import mmap
+from typing import Any, Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+import metaparser.utils as utils
+
+from .modules.base import Region
+
+# bytes of a window and between the starts of two windows, the window has to be a
+# multiple of the step
+DEFAULT_WINDOW = 4096
+DEFAULT_STEP = 1024
+# in bits per byte, at most 8, compressed and encrypted data is close to it
+DEFAULT_MIN_ENTROPY = 7.5
+# bytes of a region counted at once, small enough for the counts to stay in the
+# CPU caches
+CHUNK_SIZE = 256 * 1024
+
+
+class Finding(NamedTuple):
+    # name of the region
+    region: str
+    # file offset of the first window and bytes up to the end of the last one
+    offset: int
+    length: int
+    # highest entropy of the windows, in bits per byte
+    entropy: float
+
+
+def scan(
+    path: str,
+    regions: Sequence[Region],
+    window: int = DEFAULT_WINDOW,
+    step: int = DEFAULT_STEP,
+    min_entropy: float = DEFAULT_MIN_ENTROPY,
+) -> List[Finding]:
+    """Return the runs of windows of the regions with an entropy above min_entropy"""
+    if step < 1 or window < step or window % step:
+        raise ValueError("the window has to be a positive multiple of the step")
+
+    findings: List[Finding] = []
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size == 0:
+            return findings
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for region in regions:
+                # regions are clamped to the file, truncated files claim more bytes
+                start = min(max(region.offset, 0), size)
+                end = min(start + max(region.length, 0), size)
+                windows = _windows(data, start, end, window, step, min_entropy)
+                findings.extend(_merge(region.name, windows))
+    return findings
+
+
+def _windows(
+    data: mmap.mmap, start: int, end: int, window: int, step: int, min_entropy: float
+) -> Iterator[Tuple[int, int, float]]:
+    """Yield the offset, length and entropy of the windows above min_entropy
+
+    Regions shorter than a window are a single window, the last one ends with
+    the region even if it does not start on a step.
+    """
+    length = end - start
+    if length <= 0:
+        return
+    windows: Iterable[Tuple[int, int, float]]
+    if length <= window:
+        windows = [(start, length, _entropy(data[start:end]))]
+    else:
+        last = start + (length - window) // step * step
+        windows = _full_windows(data, start, last, window, step, min_entropy)
+        if last + window < end:
+            tail = end - window
+            windows = itertools.chain(
+                windows, [(tail, window, _entropy(data[tail:end]))]
+            )
+    for offset, size, entropy in windows:
+        if entropy > min_entropy:
+            yield offset, size, entropy
+
+
+def _full_windows(
+    data: mmap.mmap, start: int, last: int, window: int, step: int, min_entropy: float
+) -> Iterator[Tuple[int, int, float]]:
+    """Yield the windows starting every step from start to last above min_entropy"""
+    numpy = utils._numpy()
+    if numpy is None:
+        for offset in range(start, last + 1, step):
+            entropy = _entropy(data[offset : offset + window])
+            if entropy > min_entropy:
+                yield offset, window, entropy
+        return
+
+    blocks_per_window = window // step
+    blocks_per_chunk = max(CHUNK_SIZE // step, blocks_per_window)
+    # c * log2(c) of every count a byte can have in a window
+    counts = numpy.arange(window + 1, dtype=numpy.float64)
+    plogp = (counts * numpy.log2(numpy.maximum(counts, 1))).astype(numpy.float32)
+    total_blocks = (last - start) // step + blocks_per_window
+
+    # histograms of the last blocks of the previous chunk, their windows overlap
+    # the next chunk
+    carry = numpy.zeros((0, 256), dtype=numpy.int32)
+    first = 0
+    while first < total_blocks:
+        count = min(blocks_per_chunk, total_blocks - first)
+        histograms = _histograms(numpy, data, start + first * step, count, step)
+        histograms = numpy.concatenate([carry, histograms])
+        # the histogram of a window is the sum of the ones of its blocks
+        windows = histograms[: len(histograms) - blocks_per_window + 1].copy()
+        for shift in range(1, blocks_per_window):
+            windows += histograms[
+                shift : len(histograms) - blocks_per_window + 1 + shift
+            ]
+        plogp_sums = plogp.take(windows).sum(axis=1, dtype=numpy.float64)
+        entropies = math.log2(window) - plogp_sums / window
+        # only the windows above the threshold are handed to Python
+        (indices,) = numpy.nonzero(entropies > min_entropy)
+        # the first window starts with the first carried block
+        first_block = first - len(carry)
+        for index, entropy in zip(indices.tolist(), entropies[indices].tolist()):
+            yield start + (first_block + index) * step, window, entropy
+        carry = histograms[len(histograms) - (blocks_per_window - 1) :]
+        first += count
+
+
+def _histograms(numpy: Any, data: mmap.mmap, offset: int, count: int, step: int) -> Any:
+    """Count the bytes of count consecutive blocks of step bytes each"""
+    values = numpy.frombuffer(
+        data, dtype=numpy.uint8, count=count * step, offset=offset
+    )
+    # shift every block to its own 256 bins, so a single bincount counts them all
+    bins = values.reshape(count, step) + (
+        numpy.arange(count, dtype=numpy.int64) * 256
+    ).reshape(count, 1)
+    del values
+    histograms = numpy.bincount(bins.ravel(), minlength=count * 256)
+    return histograms.astype(numpy.int32).reshape(count, 256)
+
+
+def _entropy(chunk: bytes) -> float:
+    length = len(chunk)
+    counts = collections.Counter(chunk).values()
+    return -sum(c / length * math.log2(c / length) for c in counts)
+
+
+def _merge(name: str, windows: Iterator[Tuple[int, int, float]]) -> Iterator[Finding]:
+    """Merge the overlapping or touching windows into findings"""
+    current = None
+    for offset, length, entropy in windows:
+        if current is not None and offset <= current.offset + current.length:
+            end = max(current.offset + current.length, offset + length)
+            current = current._replace(
+                length=end - current.offset, entropy=max(current.entropy, entropy)
+            )
+            continue
+        if current is not None:
+            yield current
+        current = Finding(name, offset, length, entropy)
+    if current is not None:
+        yield current
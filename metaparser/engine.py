@@ -0,0 +1,411 @@
+import contextlib
+import io
+import logging
+import os
+import time
+import traceback
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import Generator
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Type, Union
+
+from . import profiling, utils
+from .cache import CacheEntry, MetadataCache
+from .modules import atomic
+from .modules.auto import ParserFactory
+from .modules.base import BaseParser
+
+# number of files handed to a worker process at once
+CHUNK_SIZE = 16
+# number of chunks queued per worker, bounds memory on huge trees
+QUEUE_DEPTH = 4
+
+
+class FileResult:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.output = ""
+        self.skipped = False
+        self.error: Optional[str] = None
+        self.traceback: Optional[str] = None
+        self.mime: Optional[str] = None
+        # class name of the parser
+        self.parser: Optional[str] = None
+        # values encoded with utils.encode_values, only set by cacheable tasks
+        self.values: Optional[Dict[str, Any]] = None
+        self.cached = False
+        # the task wrote the file
+        self.modified = False
+        # the file was patched in place instead of being replaced
+        self.in_place = False
+        # seconds spent on each step, eg. {"detect": 0.001, "parse": 0.02}
+        self.timings: Dict[str, float] = {}
+        # seconds spent in each profiling stage and bytes read and written, only
+        # set for files processed with profiling on
+        self.profile: Optional[Dict[str, float]] = None
+
+
+# a path still to be processed or the result of a file processed from the cache
+Item = Union[str, FileResult]
+
+
+class Task(ABC):
+    """Work done for every file of a run, instances are sent to the worker processes"""
+
+    # the output only depends on the metadata values, so files that did not change
+    # can be processed from the cache with process_values
+    cacheable = False
+    # the task writes files, their cache entries are dropped
+    modifies = False
+    # number of results handed to finish at once
+    batch_size = 1
+    # the task reads the encoded values of its results itself, eg. in finish, so
+    # cacheable tasks encode them even when there is no cache to store them in
+    needs_values = False
+
+    def __init__(
+        self, options: Optional[Dict[str, Any]] = None, quiet: bool = False
+    ) -> None:
+        # passed on to the parsers, see BaseParser.options
+        self.options = options or {}
+        # only fill in the results and leave the output to the caller, used for
+        # structured output formats
+        self.quiet = quiet
+        # set by run when the values of the results are stored in a cache
+        self.cache_values = False
+
+    def run(self, path: str, result: FileResult) -> None:
+        """Process a single file, the result is marked skipped when no parser supports it"""
+        parser = self.open(path, result)
+        if parser is None:
+            return
+
+        # encoding copies every value, eg. base64 of the pictures, and the workers
+        # send them back, so it is skipped when nothing reads them
+        if self.cacheable and (self.quiet or self.needs_values or self.cache_values):
+            self.read_values(parser, result)
+        if not self.quiet:
+            self.process(parser, path)
+        result.modified = parser.written
+        result.in_place = parser.written_in_place
+
+    def read_values(self, parser: BaseParser, result: FileResult) -> None:
+        """Store the values of the parsed file in the result, encoded for the cache"""
+        start = time.perf_counter()
+        result.values = utils.encode_values(parser.get_all_values())
+        result.timings["parse"] += time.perf_counter() - start
+
+    def open(self, path: str, result: FileResult) -> Optional[BaseParser]:
+        """Detect and parse a file, None when it is skipped"""
+        start = time.perf_counter()
+        detection = ParserFactory.detect(path)
+        parser = ParserFactory.create_parser(detection, self.options)
+        result.timings["detect"] = time.perf_counter() - start
+        if parser is not None and not self.accepts(type(parser)):
+            # no MIME type, so the cache does not take the file for an unsupported one
+            result.skipped = True
+            return None
+
+        result.mime = detection.mime
+        if parser is None:
+            result.skipped = True
+            return None
+
+        start = time.perf_counter()
+        result.parser = type(parser).__name__
+        parser.parse(path)
+        result.timings["parse"] = time.perf_counter() - start
+        return parser
+
+    def accepts(self, parser: Type[BaseParser]) -> bool:
+        """Check if files of the parser are processed, the others are skipped unparsed"""
+        return True
+
+    @abstractmethod
+    def process(self, parser: BaseParser, path: str) -> None:
+        pass
+
+    def process_values(
+        self, path: str, values: Dict[str, Any], parser: Type[BaseParser]
+    ) -> None:
+        """Process a file from its cached, encoded values, only for cacheable tasks
+
+        parser is the class that read the values, see BaseParser.decode_values.
+        """
+        raise TypeError(f"{type(self).__name__} is not cacheable")
+
+    def finish(self, results: List[FileResult]) -> None:
+        """Complete a batch of results in the main process, before they are yielded"""
+        pass
+
+
+def process_file(task: Task, path: str, profiled: bool = False) -> FileResult:
+    """Run the task on a single file, capturing its output and any failure"""
+    result = FileResult(path)
+    if profiled:
+        result.profile = {}
+    start = time.perf_counter()
+    with _capture(result), profiling.record(result.profile):
+        task.run(path, result)
+    result.timings["total"] = time.perf_counter() - start
+    return result
+
+
+def process_cached(task: Task, path: str, entry: CacheEntry) -> FileResult:
+    """Run the task on the cached values of a file"""
+    result = FileResult(path)
+    result.mime = entry.mime
+    result.values = entry.values
+    result.cached = True
+    if entry.values is None:
+        result.skipped = True
+        return result
+
+    parser = ParserFactory.get_parser(entry.mime)
+    if parser is None:
+        # the parser that read the values is not available anymore
+        result.skipped = True
+        return result
+
+    result.parser = parser.__name__
+    if not task.quiet:
+        with _capture(result):
+            task.process_values(path, entry.values, parser)
+    return result
+
+
+@contextlib.contextmanager
+def _capture(result: FileResult) -> Iterator[None]:
+    """Store the output and any exception of the block in the result"""
+    buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            yield
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+        result.traceback = traceback.format_exc()
+    result.output = buffer.getvalue()
+
+
+# task of a worker process, it is sent once when the worker starts instead of with
+# every chunk, so tasks may carry large data like a manifest
+_worker_task: Optional[Task] = None
+_worker_profiled = False
+
+
+def _init_worker(task: Task, profiled: bool, stats_directory: Optional[str]) -> None:
+    global _worker_task, _worker_profiled
+    _worker_task = task
+    _worker_profiled = profiled
+    profiling.start_worker(stats_directory)
+
+
+def _process_chunk(paths: List[str]) -> List[FileResult]:
+    assert _worker_task is not None
+    with profiling.profile_chunk():
+        return process_files(_worker_task, paths, _worker_profiled)
+
+
+def process_files(
+    task: Task, paths: List[str], profiled: bool = False
+) -> List[FileResult]:
+    """Process files, the writes of modifying tasks are made durable together"""
+    if not task.modifies:
+        return [process_file(task, path, profiled) for path in paths]
+
+    with atomic.batch() as writes:
+        results = [process_file(task, path, profiled) for path in paths]
+        failures = writes.commit()
+    for result in results:
+        error = failures.get(result.path)
+        if error is not None:
+            result.error = f"{type(error).__name__}: {error}"
+            result.modified = False
+            result.in_place = False
+    return results
+
+
+def _chunks(items: Iterable[Item], size: int) -> Iterator[List[Item]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _lookup(
+    task: Task,
+    paths: Iterable[str],
+    cache: MetadataCache,
+    stats: Dict[str, os.stat_result],
+) -> Iterator[Item]:
+    """Replace the paths of unchanged files with results processed from the cache"""
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            yield path
+            continue
+
+        entry = cache.lookup(st)
+        if entry is not None and entry.values is None:
+            # a parser supporting the file may have been installed since
+            if ParserFactory.get_parser(entry.mime) is not None:
+                entry = None
+        if entry is None:
+            stats[path] = st
+            yield path
+        else:
+            yield process_cached(task, path, entry)
+
+
+def _update_cache(
+    task: Task,
+    result: FileResult,
+    cache: MetadataCache,
+    stats: Dict[str, os.stat_result],
+) -> None:
+    st = stats.pop(result.path, None)
+    if task.modifies:
+        cache.invalidate(result.path)
+    elif st is not None and result.error is None and result.mime is not None:
+        cache.store(result.path, st, result.mime, result.values)
+
+
+def run(
+    task: Task,
+    paths: Iterable[str],
+    jobs: int = 1,
+    cache: Optional[MetadataCache] = None,
+    profile: Optional[profiling.Profile] = None,
+) -> Generator[FileResult, None, None]:
+    """Run the task on every path, yielding results in the order of the paths
+
+    With more than one job the files are processed in a pool of worker processes,
+    0 uses one worker per CPU. Cacheable tasks process unchanged files from the
+    cache in the main process and store what the workers parsed. Results are
+    passed to Task.finish in batches of Task.batch_size. With a profile, the
+    results carry the profiles of their files. Closing the generator early
+    cancels the files queued for the workers.
+    """
+    if cache is None:
+        results = _run(task, paths, jobs, profile)
+    else:
+        task.cache_values = True
+        results = _cached_run(task, paths, jobs, cache, profile)
+
+    batch: List[FileResult] = []
+    for result in results:
+        batch.append(result)
+        if len(batch) >= task.batch_size:
+            task.finish(batch)
+            yield from batch
+            batch = []
+    if batch:
+        task.finish(batch)
+        yield from batch
+
+
+def _cached_run(
+    task: Task,
+    paths: Iterable[str],
+    jobs: int,
+    cache: MetadataCache,
+    profile: Optional[profiling.Profile],
+) -> Iterator[FileResult]:
+    # stat results of the files sent to the workers, taken before they were parsed
+    stats: Dict[str, os.stat_result] = {}
+    items: Iterable[Item] = paths
+    if task.cacheable:
+        items = _lookup(task, paths, cache, stats)
+    for result in _run(task, items, jobs, profile):
+        if not result.cached:
+            _update_cache(task, result, cache, stats)
+        yield result
+
+
+def _run(
+    task: Task, items: Iterable[Item], jobs: int, profile: Optional[profiling.Profile]
+) -> Iterator[FileResult]:
+    # items that already are results are passed through in order
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    profiled = profile is not None
+    if jobs == 1 and not task.modifies:
+        for item in items:
+            if isinstance(item, FileResult):
+                yield item
+            else:
+                yield process_file(task, item, profiled)
+        return
+    if jobs == 1:
+        for chunk in _chunks(items, CHUNK_SIZE):
+            paths = [item for item in chunk if isinstance(item, str)]
+            yield from _merge(chunk, process_files(task, paths, profiled))
+        return
+
+    logging.debug("Processing files with %d workers", jobs)
+    stats_directory = profile.stats_directory if profile is not None else None
+    initargs = (task, profiled, stats_directory)
+    executors = [ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=initargs)]
+    pending: deque = deque()
+    try:
+        for chunk in _chunks(items, CHUNK_SIZE):
+            paths = [item for item in chunk if isinstance(item, str)]
+            future = None
+            if paths:
+                try:
+                    future = executors[-1].submit(_process_chunk, paths)
+                except BrokenProcessPool:
+                    # a worker died and took the pool down, the chunks it still
+                    # held fail in _merge and the next ones go to a new pool
+                    executors.append(
+                        ProcessPoolExecutor(
+                            jobs, initializer=_init_worker, initargs=initargs
+                        )
+                    )
+                    future = executors[-1].submit(_process_chunk, paths)
+            pending.append((chunk, future))
+            if len(pending) >= jobs * QUEUE_DEPTH:
+                yield from _merge(*pending.popleft())
+        while pending:
+            yield from _merge(*pending.popleft())
+    finally:
+        # the caller stopped early, eg. find reached its limit, the queued
+        # chunks are dropped instead of being waited for
+        for _, future in pending:
+            if future is not None:
+                future.cancel()
+        for executor in executors:
+            executor.shutdown()
+
+
+def _merge(
+    chunk: List[Item], results: Union[Future, List[FileResult], None]
+) -> Iterator[FileResult]:
+    if isinstance(results, Future):
+        try:
+            remaining = iter(results.result())
+        except BrokenProcessPool as e:
+            # the worker processing the chunk died, eg. it was killed or crashed
+            # in a native library, its files fail like the ones raising in a task
+            remaining = iter(
+                [_failed(item, e) for item in chunk if isinstance(item, str)]
+            )
+    else:
+        remaining = iter(results or [])
+    for item in chunk:
+        yield item if isinstance(item, FileResult) else next(remaining)
+
+
+def _failed(path: str, error: BaseException) -> FileResult:
+    result = FileResult(path)
+    result.error = f"{type(error).__name__}: {error}"
+    result.traceback = "".join(
+        traceback.format_exception(type(error), error, error.__traceback__)
+    )
+    return result
@@ -0,0 +1,142 @@
+"""Append-only journal of the files a run completed, so it can be resumed
+
+Every line is a JSON array of the path, its modification and change times in
+nanoseconds, its size and the outcome. The change time advances with any write,
+even one that restores the modification time. Lines are buffered and flushed in
+batches, a crash loses at most the last batch, whose files are processed again by
+the resumed run.
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .engine import FileResult
+
+OUTCOME_MODIFIED = "modified"
+OUTCOME_UNCHANGED = "unchanged"
+OUTCOME_SKIPPED = "skipped"
+OUTCOME_FAILED = "failed"
+# outcomes of files a resumed run does not process again, failed ones are retried
+DONE_OUTCOMES = [OUTCOME_MODIFIED, OUTCOME_UNCHANGED, OUTCOME_SKIPPED]
+
+# modification time, change time and size of a file, in nanoseconds and bytes
+Version = Tuple[int, int, int]
+
+# buffered lines are written out after this many files or seconds
+FLUSH_INTERVAL = 1000
+FLUSH_SECONDS = 1.0
+
+
+def outcome(result: FileResult) -> str:
+    if result.error is not None:
+        return OUTCOME_FAILED
+    if result.skipped:
+        return OUTCOME_SKIPPED
+    return OUTCOME_MODIFIED if result.modified else OUTCOME_UNCHANGED
+
+
+class Journal:
+    """Journal of a run, an existing one is continued when resuming, else emptied"""
+
+    def __init__(self, path: str, resume: bool = False) -> None:
+        self.path = path
+        self.resuming = resume
+        # version of every file recorded as done
+        self.__done: Dict[str, Version] = {}
+        # files pending skipped as done so far
+        self.done_count = 0
+        if resume:
+            self.__done = self.__read()
+        # files the journal records as done, whether or not they were modified since
+        self.recorded = len(self.__done)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.__file = open(path, "a" if resume else "w", encoding="utf-8")
+        if self.__file.tell() > 0 and not self.__ends_with_newline():
+            # end the line cut short, so the next one starts on its own
+            self.__file.write("\n")
+        self.__buffer: List[str] = []
+        self.__flushed = time.monotonic()
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __read(self) -> Dict[str, Version]:
+        done: Dict[str, Version] = {}
+        try:
+            f = open(self.path, encoding="utf-8")
+        except FileNotFoundError:
+            return done
+
+        with f:
+            for number, line in enumerate(f, start=1):
+                try:
+                    path, mtime_ns, ctime_ns, size, result = json.loads(line)
+                except (ValueError, TypeError):
+                    # the last line is cut short if the run was killed mid-write, a
+                    # cut may also leave valid JSON that is not a journal line
+                    logging.warning(f"Ignoring broken line {number} of {self.path}")
+                    continue
+                if result in DONE_OUTCOMES:
+                    done[path] = (mtime_ns, ctime_ns, size)
+                else:
+                    # a later run failed on the file
+                    done.pop(path, None)
+        return done
+
+    def __ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def is_done(self, path: str) -> bool:
+        """Check if the file was completed and not modified since"""
+        version = self.__done.get(path)
+        return version is not None and version == self.__version(path)
+
+    def pending(self, paths: Iterable[str]) -> Iterator[str]:
+        """Yield the paths still to be processed, counting the done ones in
+        done_count as they are skipped"""
+        for path in paths:
+            if self.is_done(path):
+                self.done_count += 1
+            else:
+                yield path
+
+    @staticmethod
+    def __version(path: str) -> Optional[Version]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_ctime_ns, st.st_size
+
+    def record(self, result: FileResult) -> None:
+        version = self.__version(result.path)
+        if version is None:
+            return
+        line = [result.path, *version, outcome(result)]
+        self.__buffer.append(json.dumps(line, ensure_ascii=False) + "\n")
+        if (
+            len(self.__buffer) >= FLUSH_INTERVAL
+            or time.monotonic() - self.__flushed >= FLUSH_SECONDS
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self.__file.writelines(self.__buffer)
+        self.__file.flush()
+        self.__buffer.clear()
+        self.__flushed = time.monotonic()
+
+    def close(self) -> None:
+        if self.__file.closed:
+            return
+        self.flush()
+        os.fsync(self.__file.fileno())
+        self.__file.close()
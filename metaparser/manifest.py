@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .modules.base import BaseParser
+
+ACTION_SET = "set"
+ACTION_DELETE = "delete"
+ACTION_CLEAR = "clear"
+ACTIONS = [ACTION_SET, ACTION_DELETE, ACTION_CLEAR]
+
+FORMAT_AUTO = "auto"
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMATS = [FORMAT_AUTO, FORMAT_CSV, FORMAT_JSONL]
+
+# columns of CSV manifests, and keys of JSONL ones, value is only used by set
+COLUMN_FILE = "file"
+COLUMN_ACTION = "action"
+COLUMN_FIELD = "field"
+COLUMN_VALUE = "value"
+
+
+class ManifestError(ValueError):
+    pass
+
+
+class Operation:
+    def __init__(self, action: str, field: str = "", value: Any = None) -> None:
+        self.action = action
+        # empty for clear
+        self.field = field
+        self.value = value
+
+    def apply(self, parser: BaseParser) -> None:
+        if self.action == ACTION_SET:
+            parser.set_field(self.field, self.value)
+        elif self.action == ACTION_DELETE:
+            parser.delete_field(self.field)
+        else:
+            parser.clear()
+
+    def __str__(self) -> str:
+        return f"{self.action} {self.field}" if self.field else self.action
+
+
+def read(path: str, manifest_format: str = FORMAT_AUTO) -> Dict[str, List[Operation]]:
+    """Read a manifest, grouping the operations by file
+
+    Files are kept in the order they first appear in, and so are the operations
+    of every file. Relative paths are relative to the working directory.
+    """
+    if manifest_format == FORMAT_AUTO:
+        extension = os.path.splitext(path)[1].lower()
+        manifest_format = FORMAT_CSV if extension == ".csv" else FORMAT_JSONL
+
+    operations: Dict[str, List[Operation]] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        if manifest_format == FORMAT_CSV:
+            rows = _read_csv(f)
+        else:
+            rows = _read_jsonl(path, f)
+        for line, row in rows:
+            file, operation = _parse_row(path, line, row)
+            operations.setdefault(file, []).append(operation)
+
+    return operations
+
+
+def _read_csv(f) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _read_jsonl(path: str, f) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    for line, text in enumerate(f, start=1):
+        if not text.strip():
+            continue
+        try:
+            yield line, json.loads(text)
+        except ValueError as e:
+            raise ManifestError(f"{path}:{line}: {e}")
+
+
+def _parse_row(path: str, line: int, row: Any) -> Tuple[str, Operation]:
+    if not isinstance(row, dict):
+        raise ManifestError(f"{path}:{line}: expected an object")
+    file = row.get(COLUMN_FILE)
+    action = row.get(COLUMN_ACTION)
+    field = row.get(COLUMN_FIELD) or ""
+    if not file:
+        raise ManifestError(f"{path}:{line}: missing {COLUMN_FILE}")
+    if action not in ACTIONS:
+        raise ManifestError(f"{path}:{line}: unknown action {action}")
+    if action != ACTION_CLEAR and not field:
+        raise ManifestError(f"{path}:{line}: {action} needs a {COLUMN_FIELD}")
+
+    return os.path.abspath(file), Operation(action, field, row.get(COLUMN_VALUE))
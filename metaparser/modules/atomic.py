@@ -0,0 +1,243 @@
+"""Crash-safe writes shared by the parsers
+
+Files are either replaced, by writing a temporary file in the same directory that
+is renamed over the original, or patched in place for writes that do not move
+any data. Replacements keep the permissions, the owner and group and the extended
+attributes of the original as far as the user may set them, like cp -p, their
+modification time advances like with any other write. Files are only written when a value
+changed, so files left alone keep their timestamps.
+
+Inside a batch the descriptors of the written files are kept open until
+WriteBatch.commit, which syncs their data one by one, renames the temporary
+files and syncs every directory holding one only once.
+"""
+import contextlib
+import errno
+import os
+import secrets
+import shutil
+import stat
+from typing import BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+TEMP_PREFIX = ".metaparser-"
+
+
+class WriteBatch:
+    def __init__(self) -> None:
+        # (descriptor of the temporary file, temporary file, file it replaces)
+        self.renames: List[Tuple[int, str, str]] = []
+        # (descriptor, file) of the files patched in place
+        self.patched: List[Tuple[int, str]] = []
+
+    def commit(self) -> Dict[str, OSError]:
+        """Make the writes of the batch durable, returns the files that failed"""
+        failures: Dict[str, OSError] = {}
+        for fd, path in self.patched:
+            try:
+                _sync(fd)
+            except OSError as e:
+                failures[path] = e
+            finally:
+                os.close(fd)
+        self.patched.clear()
+
+        directories: Set[str] = set()
+        for fd, temp, path in self.renames:
+            try:
+                _sync(fd)
+                os.replace(temp, path)
+                directories.add(_directory(path))
+            except OSError as e:
+                failures[path] = e
+                _unlink(temp)
+            finally:
+                os.close(fd)
+        self.renames.clear()
+
+        for directory in directories:
+            _fsync_directory(directory)
+        return failures
+
+    def abort(self) -> None:
+        for fd, temp, _ in self.renames:
+            os.close(fd)
+            _unlink(temp)
+        for fd, _ in self.patched:
+            os.close(fd)
+        self.renames.clear()
+        self.patched.clear()
+
+
+# batch of the current process, None writes every file durably right away
+_batch: Optional[WriteBatch] = None
+
+
+@contextlib.contextmanager
+def batch() -> Iterator[WriteBatch]:
+    """Defer syncing and renaming until WriteBatch.commit
+
+    Replacements that were not committed are discarded when the block exits.
+    Every write keeps a descriptor open until then, so batches are kept small,
+    like the chunks of the engine.
+    """
+    global _batch
+    previous, _batch = _batch, WriteBatch()
+    try:
+        yield _batch
+    finally:
+        _batch.abort()
+        _batch = previous
+
+
+@contextlib.contextmanager
+def replace(path: str) -> Iterator[BinaryIO]:
+    """Write the new content of the file to a temporary file that replaces it
+
+    The file is created if it does not exist yet.
+    """
+    fd, temp = _create(path)
+    try:
+        with os.fdopen(fd, "wb", closefd=False) as f:
+            yield f
+    except BaseException:
+        os.close(fd)
+        _unlink(temp)
+        raise
+    _finish(fd, temp, path)
+
+
+@contextlib.contextmanager
+def replace_copy(path: str) -> Iterator[str]:
+    """Yield the path of a temporary copy of the file that replaces it afterwards
+
+    For libraries that only modify files given by name.
+    """
+    fd, temp = _create(path)
+    try:
+        with os.fdopen(fd, "wb", closefd=False) as target, open(path, "rb") as source:
+            shutil.copyfileobj(source, target)
+        yield temp
+    except BaseException:
+        os.close(fd)
+        _unlink(temp)
+        raise
+    # the library wrote through its own descriptor, syncing this one flushes the
+    # same file
+    _finish(fd, temp, path)
+
+
+@contextlib.contextmanager
+def patch(path: str) -> Iterator[BinaryIO]:
+    """Open the file for writing in place, for writes that do not move any data
+
+    The data before the write is never changed, so a crash can at most leave the
+    written range incomplete.
+    """
+    fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+    try:
+        with os.fdopen(fd, "r+b", closefd=False) as f:
+            yield f
+        if _batch is None:
+            _sync(fd)
+    except BaseException:
+        os.close(fd)
+        raise
+    if _batch is not None:
+        _batch.patched.append((fd, path))
+    else:
+        os.close(fd)
+
+
+def _create(path: str) -> Tuple[int, str]:
+    """Create a temporary file next to path, with the permissions, owner and
+    extended attributes of path if it exists and the ones the umask gives new
+    files otherwise"""
+    flags = os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        temp = os.path.join(_directory(path), TEMP_PREFIX + secrets.token_hex(8))
+        try:
+            fd = os.open(temp, flags, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        _copy_metadata(path, temp)
+    except FileNotFoundError:
+        pass
+    except BaseException:
+        os.close(fd)
+        _unlink(temp)
+        raise
+    return fd, temp
+
+
+def _copy_metadata(source: str, target: str) -> None:
+    st = os.stat(source)
+    if hasattr(os, "chown"):
+        # only root may give files away, others keep their own user like cp -p
+        with contextlib.suppress(PermissionError):
+            os.chown(target, st.st_uid, st.st_gid)
+    # after chown, which clears the setuid and setgid bits
+    os.chmod(target, stat.S_IMODE(st.st_mode))
+    if hasattr(os, "listxattr"):
+        _copy_xattrs(source, target)
+
+
+def _copy_xattrs(source: str, target: str) -> None:
+    try:
+        names = os.listxattr(source)
+    except OSError as e:
+        if e.errno in (errno.ENOTSUP, errno.ENODATA, errno.EINVAL):
+            return
+        raise
+    for name in names:
+        try:
+            os.setxattr(target, name, os.getxattr(source, name))
+        except OSError as e:
+            # eg. security.* attributes that only privileged users may set
+            if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.ENODATA, errno.EINVAL):
+                raise
+
+
+def _finish(fd: int, temp: str, path: str) -> None:
+    if _batch is not None:
+        _batch.renames.append((fd, temp, path))
+        return
+
+    try:
+        _sync(fd)
+        os.replace(temp, path)
+    except BaseException:
+        _unlink(temp)
+        raise
+    finally:
+        os.close(fd)
+    _fsync_directory(_directory(path))
+
+
+def _directory(path: str) -> str:
+    return os.path.dirname(os.path.abspath(path))
+
+
+def _sync(fd: int) -> None:
+    # the data and the size of the file, other metadata like times can be lost
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+def _fsync_directory(directory: str) -> None:
+    # directories cannot be opened on Windows, renames are durable there anyway
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _unlink(path: str) -> None:
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
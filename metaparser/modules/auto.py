@@ -1,30 +1,142 @@
+import importlib
+import importlib.metadata
 import logging
-from typing import Optional, Type
+from typing import Any, Dict, Iterable, List, Optional, Type, Union
 
-import magic  # type: ignore
+import metaparser.profiling as profiling
 
 from .base import BaseParser
-from .exif import ExifParser
-from .mp3 import Mp3Parser
-from .mp4 import Mp4Parser
-from .openXml import OpenXmlParser
-from .pdf import PDFParser
+from .detect import UNKNOWN_MIME, Detection, detect_mime, sniff
+from .mimes import EXIF_MIMES, MP3_MIMES, MP4_MIMES, OPENXML_MIMES, PDF_MIMES
 
-PARSERS = [ExifParser, Mp3Parser, PDFParser, Mp4Parser, OpenXmlParser]
+# entry point group external parsers register under, each entry point has to load
+# a BaseParser subclass
+PLUGIN_GROUP = "metaparser.parsers"
+
+# built-in parsers as "module:class", their modules are imported on first use
+BUILTIN_PARSERS = [
+    (f"{__package__}.exif:ExifParser", EXIF_MIMES),
+    (f"{__package__}.mp3:Mp3Parser", MP3_MIMES),
+    (f"{__package__}.pdf:PDFParser", PDF_MIMES),
+    (f"{__package__}.mp4:Mp4Parser", MP4_MIMES),
+    (f"{__package__}.openXml:OpenXmlParser", OPENXML_MIMES),
+]
+
+
+class ParserRegistry:
+    """Maps MIME types to parsers, importing a parser only once it is needed"""
+
+    def __init__(self) -> None:
+        self.__parsers: Dict[str, Union[str, Type[BaseParser]]] = {}
+        self.__plugins_loaded = False
+        self.__has_plugins = False
+
+    def register(
+        self, parser: Union[str, Type[BaseParser]], mimes: Iterable[str]
+    ) -> None:
+        """Register a parser class or its "module:class" path, first one wins"""
+        for mime in mimes:
+            self.__parsers.setdefault(mime, parser)
+
+    def get(self, mime: str) -> Optional[Type[BaseParser]]:
+        parser = self.__parsers.get(mime)
+        if parser is None and not self.__plugins_loaded:
+            self.load_plugins()
+            parser = self.__parsers.get(mime)
+        if isinstance(parser, str):
+            parser = self.__import(parser)
+
+        return parser
+
+    def parsers(self) -> List[Type[BaseParser]]:
+        """Return all registered parsers, importing every one of them"""
+        self.load_plugins()
+        result: List[Type[BaseParser]] = []
+        for mime in list(self.__parsers):
+            parser = self.get(mime)
+            if parser is not None and parser not in result:
+                result.append(parser)
+
+        return result
+
+    def has_plugins(self) -> bool:
+        self.load_plugins()
+        return self.__has_plugins
+
+    def load_plugins(self) -> None:
+        # plugins are only looked up when a MIME type is not handled by the built-in
+        # parsers, so scanning the installed distributions does not slow down startup
+        if self.__plugins_loaded:
+            return
+        self.__plugins_loaded = True
+
+        entry_points = importlib.metadata.entry_points()
+        if hasattr(entry_points, "select"):
+            group = entry_points.select(group=PLUGIN_GROUP)  # type: ignore
+        else:  # Python 3.9
+            group = entry_points.get(PLUGIN_GROUP, [])  # type: ignore
+
+        for entry_point in group:
+            try:
+                parser = entry_point.load()
+            except Exception:
+                logging.warning(
+                    f"Cannot load parser plugin {entry_point.name}", exc_info=True
+                )
+                continue
+            logging.debug("Loaded parser plugin '%s'", entry_point.name)
+            self.register(parser, parser.supported_mimes())
+            self.__has_plugins = True
+
+    def __import(self, path: str) -> Type[BaseParser]:
+        module_name, class_name = path.split(":")
+        parser = getattr(importlib.import_module(module_name), class_name)
+        logging.debug("Imported parser '%s'", path)
+        for mime, registered in self.__parsers.items():
+            if registered == path:
+                self.__parsers[mime] = parser
+
+        return parser
+
+
+REGISTRY = ParserRegistry()
+for _parser, _mimes in BUILTIN_PARSERS:
+    REGISTRY.register(_parser, _mimes)
 
 
 class ParserFactory:
+    @staticmethod
+    @profiling.timed(profiling.STAGE_SNIFF)
+    def detect(filename: str) -> Detection:
+        detection = sniff(filename, exact=False)
+        if detection.mime == UNKNOWN_MIME and REGISTRY.has_plugins():
+            # plugins may handle formats the signatures do not know about
+            detection.mime = detect_mime(filename, detection.header)
+
+        return detection
+
     @staticmethod
     def get_parser_for_file(filename: str) -> Optional[Type[BaseParser]]:
-        mime = magic.from_file(filename, mime=True)
-        logging.debug("Detected MIME type '%s' for file '%s'", mime, filename)
+        return ParserFactory.get_parser(ParserFactory.detect(filename).mime)
 
-        return ParserFactory.get_parser(mime)
+    @staticmethod
+    def create_parser_for_file(
+        filename: str, options: Optional[Dict[str, Any]] = None
+    ) -> Optional[BaseParser]:
+        return ParserFactory.create_parser(ParserFactory.detect(filename), options)
 
     @staticmethod
-    def get_parser(mime) -> Optional[Type[BaseParser]]:
-        for parser in PARSERS:
-            if mime in parser.supported_mimes():
-                return parser
+    def create_parser(
+        detection: Detection, options: Optional[Dict[str, Any]] = None
+    ) -> Optional[BaseParser]:
+        parser_cls = ParserFactory.get_parser(detection.mime)
+        if parser_cls is None:
+            return None
 
-        return None
+        parser = parser_cls(detection)
+        parser.options.update(options or {})
+        return parser
+
+    @staticmethod
+    def get_parser(mime) -> Optional[Type[BaseParser]]:
+        return REGISTRY.get(mime)
@@ -1,27 +1,136 @@
+import functools
+import mimetypes
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 
+import metaparser.profiling as profiling
 import metaparser.utils as utils
 
+from .detect import Detection
+
+
+def print_values(values: Dict[str, Any]) -> None:
+    if len(values) == 0:
+        print("No metadata found")
+        return
+
+    for k, v in values.items():
+        print(f"{k}: {v}")
+
+
+def high_entropy_values(values: Dict[str, Any], min_entropy) -> Dict[str, str]:
+    strings = {k: v for k, v in values.items() if isinstance(v, str)}
+    scores = utils.entropies(list(strings.values()))
+    return {
+        k: v for (k, v), score in zip(strings.items(), scores) if score > min_entropy
+    }
+
+
+# extensions of images whose MIME type mimetypes does not guess the usual one for
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/jpg": ".jpg"}
+# extension of images with a missing or unknown MIME type
+DEFAULT_IMAGE_EXTENSION = ".bin"
+
+
+def image_extension(mime: Optional[str]) -> str:
+    mime = (mime or "").lower()
+    return (
+        IMAGE_EXTENSIONS.get(mime)
+        or mimetypes.guess_extension(mime)
+        or DEFAULT_IMAGE_EXTENSION
+    )
+
+
+class Region(NamedTuple):
+    """Byte range of a file that may hide a payload, see BaseParser.regions"""
+
+    # what the bytes are, eg. "APIC frame" or "trailing data"
+    name: str
+    offset: int
+    length: int
+
+
+# bytes of free space reserved after tags that have to grow, so the following
+# edits of the file can be written in place, see OPTION_PADDING
+DEFAULT_PADDING = 16 * 1024
+# parser option overriding DEFAULT_PADDING
+OPTION_PADDING = "padding"
+
+# overridden by the parsers, their overrides are wrapped with mutator too
+MUTATORS = ["set_field", "delete_field", "clear"]
+
+
+def mutator(function: Callable[..., Any]) -> Callable[..., Any]:
+    """Decorate a method changing values, the values are snapshotted before the
+    first change so write can tell if any changed, and the method is timed"""
+
+    @functools.wraps(function)
+    def wrapper(self: "BaseParser", *args: Any, **kwargs: Any) -> Any:
+        self._snapshot()
+        return function(self, *args, **kwargs)
+
+    return profiling.timed(profiling.STAGE_MUTATE)(wrapper)
+
 
 class BaseParser(ABC):
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        for name in MUTATORS:
+            if name in cls.__dict__:
+                setattr(cls, name, mutator(cls.__dict__[name]))
+
+    def __init__(self, detection: Optional[Detection] = None) -> None:
+        # MIME type and file header read while detecting the file type
+        self.mime: Optional[str] = None
+        self.header = b""
+        if detection is not None:
+            self.mime = detection.mime
+            self.header = detection.header
+        # parser specific settings, eg. {"compact": True}, unknown ones are ignored
+        self.options: Dict[str, Any] = {}
+        # encoded values as they were after parsing or the last write, only taken
+        # once a value is changed, so files that are only read are not encoded
+        self.__snapshot: Optional[Dict[str, Any]] = None
+        self.__parsed = False
+        # True once write() actually wrote the file
+        self.written = False
+        # the last write patched the file in place instead of replacing all of it
+        self.written_in_place = False
+
     @staticmethod
     @abstractmethod
     def supported_mimes() -> List[str]:
         pass
 
-    @abstractmethod
+    @profiling.timed(profiling.STAGE_PARSE)
     def parse(self, filename: str) -> None:
+        self._parse(filename)
+        self.__parsed = True
+        self.__snapshot = None
+
+    @abstractmethod
+    def _parse(self, filename: str) -> None:
         pass
 
     @abstractmethod
     def get_fields(self) -> List[str]:
         pass
 
+    @classmethod
+    def may_have_field(cls, field: str) -> bool:
+        """Check if files of this format can hold the field, without parsing one"""
+        try:
+            return field in cls().get_fields()
+        except Exception:
+            # the fields depend on the parsed file
+            return True
+
+    @mutator
     def delete_field(self, field: str) -> None:
         if field not in self.get_fields():
             raise KeyError("Field not present in parser")
 
+    @mutator
     def set_field(self, field: str, value: Optional[str]) -> None:
         if field not in self.get_fields():
             raise KeyError("Field not present in parser")
@@ -30,26 +139,56 @@ class BaseParser(ABC):
     def get_all_values(self) -> Dict[str, str]:
         pass
 
+    @classmethod
+    def decode_values(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        """Return encoded values, eg. cached ones, the way get_all_values returns
+        them, as far as printing them tells the difference"""
+        return values
+
+    @mutator
     def clear(self) -> None:
         for field in self.get_fields():
             self.delete_field(field)
 
-    def print(self) -> None:
-        items = self.get_all_values().items()
-        if len(items) == 0:
-            print("No metadata found")
-            return
+    def images(self) -> List[Tuple[str, bytes]]:
+        """Return the MIME type and the data of the embedded pictures"""
+        return []
+
+    def regions(self) -> List[Region]:
+        """Return the byte ranges entropy --deep scans
+
+        They cover the embedded binary data, eg. pictures, and the bytes the format
+        does not account for, eg. data after its end.
+        """
+        return []
 
-        for k, v in items:
-            print(f"{k}: {v}")
+    def print(self) -> None:
+        print_values(self.get_all_values())
 
     def analyze_entropy(self, min_entropy) -> Dict[str, str]:
-        return {
-            k: v
-            for k, v in self.get_all_values().items()
-            if isinstance(v, str) and utils.entropy(v) > min_entropy
-        }
+        return high_entropy_values(self.get_all_values(), min_entropy)
+
+    @profiling.timed(profiling.STAGE_WRITE)
+    def write(self) -> bool:
+        """Write the file if any value changed, returns False if nothing was written"""
+        if self.__snapshot is None:
+            # no value was changed
+            return False
+        values = utils.encode_values(self.get_all_values())
+        if values == self.__snapshot:
+            return False
+
+        self.written_in_place = False
+        self._write()
+        self.__snapshot = values
+        self.written = True
+        return True
 
     @abstractmethod
-    def write(self) -> None:
+    def _write(self) -> None:
         pass
+
+    def _snapshot(self) -> None:
+        """Snapshot the values before they are first changed, see mutator"""
+        if self.__snapshot is None and self.__parsed:
+            self.__snapshot = utils.encode_values(self.get_all_values())
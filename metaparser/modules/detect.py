@@ -0,0 +1,108 @@
+import logging
+import os
+from typing import Optional
+
+import magic  # type: ignore
+
+import metaparser.profiling as profiling
+
+# enough for libmagic to tell OpenXML documents apart from plain zip archives
+HEADER_SIZE = 4096
+
+SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"ID3", "audio/mpeg"),
+    (b"%PDF", "application/pdf"),
+]
+
+ZIP_SIGNATURE = b"PK\x03\x04"
+OPENXML_EXTENSIONS = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".dotx": "application/vnd.openxmlformats-officedocument.wordprocessingml.template",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".xltx": "application/vnd.openxmlformats-officedocument.spreadsheetml.template",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".potx": "application/vnd.openxmlformats-officedocument.presentationml.template",
+    ".ppsx": "application/vnd.openxmlformats-officedocument.presentationml.slideshow",
+}
+
+FTYP_SIGNATURE = b"ftyp"
+FTYP_BRANDS = {
+    b"isom": "video/mp4",
+    b"iso2": "video/mp4",
+    b"iso4": "video/mp4",
+    b"iso5": "video/mp4",
+    b"iso6": "video/mp4",
+    b"mp41": "video/mp4",
+    b"mp42": "video/mp4",
+    b"avc1": "video/mp4",
+    b"dash": "video/mp4",
+    b"mmp4": "video/mp4",
+    b"F4V ": "video/mp4",
+    b"M4A ": "audio/x-m4a",
+    b"M4B ": "audio/mp4",
+    b"M4P ": "audio/mp4",
+    b"M4V ": "video/x-m4v",
+    b"M4VH": "video/x-m4v",
+    b"M4VP": "video/x-m4v",
+    b"qt  ": "video/quicktime",
+}
+
+# reported for files that cannot be handled by any parser, when libmagic is skipped
+UNKNOWN_MIME = "application/octet-stream"
+
+
+class Detection:
+    def __init__(self, mime: str, header: bytes) -> None:
+        self.mime = mime
+        self.header = header
+
+
+def match_signature(filename: str, header: bytes) -> Optional[str]:
+    """Detect the supported formats from their signature bytes, without libmagic"""
+    for signature, mime in SIGNATURES:
+        if header.startswith(signature):
+            return mime
+
+    if header[4:8] == FTYP_SIGNATURE:
+        return FTYP_BRANDS.get(header[8:12])
+
+    if header.startswith(ZIP_SIGNATURE):
+        extension = os.path.splitext(filename)[1].lower()
+        return OPENXML_EXTENSIONS.get(extension)
+
+    return None
+
+
+def might_be_supported(header: bytes) -> bool:
+    """Check if libmagic could still detect a supported format the signatures missed"""
+    if header.startswith(ZIP_SIGNATURE) or header[4:8] == FTYP_SIGNATURE:
+        return True
+    # MPEG audio frame without an ID3 tag in front of it
+    return len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0
+
+
+@profiling.timed(profiling.STAGE_SNIFF)
+def sniff(filename: str, exact: bool = True) -> Detection:
+    """Detect the MIME type of a file with a single read of its header
+
+    Unless exact is set, libmagic is only consulted for files that might be handled
+    by one of the parsers and the rest is reported as UNKNOWN_MIME.
+    """
+    with open(filename, "rb") as f:
+        header = f.read(HEADER_SIZE)
+
+    return Detection(detect_mime(filename, header, exact), header)
+
+
+def detect_mime(filename: str, header: bytes, exact: bool = True) -> str:
+    mime = match_signature(filename, header)
+    if mime is None:
+        if exact or might_be_supported(header):
+            mime = magic.from_buffer(header, mime=True)
+        else:
+            mime = UNKNOWN_MIME
+    logging.debug("Detected MIME type '%s' for file '%s'", mime, filename)
+
+    return mime
@@ -1,22 +1,186 @@
-from typing import Dict, List, Optional
+import logging
+import mmap
+import shutil
+import struct
+from typing import Dict, List, Optional, Tuple
 
 from exif import Image  # type: ignore
 from exif._constants import ATTRIBUTE_ID_MAP  # type: ignore
 
-from .base import BaseParser
+from . import atomic
+from .base import BaseParser, Region
+from .detect import Detection
+from .mimes import EXIF_MIMES
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+MARKER_APP0 = 0xE0
+MARKER_APP1 = 0xE1
+MARKER_APP15 = 0xEF
+MARKER_COM = 0xFE
+MARKER_SOS = 0xDA
+MARKER_EOI = 0xD9
+# markers without a length field
+STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+EXIF_IDENTIFIER = b"Exif\x00\x00"
+# the length field of a segment counts itself, but not the marker
+MAX_SEGMENT_LENGTH = 0xFFFF
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"IEND"
+# chunks of the image itself, the others are ancillary and can hold anything
+PNG_CRITICAL_CHUNKS = [b"IHDR", b"PLTE", b"IDAT", PNG_IEND]
+
+
+class Segment:
+    """Position of the EXIF APP1 segment in a JPEG file"""
+
+    def __init__(self, offset: int, size: int) -> None:
+        # offset of the marker, size includes the marker and the length field
+        self.offset = offset
+        self.size = size
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.size
+
+
+def find_app1(data: mmap.mmap) -> Tuple[Optional[Segment], int]:
+    """Walk the JPEG markers up to the EXIF APP1 segment
+
+    Return the segment, or None if the image has none, and the offset a new
+    APP1 segment should be inserted at. The scan data is never touched.
+    """
+    if data[:2] != JPEG_SOI:
+        raise ValueError("Not a JPEG file")
+
+    offset = insert_at = len(JPEG_SOI)
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            # corrupt or truncated image, treated as one without EXIF like exif does
+            logging.debug(f"Bad JPEG marker at offset {offset}")
+            break
+        marker = data[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in (MARKER_SOS, MARKER_EOI):
+            break
+
+        (length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+        size = 2 + length
+        if marker == MARKER_APP1 and data[offset + 4 : offset + 10] == EXIF_IDENTIFIER:
+            return Segment(offset, size), insert_at
+        if marker == MARKER_APP0 and offset == insert_at:
+            # JFIF wants its APP0 segment to stay first
+            insert_at = offset + size
+        offset += size
+
+    return None, insert_at
+
+
+def jpeg_regions(data: mmap.mmap) -> List[Region]:
+    """Locate the APPn and comment segments and the data after the image"""
+    regions: List[Region] = []
+    offset = len(JPEG_SOI)
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            logging.debug(f"Bad JPEG marker at offset {offset}")
+            return regions
+        marker = data[offset + 1]
+        if marker == 0xFF:  # fill byte
+            offset += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker in (MARKER_SOS, MARKER_EOI):
+            break
+
+        (length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+        if MARKER_APP0 <= marker <= MARKER_APP15:
+            name = f"APP{marker - MARKER_APP0} segment"
+            regions.append(Region(name, offset + 4, length - 2))
+        elif marker == MARKER_COM:
+            regions.append(Region("COM segment", offset + 4, length - 2))
+        offset += 2 + length
+
+    # scan data escapes 0xFF bytes, so the first EOI after it ends the image
+    end = data.find(JPEG_EOI, offset)
+    if end >= 0 and end + len(JPEG_EOI) < len(data):
+        start = end + len(JPEG_EOI)
+        regions.append(Region("trailing data", start, len(data) - start))
+    return regions
+
+
+def png_regions(data: mmap.mmap) -> List[Region]:
+    """Locate the ancillary chunks and the data after the IEND chunk"""
+    regions: List[Region] = []
+    offset = len(PNG_SIGNATURE)
+    while offset + 12 <= len(data):
+        (length,) = struct.unpack(">I", data[offset : offset + 4])
+        kind = data[offset + 4 : offset + 8]
+        if kind not in PNG_CRITICAL_CHUNKS:
+            name = f"{kind.decode('latin-1')} chunk"
+            regions.append(Region(name, offset + 8, length))
+        # length, type and CRC take 12 bytes
+        offset += 12 + length
+        if kind == PNG_IEND:
+            break
+    if offset < len(data):
+        regions.append(Region("trailing data", offset, len(data) - offset))
+    return regions
+
+
+def app1_marker(length: int) -> bytes:
+    return bytes([0xFF, MARKER_APP1]) + struct.pack(">H", length)
 
 
 class ExifParser(BaseParser):
     __img: Image
     __filename: str
+    # EXIF segment of JPEG images, other images are read and written as a whole
+    __segment: Optional[Segment]
+    __insert_at: int
+    __jpeg: bool
+    # size of the APP1 segment exif was given, 0 if it has to create one
+    __wrapped: int
 
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, detection: Optional[Detection] = None) -> None:
+        super().__init__(detection)
 
-    def parse(self, filename: str) -> None:
+    def _parse(self, filename: str) -> None:
         self.__filename = filename
+        self.__segment = None
         with open(filename, "rb") as f:
-            self.__img = Image(f)
+            header = self.header or f.read(len(JPEG_SOI))
+            self.__jpeg = header.startswith(JPEG_SOI)
+            if not self.__jpeg:
+                f.seek(0)
+                self.__img = Image(f)
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.__segment, self.__insert_at = find_app1(data)
+                app1 = b""
+                if self.__segment is not None:
+                    app1 = data[self.__segment.offset : self.__segment.end]
+
+        self.__wrapped = len(app1)
+        # exif only gets to see the APP1 segment wrapped in an otherwise empty image
+        self.__img = Image(JPEG_SOI + app1 + JPEG_EOI)
+
+    def regions(self) -> List[Region]:
+        with open(self.__filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[: len(JPEG_SOI)] == JPEG_SOI:
+                    return jpeg_regions(data)
+                if data[: len(PNG_SIGNATURE)] == PNG_SIGNATURE:
+                    return png_regions(data)
+        return []
 
     def get_fields(self) -> List[str]:
         return list(ATTRIBUTE_ID_MAP.keys())
@@ -35,10 +199,57 @@ class ExifParser(BaseParser):
     def clear(self) -> None:
         self.__img.delete_all()
 
-    def write(self) -> None:
-        with open(self.__filename, "wb") as f:
-            f.write(self.__img.get_file())
+    def _write(self) -> None:
+        if not self.__jpeg:
+            with atomic.replace(self.__filename) as f:
+                f.write(self.__img.get_file())
+            return
+
+        body = self.__app1_body()
+        segment = self.__segment
+        if segment is not None and 4 + len(body) <= segment.size:
+            # pad with zeros and keep the length field, nothing after the segment moves
+            length = segment.size - 2
+            with atomic.patch(self.__filename) as f:
+                f.seek(segment.offset)
+                f.write(app1_marker(length) + body.ljust(length - 2, b"\x00"))
+            self.written_in_place = True
+            return
+
+        if len(body) + 2 > MAX_SEGMENT_LENGTH:
+            raise ValueError("EXIF data does not fit in an APP1 segment")
+        self.__splice(app1_marker(len(body) + 2) + body)
+
+    def __app1_body(self) -> bytes:
+        """Return the new APP1 segment without its marker and length field"""
+        data = self.__img.get_file()
+        # exif does not keep the length field consistent when values grow, so only
+        # the data after it is used
+        body = data[len(JPEG_SOI) + 4 :]
+        # exif counts the EOI of the wrapper image as part of an existing segment and
+        # appends grown values after it, a newly created segment is followed by it
+        if not self.__wrapped:
+            body = body[: -len(JPEG_EOI)]
+        elif body[self.__wrapped - 4 :] == JPEG_EOI:
+            body = body[: self.__wrapped - 4]
+
+        return body
+
+    def __splice(self, app1: bytes) -> None:
+        if self.__segment is not None:
+            start, end = self.__segment.offset, self.__segment.end
+        else:
+            start = end = self.__insert_at
+
+        with open(self.__filename, "rb") as source:
+            with atomic.replace(self.__filename) as target:
+                target.write(source.read(start))
+                target.write(app1)
+                source.seek(end)
+                shutil.copyfileobj(source, target)
+
+        self.__segment = Segment(start, len(app1))
 
     @staticmethod
     def supported_mimes() -> List[str]:
-        return ["image/jpeg", "image/png"]
+        return EXIF_MIMES
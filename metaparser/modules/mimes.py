@@ -0,0 +1,26 @@
+# MIME types handled by the built-in parsers, kept apart from the parser modules so
+# the registry can index them without importing the format libraries
+
+EXIF_MIMES = ["image/jpeg", "image/png"]
+
+MP3_MIMES = ["audio/mpeg"]
+
+MP4_MIMES = [
+    "video/mp4",
+    "audio/mp4",
+    "audio/x-m4a",  # m4a
+    "video/x-m4v",  # m4v
+    "video/quicktime",  # mov
+]
+
+OPENXML_MIMES = [
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # docx
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.template",  # dotx
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # xlsx
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.template",  # xltx
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation",  # pptx
+    "application/vnd.openxmlformats-officedocument.presentationml.template",  # potx
+    "application/vnd.openxmlformats-officedocument.presentationml.slideshow",  # ppsx
+]
+
+PDF_MIMES = ["application/pdf", "application/pdf-x"]
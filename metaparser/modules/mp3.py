@@ -1,9 +1,14 @@
-from typing import Dict, List, Optional
+import base64
+import shutil
+from typing import Any, BinaryIO, Dict, List, NamedTuple, Optional, Tuple
 
-import eyed3  # type: ignore
-import eyed3.mp3  # type: ignore
+import eyed3.id3  # type: ignore
+from eyed3.id3.tag import FileInfo  # type: ignore
 
-from .base import BaseParser
+from . import atomic
+from .base import DEFAULT_PADDING, OPTION_PADDING, BaseParser, Region
+from .detect import Detection
+from .mimes import MP3_MIMES
 
 FIELD_COMPOSER = "composer"
 FIELD_ARTIST = "artist"
@@ -39,34 +44,117 @@ FIELD_TAGGING_DATE = "tagging_date"
 FIELD_TERMS_OF_USE = "terms_of_use"
 FIELD_IMAGE = "images"
 
+# ID3v2 versions written by the parser itself, eyed3 saves ID3v1 tags in place and
+# cannot write ID3v2.2
+WRITABLE_VERSIONS = [eyed3.id3.ID3_V2_3, eyed3.id3.ID3_V2_4]
+# the tag is rendered through this private eyed3 method to write it in place, it
+# was tested against the versions allowed in setup.cfg, without it eyed3 saves
+CAN_RENDER = callable(getattr(eyed3.id3.Tag, "_render", None))
+
+ID3_IDENTIFIER = b"ID3"
+ID3_HEADER_SIZE = 10
+ID3_FRAME_HEADER_SIZE = 10
+ID3_FLAG_EXTENDED_HEADER = 0x40
+# frames of text and URLs, their values are checked by the string entropy, the
+# other frames hold binary data, eg. pictures or private data
+TEXT_FRAME_PREFIXES = (b"T", b"W")
+TEXT_FRAMES = [b"COMM", b"USLT"]
+
+
+class Picture(NamedTuple):
+    """An embedded picture decoded from its encoded value, like an eyed3 frame"""
+
+    mime_type: Optional[str]
+    description: Optional[str]
+    image_data: Optional[bytes]
+
+
+class Pictures(list):
+    """Value of the images field, eyed3 frames or Picture, printed as their MIME
+    types and sizes"""
+
+    def __str__(self) -> str:
+        pictures = [f"{p.mime_type} ({len(p.image_data or b'')} bytes)" for p in self]
+        return "[" + ", ".join(pictures) + "]"
+
+
+def synchsafe(data: bytes) -> int:
+    """Decode an ID3v2 integer with 7 bits per byte"""
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7F)
+    return value
+
+
+def id3_regions(f: BinaryIO) -> List[Region]:
+    """Locate the binary frames and the padding of the ID3v2 tag at the start"""
+    header = f.read(ID3_HEADER_SIZE)
+    if len(header) < ID3_HEADER_SIZE or not header.startswith(ID3_IDENTIFIER):
+        return []
+    version, flags = header[3], header[5]
+    end = ID3_HEADER_SIZE + synchsafe(header[6:10])
+    if version < 3:
+        # ID3v2.2 frames have other headers, the tag is scanned as a whole
+        return [Region("ID3v2.2 tag", 0, end)]
+
+    body = f.read(end - ID3_HEADER_SIZE)
+    pos = 0
+    if flags & ID3_FLAG_EXTENDED_HEADER:
+        # the size counts itself in ID3v2.4 only
+        size = body[:4]
+        pos = synchsafe(size) if version == 4 else int.from_bytes(size, "big") + 4
+
+    regions: List[Region] = []
+    while pos + ID3_FRAME_HEADER_SIZE <= len(body) and body[pos] != 0:
+        frame = body[pos : pos + 4]
+        size = body[pos + 4 : pos + 8]
+        length = synchsafe(size) if version == 4 else int.from_bytes(size, "big")
+        start = ID3_HEADER_SIZE + pos + ID3_FRAME_HEADER_SIZE
+        if not frame.startswith(TEXT_FRAME_PREFIXES) and frame not in TEXT_FRAMES:
+            name = frame.decode("latin-1")
+            regions.append(Region(f"{name} frame", start, length))
+        pos += ID3_FRAME_HEADER_SIZE + length
+    if pos < len(body):
+        # zeros unless something was hidden after the frames
+        regions.append(Region("ID3 padding", ID3_HEADER_SIZE + pos, len(body) - pos))
+    return regions
+
 
 class Mp3Parser(BaseParser):
     @staticmethod
     def supported_mimes() -> List[str]:
-        return ["audio/mpeg"]
+        return MP3_MIMES
 
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, detection: Optional[Detection] = None) -> None:
+        super().__init__(detection)
         self.__tag = None
         self.filename: str = ""
 
-    def parse(self, filename: str) -> None:
-        file = eyed3.load(filename)
+    def _parse(self, filename: str) -> None:
+        # only the ID3v2 header at the start and the ID3v1 tag at the end are read,
+        # eyed3.load would also scan the MPEG frames for the audio info
+        tag = eyed3.id3.Tag()
+        if not tag.parse(filename):
+            # no tag yet, a new one is written on the first change
+            tag = eyed3.id3.Tag()
+            tag.file_info = FileInfo(filename)
         self.filename = filename
-        self.__tag = file.tag
-        if getattr(self.__tag, FIELD_IMAGE, []):
-            print("There might be some images in mp3 file, use print to extract")
-
-    def save_image(self):
-        if getattr(self.__tag, FIELD_IMAGE, None) is None:
-            raise KeyError("No image embbeded in mp3 file")
-        iterator = 1
-        for image in self.__tag.images:
-            image_file = open("{0}-image-{1}.jpg".format(self.filename, iterator), "wb")
-            image_file.write(image.image_data)
-            print("Saving image as {0}-image-{1}.jpg".format(self.filename, iterator))
-            image_file.close()
-            iterator += 1
+        self.__tag = tag
+
+    def images(self) -> List[Tuple[str, bytes]]:
+        """Return the MIME type and the data of the embedded pictures"""
+        if self.__tag is None:
+            raise TypeError("Tag is null, parse the file first")
+        # pictures linked by URL have no data
+        return [
+            (image.mime_type, image.image_data)
+            for image in self.__tag.images
+            if image.image_data
+        ]
+
+    def regions(self) -> List[Region]:
+        with open(self.filename, "rb") as f:
+            return id3_regions(f)
 
     def get_fields(self) -> List[str]:
         return [
@@ -136,13 +224,50 @@ class Mp3Parser(BaseParser):
                 attr = getattr(self.__tag, field, None)
                 if attr is not None and not (isinstance(attr, tuple) and any(attr)):
                     values[field] = attr
+        values[FIELD_IMAGE] = Pictures(self.__tag.images)
         return values
 
-    def write(self) -> None:
-        self.__tag.save()  # type: ignore
+    @classmethod
+    def decode_values(cls, values: Dict[str, Any]) -> Dict[str, Any]:
+        decoded = dict(values)
+        if isinstance(decoded.get(FIELD_TRACK_NUM), list):
+            decoded[FIELD_TRACK_NUM] = tuple(decoded[FIELD_TRACK_NUM])
+        if isinstance(decoded.get(FIELD_IMAGE), list):
+            decoded[FIELD_IMAGE] = Pictures(
+                Picture(
+                    image.get("mime_type"),
+                    image.get("description"),
+                    base64.b64decode(image["data"]) if image.get("data") else None,
+                )
+                for image in decoded[FIELD_IMAGE]
+            )
+        return decoded
+
+    def _write(self) -> None:
+        tag: Any = self.__tag
+        if tag.version not in WRITABLE_VERSIONS or not CAN_RENDER:
+            with atomic.replace_copy(self.filename) as temp:
+                tag.save(temp)
+            return
+
+        # tag size including the padding, 0 for files without an ID3v2 tag
+        size = tag.file_info.tag_size
+        rewrite, data, padding = tag._render(tag.version, size, None)
+        if not rewrite:
+            # the frames fit in the current tag, shrinking ones grow its padding
+            with atomic.patch(self.filename) as f:
+                f.write(data + padding)
+            self.written_in_place = True
+            return
 
-    def print(self) -> None:
-        super().print()
-        if getattr(self.__tag, FIELD_IMAGE, None) is not None:
-            print("Detected possible image in mp3 file, use print to extract")
-            self.save_image()
+        # the tag grows past its padding, reserve some for the next edits so the
+        # audio data only has to be moved this once
+        reserved = len(data) + self.options.get(OPTION_PADDING, DEFAULT_PADDING)
+        _, data, padding = tag._render(tag.version, reserved, None)
+        with open(self.filename, "rb") as source, atomic.replace(
+            self.filename
+        ) as target:
+            target.write(data + padding)
+            source.seek(size)
+            shutil.copyfileobj(source, target)
+        tag.file_info.tag_size = len(data) + len(padding)
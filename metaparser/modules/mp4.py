@@ -1,9 +1,14 @@
-from typing import Any, Dict, List
+import mmap
+import struct
+from typing import Any, Dict, List, Optional, Tuple
 
 import mutagen  # type: ignore
 import mutagen.easymp4  # type: ignore
 
-from .base import BaseParser
+from . import atomic
+from .base import DEFAULT_PADDING, OPTION_PADDING, BaseParser, Region
+from .detect import Detection
+from .mimes import MP4_MIMES
 
 FIELD_TITLE = "title"
 FIELD_ALBUM = "album"
@@ -32,19 +37,101 @@ FIELD_BPM = "bpm"
 FIELD_TRACK_NUMBER = "tracknumber"
 FIELD_DISC_NUMBER = "discnumber"
 
+# atoms only holding other atoms, walked down to the cover art and free space
+CONTAINER_ATOMS = [b"moov", b"udta", b"meta", b"ilst", b"trak", b"mdia", b"minf"]
+# padding, zeros unless something was hidden in it
+FREE_ATOMS = [b"free", b"skip", b"wide"]
+COVER_ATOM = b"covr"
+# top-level atoms of the format, any other one, eg. uuid, is reported whole
+KNOWN_ATOMS = [b"ftyp", b"moov", b"mdat", b"moof", b"mfra", b"pdin", b"sidx", b"styp"]
+# a data atom has a type and a locale before its value
+DATA_HEADER_SIZE = 16
+
+
+def atom_regions(data: mmap.mmap, start: int, end: int, top: bool) -> List[Region]:
+    """Locate the free space, cover art and unknown atoms between start and end"""
+    regions: List[Region] = []
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos : pos + 8])
+        header = 8
+        if size == 1 and pos + 16 <= end:
+            (size,) = struct.unpack(">Q", data[pos + 8 : pos + 16])
+            header = 16
+        elif size == 0:
+            # the last atom extends to the end of the file
+            size = end - pos
+        if size < header or pos + size > end:
+            break
+
+        body = pos + header
+        name = kind.decode("latin-1")
+        if kind in FREE_ATOMS:
+            regions.append(Region(f"{name} atom", body, size - header))
+        elif kind == COVER_ATOM:
+            for picture in data_values(data, body, pos + size):
+                regions.append(Region("covr picture", picture[0], picture[1]))
+        elif kind in CONTAINER_ATOMS:
+            # the meta atom of MP4 has a version and flags before its children,
+            # the one of QuickTime starts with its hdlr child right away
+            if kind == b"meta" and data[body + 4 : body + 8] != b"hdlr":
+                body += 4
+            regions.extend(atom_regions(data, body, pos + size, False))
+        elif top and kind not in KNOWN_ATOMS:
+            regions.append(Region(f"{name} atom", body, size - header))
+        pos += size
+
+    if top and pos < end:
+        regions.append(Region("trailing data", pos, end - pos))
+    return regions
+
+
+def data_values(data: mmap.mmap, start: int, end: int) -> List[Tuple[int, int]]:
+    """Return the offsets and lengths of the values of the data atoms"""
+    values = []
+    pos = start
+    while pos + DATA_HEADER_SIZE <= end:
+        size, kind = struct.unpack(">I4s", data[pos : pos + 8])
+        if size < DATA_HEADER_SIZE or pos + size > end:
+            break
+        if kind == b"data":
+            values.append((pos + DATA_HEADER_SIZE, size - DATA_HEADER_SIZE))
+        pos += size
+    return values
+
+
+class NoRoom(Exception):
+    """Raised when the tags do not fit in the space they already take up"""
+
+
+def keep_padding(info: Any) -> int:
+    """Padding function of mutagen that only lets the tags be written in place
+
+    Keeping all the free space after the ilst atom means nothing behind it moves,
+    so neither the media data nor the chunk offsets have to be rewritten.
+    """
+    if info.padding < 0:
+        raise NoRoom()
+    return info.padding
+
 
 class Mp4Parser(BaseParser):
     @staticmethod
     def supported_mimes() -> List[str]:
-        return ["video/mp4"]
+        return MP4_MIMES
 
-    def __init__(self) -> None:
-        super().__init__()
+    def __init__(self, detection: Optional[Detection] = None) -> None:
+        super().__init__(detection)
         self.__file: mutagen.easymp4.EasyMP4
 
-    def parse(self, filename: str) -> None:
+    def _parse(self, filename: str) -> None:
         self.__file = mutagen.easymp4.EasyMP4(filename)
 
+    def regions(self) -> List[Region]:
+        with open(self.__file.filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return atom_regions(data, 0, len(data), True)
+
     def get_fields(self) -> List[str]:
         return [
             FIELD_TITLE,
@@ -95,5 +182,18 @@ class Mp4Parser(BaseParser):
                 values[k] = v
         return values
 
-    def write(self) -> None:
-        self.__file.save()
+    def _write(self) -> None:
+        filename = self.__file.filename
+        try:
+            # mutagen calls the padding function before writing anything
+            with atomic.patch(filename) as f:
+                self.__file.save(f, padding=keep_padding)
+            self.written_in_place = True
+            return
+        except NoRoom:
+            pass
+
+        # the tags grow past the free space, reserve some for the next edits
+        padding = self.options.get(OPTION_PADDING, DEFAULT_PADDING)
+        with atomic.replace_copy(filename) as temp:
+            self.__file.save(temp, padding=lambda info: padding)
@@ -1,13 +1,15 @@
-import re
-import shutil
-import tempfile
+import posixpath
+import struct
+import sys
 import xml.etree.ElementTree as ElementTree
 import zipfile
-from typing import Dict, List, Optional
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Set
 
-from .base import BaseParser
+from . import atomic
+from .base import BaseParser, Region
+from .detect import Detection
+from .mimes import OPENXML_MIMES
 
-FIELD_CORE_PROPERTIES = "coreProperties"
 FIELD_TITLE = "title"
 FIELD_SUBJECT = "subject"
 FIELD_CREATOR = "creator"
@@ -17,100 +19,421 @@ FIELD_LASTMODIFIEDBY = "lastModifiedBy"
 FIELD_REVISION = "revision"
 FIELD_CREATED = "created"
 FIELD_MODIFIED = "modified"
+FIELD_CATEGORY = "category"
+FIELD_CONTENT_STATUS = "contentStatus"
+FIELD_IDENTIFIER = "identifier"
+FIELD_LANGUAGE = "language"
+FIELD_LAST_PRINTED = "lastPrinted"
+FIELD_VERSION = "version"
 
-XML_LOCATION = "docProps/core.xml"
+# extended and custom properties are named after their element or property name,
+# behind these prefixes, eg. "app:Company" or "custom:Client"
+APP_PREFIX = "app:"
+CUSTOM_PREFIX = "custom:"
+
+CORE_LOCATION = "docProps/core.xml"
+APP_LOCATION = "docProps/app.xml"
+CUSTOM_LOCATION = "docProps/custom.xml"
 XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>"
+
+CORE_NAMESPACE = (
+    "http://schemas.openxmlformats.org/package/2006/metadata/core-properties"
+)
+DC_NAMESPACE = "http://purl.org/dc/elements/1.1/"
+DCTERMS_NAMESPACE = "http://purl.org/dc/terms/"
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+APP_NAMESPACE = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/extended-properties"
+)
+CUSTOM_NAMESPACE = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/custom-properties"
+)
+VT_NAMESPACE = "http://schemas.openxmlformats.org/officeDocument/2006/docPropsVTypes"
 NAMESPACES = {
-    "cp": "http://schemas.openxmlformats.org/package/2006/metadata/core-properties",
-    "dc": "http://purl.org/dc/elements/1.1/",
-    "dcmitype": "http://purl.org/dc/dcmitype/",
-    "dcterms": "http://purl.org/dc/terms/",
+    "cp": CORE_NAMESPACE,
+    "dc": DC_NAMESPACE,
     "dcmitype": "http://purl.org/dc/dcmitype/",
-    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "dcterms": DCTERMS_NAMESPACE,
+    "xsi": XSI_NAMESPACE,
+    # ElementTree cannot write unqualified attributes under a default namespace,
+    # so the extended and custom properties get a prefix too
+    "ep": APP_NAMESPACE,
+    "op": CUSTOM_NAMESPACE,
+    "vt": VT_NAMESPACE,
 }
+for prefix, uri in NAMESPACES.items():
+    ElementTree.register_namespace(prefix, uri)
+
+# qualified tag of every core property, they can be added when missing
+CORE_TAGS = {
+    FIELD_TITLE: f"{{{DC_NAMESPACE}}}title",
+    FIELD_SUBJECT: f"{{{DC_NAMESPACE}}}subject",
+    FIELD_CREATOR: f"{{{DC_NAMESPACE}}}creator",
+    FIELD_KEYWORDS: f"{{{CORE_NAMESPACE}}}keywords",
+    FIELD_DESCRIPTION: f"{{{DC_NAMESPACE}}}description",
+    FIELD_LASTMODIFIEDBY: f"{{{CORE_NAMESPACE}}}lastModifiedBy",
+    FIELD_REVISION: f"{{{CORE_NAMESPACE}}}revision",
+    FIELD_CREATED: f"{{{DCTERMS_NAMESPACE}}}created",
+    FIELD_MODIFIED: f"{{{DCTERMS_NAMESPACE}}}modified",
+    FIELD_CATEGORY: f"{{{CORE_NAMESPACE}}}category",
+    FIELD_CONTENT_STATUS: f"{{{CORE_NAMESPACE}}}contentStatus",
+    FIELD_IDENTIFIER: f"{{{DC_NAMESPACE}}}identifier",
+    FIELD_LANGUAGE: f"{{{DC_NAMESPACE}}}language",
+    FIELD_LAST_PRINTED: f"{{{CORE_NAMESPACE}}}lastPrinted",
+    FIELD_VERSION: f"{{{CORE_NAMESPACE}}}version",
+}
+CORE_FIELDS = {tag: field for field, tag in CORE_TAGS.items()}
+# core dates are typed, see ECMA-376 part 2
+DATE_FIELDS = [FIELD_CREATED, FIELD_MODIFIED]
+DATE_TYPE = "dcterms:W3CDTF"
+
+# extended properties holding a single value, they can be added when missing
+APP_FIELDS = [
+    "Template",
+    "Manager",
+    "Company",
+    "Pages",
+    "Words",
+    "Characters",
+    "PresentationFormat",
+    "Lines",
+    "Paragraphs",
+    "Slides",
+    "Notes",
+    "TotalTime",
+    "HiddenSlides",
+    "MMClips",
+    "ScaleCrop",
+    "LinksUpToDate",
+    "CharactersWithSpaces",
+    "SharedDoc",
+    "HyperlinkBase",
+    "HyperlinksChanged",
+    "DocSecurity",
+    "Application",
+    "AppVersion",
+]
+
+CUSTOM_PROPERTY_TAG = f"{{{CUSTOM_NAMESPACE}}}property"
+# format id every custom property uses
+CUSTOM_FMTID = "{D5CDD505-2E9C-101B-9397-08002B2CF9AE}"
+# ids 0 and 1 are reserved
+CUSTOM_FIRST_PID = 2
+# new custom properties are strings
+CUSTOM_TYPE = f"{{{VT_NAMESPACE}}}lpwstr"
+
+
+class Property(NamedTuple):
+    # part the property is stored in
+    location: str
+    # element holding the value
+    element: ElementTree.Element
+    # node removed with the property and its parent, the element itself except
+    # for custom properties, where the value is wrapped in a property element
+    node: ElementTree.Element
+    parent: ElementTree.Element
+
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def copy_range(source: BinaryIO, target: BinaryIO, length: int) -> None:
+    while length > 0:
+        chunk = source.read(min(length, COPY_BUFFER_SIZE))
+        if not chunk:
+            raise EOFError("Unexpected end of zip archive")
+        target.write(chunk)
+        length -= len(chunk)
+
+
+# the raw copy appends entries through zipfile internals (start_dir, NameToInfo
+# and _didModify), only relied upon on the Python versions it was tested with
+RAW_COPY_VERSIONS = ((3, 9), (3, 14))
+RAW_COPY = RAW_COPY_VERSIONS[0] <= sys.version_info[:2] < RAW_COPY_VERSIONS[1]
+
+
+def replaced_info(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """Return a fresh entry for a member written again, with its attributes"""
+    replaced = zipfile.ZipInfo(info.filename, info.date_time)
+    replaced.compress_type = info.compress_type
+    replaced.create_system = info.create_system
+    replaced.external_attr = info.external_attr
+    return replaced
+
+
+def rewrite_zip(
+    source: BinaryIO, target: BinaryIO, replacements: Dict[str, bytes]
+) -> None:
+    """Copy a zip archive, only recompressing the members that are replaced
+
+    Untouched members are copied as raw local header and compressed data, the
+    central directory is written by zipfile from their existing ZipInfo entries.
+    On Python versions outside RAW_COPY_VERSIONS every member is recompressed.
+    """
+    with zipfile.ZipFile(source) as in_zip, zipfile.ZipFile(target, "w") as out_zip:
+        infos = in_zip.infolist()
+        if not RAW_COPY:
+            for info in infos:
+                data = replacements.get(info.filename)
+                if data is None:
+                    data = in_zip.read(info)
+                out_zip.writestr(replaced_info(info), data)
+            return
+
+        # a member ends where the next one starts, the last one where the central
+        # directory begins, this also covers data descriptors after the data
+        starts = sorted(info.header_offset for info in infos)
+        ends = dict(zip(starts, starts[1:] + [in_zip.start_dir]))
+
+        for info in infos:
+            if info.filename in replacements:
+                out_zip.writestr(replaced_info(info), replacements[info.filename])
+                continue
+
+            offset = target.tell()
+            source.seek(info.header_offset)
+            copy_range(source, target, ends[info.header_offset] - info.header_offset)
+            info.header_offset = offset
+            out_zip.filelist.append(info)
+            out_zip.NameToInfo[info.filename] = info
+            # zipfile writes new members and the central directory at start_dir
+            out_zip.start_dir = target.tell()
+            out_zip._didModify = True  # type: ignore
+
+
+# parts every package has without being the target of a relationship
+CONTENT_TYPES_LOCATION = "[Content_Types].xml"
+RELATIONSHIPS_SUFFIX = ".rels"
+RELATIONSHIP_TAG = (
+    "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+)
+LOCAL_HEADER_SIZE = 30
+END_OF_CENTRAL_DIRECTORY = b"PK\x05\x06"
+END_OF_CENTRAL_DIRECTORY_SIZE = 22
+
+
+def referenced_parts(document: zipfile.ZipFile) -> Set[str]:
+    """Return the parts targeted by a relationship, along with the package parts"""
+    referenced = {CONTENT_TYPES_LOCATION}
+    for name in document.namelist():
+        if not name.endswith(RELATIONSHIPS_SUFFIX):
+            continue
+        referenced.add(name)
+        # the relationships of a/b.xml are in a/_rels/b.xml.rels, their targets
+        # are relative to a
+        source = posixpath.dirname(posixpath.dirname(name))
+        try:
+            root = ElementTree.fromstring(document.read(name))
+        except ElementTree.ParseError:
+            continue
+        for relationship in root.iter(RELATIONSHIP_TAG):
+            target = relationship.get("Target")
+            if target is None or relationship.get("TargetMode") == "External":
+                continue
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(source, target))
+            referenced.add(target)
+    return referenced
+
+
+def package_regions(f: BinaryIO, document: zipfile.ZipFile) -> List[Region]:
+    """Locate the stored data of the unreferenced parts and the bytes around the zip"""
+    regions: List[Region] = []
+    referenced = referenced_parts(document)
+    infos = document.infolist()
+    for info in infos:
+        if info.filename in referenced or info.is_dir():
+            continue
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack("<HH", f.read(4))
+        offset = info.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+        regions.append(
+            Region(f"unreferenced part {info.filename}", offset, info.compress_size)
+        )
+
+    first = min((info.header_offset for info in infos), default=0)
+    if first > 0:
+        regions.append(Region("prepended data", 0, first))
+    # the zip ends with the comment of its end of central directory record
+    size = f.seek(0, 2)
+    tail = min(size, 64 * 1024 + END_OF_CENTRAL_DIRECTORY_SIZE)
+    f.seek(size - tail)
+    data = f.read(tail)
+    position = data.rfind(END_OF_CENTRAL_DIRECTORY)
+    if position >= 0 and position + END_OF_CENTRAL_DIRECTORY_SIZE <= len(data):
+        (comment_length,) = struct.unpack("<H", data[position + 20 : position + 22])
+        end = size - tail + position + END_OF_CENTRAL_DIRECTORY_SIZE + comment_length
+        if end < size:
+            regions.append(Region("trailing data", end, size - end))
+    return regions
 
 
 class OpenXmlParser(BaseParser):
+    """Core, extended and custom document properties
+
+    The parts are parsed once and every property is indexed by its field, so
+    reading and editing a field does not walk the XML trees. Only the parts with
+    changed values are serialized again on write.
+    """
+
     @staticmethod
     def supported_mimes() -> List[str]:
-        return [
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",  # docx
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.template",  # dotx
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",  # xlsx
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.template",  # xltx
-            "application/vnd.openxmlformats-officedocument.presentationml.presentation",  # pptx
-            "application/vnd.openxmlformats-officedocument.presentationml.template",  # potx
-            "application/vnd.openxmlformats-officedocument.presentationml.slideshow",  # ppsx
-        ]
-
-    def __init__(self) -> None:
-        super().__init__()
-        self.__tree: ElementTree.Element
+        return OPENXML_MIMES
+
+    def __init__(self, detection: Optional[Detection] = None) -> None:
+        super().__init__(detection)
         self.__path: str
+        # root element of every part present in the document
+        self.__parts: Dict[str, ElementTree.Element] = {}
+        self.__index: Dict[str, Property] = {}
+        # parts with values changed since parsing or the last write
+        self.__changed: Set[str] = set()
 
-    def parse(self, filename: str) -> None:
-        xml_string = zipfile.ZipFile(filename).read(XML_LOCATION)
-        self.__tree = ElementTree.fromstring(xml_string)
+    def _parse(self, filename: str) -> None:
         self.__path = filename
-        for key, value in NAMESPACES.items():
-            ElementTree.register_namespace(key, value)
+        self.__parts = {}
+        self.__index = {}
+        self.__changed = set()
+        with zipfile.ZipFile(filename) as document:
+            names = set(document.namelist())
+            for location in (CORE_LOCATION, APP_LOCATION, CUSTOM_LOCATION):
+                if location in names:
+                    root = ElementTree.fromstring(document.read(location))
+                    self.__parts[location] = root
+
+        core = self.__parts.get(CORE_LOCATION)
+        if core is not None:
+            for element in core:
+                field = CORE_FIELDS.get(element.tag)
+                if field is not None:
+                    self.__add(field, CORE_LOCATION, element, core)
+
+        app = self.__parts.get(APP_LOCATION)
+        if app is not None:
+            for element in app:
+                name = self.__app_name(element.tag)
+                # skip the vectors, eg. HeadingPairs and TitlesOfParts
+                if name is not None and len(element) == 0:
+                    self.__add(APP_PREFIX + name, APP_LOCATION, element, app)
+
+        custom = self.__parts.get(CUSTOM_LOCATION)
+        if custom is not None:
+            for node in custom.iter(CUSTOM_PROPERTY_TAG):
+                name = node.get("name")
+                if name is not None and len(node) > 0:
+                    field = CUSTOM_PREFIX + name
+                    self.__index[field] = Property(
+                        CUSTOM_LOCATION, node[0], node, custom
+                    )
+
+    def __add(
+        self,
+        field: str,
+        location: str,
+        element: ElementTree.Element,
+        parent: ElementTree.Element,
+    ) -> None:
+        self.__index[field] = Property(location, element, element, parent)
+
+    @staticmethod
+    def __app_name(tag: str) -> Optional[str]:
+        namespace, _, name = tag.rpartition("}")
+        return name if namespace == "{" + APP_NAMESPACE else None
+
+    @classmethod
+    def may_have_field(cls, field: str) -> bool:
+        # documents can hold extended properties other than APP_FIELDS
+        return field in CORE_TAGS or field.startswith((APP_PREFIX, CUSTOM_PREFIX))
+
+    def regions(self) -> List[Region]:
+        with open(self.__path, "rb") as f, zipfile.ZipFile(f) as document:
+            return package_regions(f, document)
 
     def get_fields(self) -> List[str]:
-        return [
-            FIELD_CORE_PROPERTIES,
-            FIELD_TITLE,
-            FIELD_SUBJECT,
-            FIELD_CREATOR,
-            FIELD_KEYWORDS,
-            FIELD_DESCRIPTION,
-            FIELD_LASTMODIFIEDBY,
-            FIELD_REVISION,
-            FIELD_CREATED,
-            FIELD_MODIFIED,
-        ]
+        fields = list(CORE_TAGS)
+        if APP_LOCATION in self.__parts:
+            fields.extend(APP_PREFIX + name for name in APP_FIELDS)
+        fields.extend(field for field in self.__index if field not in CORE_TAGS)
+        return list(dict.fromkeys(fields))
 
     def set_field(self, field: str, value: Optional[str]) -> None:
-        super().set_field(field, value)
-        for elem in self.__tree.iter():
-            if elem.tag.endswith(
-                field
-            ):  # real tags are more complex - eg. '{http://schemas.openxmlformats.org/package/2006/metadata/core-properties}coreProperties' so we check only end
-                elem.text = value
+        if value is None:
+            self.delete_field(field)
+            return
+
+        prop = self.__index.get(field) or self.__create(field)
+        if prop.element.text != value:
+            prop.element.text = value
+            self.__changed.add(prop.location)
 
-    def clear(self):
-        for elem in self.__tree.iter():
-            elem.text = ""
+    def __create(self, field: str) -> Property:
+        """Add the element of a missing property, raises KeyError if not possible"""
+        if field in CORE_TAGS:
+            location = CORE_LOCATION
+        elif field.startswith(APP_PREFIX) and field[len(APP_PREFIX) :] in APP_FIELDS:
+            location = APP_LOCATION
+        elif field.startswith(CUSTOM_PREFIX) and len(field) > len(CUSTOM_PREFIX):
+            location = CUSTOM_LOCATION
+        else:
+            raise KeyError("Field not present in parser")
+        root = self.__parts.get(location)
+        if root is None:
+            raise KeyError(f"Document has no {location} part")
+
+        if location == CORE_LOCATION:
+            element = ElementTree.SubElement(root, CORE_TAGS[field])
+            if field in DATE_FIELDS:
+                element.set(f"{{{XSI_NAMESPACE}}}type", DATE_TYPE)
+            self.__add(field, location, element, root)
+        elif location == APP_LOCATION:
+            tag = f"{{{APP_NAMESPACE}}}{field[len(APP_PREFIX) :]}"
+            self.__add(field, location, ElementTree.SubElement(root, tag), root)
+        else:
+            pids = [int(p.get("pid") or 0) for p in root.iter(CUSTOM_PROPERTY_TAG)]
+            node = ElementTree.SubElement(
+                root,
+                CUSTOM_PROPERTY_TAG,
+                {
+                    "fmtid": CUSTOM_FMTID,
+                    "pid": str(max(pids + [CUSTOM_FIRST_PID - 1]) + 1),
+                    "name": field[len(CUSTOM_PREFIX) :],
+                },
+            )
+            element = ElementTree.SubElement(node, CUSTOM_TYPE)
+            self.__index[field] = Property(location, element, node, root)
+        return self.__index[field]
+
+    def clear(self) -> None:
+        for field in list(self.__index):
+            self.delete_field(field)
 
     def delete_field(self, field: str) -> None:
-        super().delete_field(field)
-        for elem in self.__tree.iter():
-            if elem.tag.endswith(field):
-                elem.text = ""
+        prop = self.__index.pop(field, None)
+        if prop is None:
+            if field not in self.get_fields():
+                raise KeyError("Field not present in parser")
+            return
+
+        prop.parent.remove(prop.node)
+        self.__changed.add(prop.location)
 
     def get_all_values(self) -> Dict[str, str]:
-        values = {}
-        pattern = re.compile("({.*})(.*)")
-        for elem in self.__tree.iter():
-            if elem.text and pattern.match(elem.tag):
-                key = pattern.search(elem.tag).group(2)  # type: ignore
-                values[key] = elem.text
-        return values
-
-    def write(self) -> None:
-        xmlString = ElementTree.tostring(self.__tree).decode("utf-8")
-        xmlString = XML_DECLARATION + xmlString
-
-        temp = tempfile.NamedTemporaryFile()
-        shutil.copyfile(self.__path, temp.name)
-
-        with zipfile.ZipFile(temp) as inZip, zipfile.ZipFile(
-            self.__path, "w"
-        ) as outZip:
-            for inZipInfo in inZip.infolist():
-                with inZip.open(inZipInfo) as infile:
-                    if inZipInfo.filename == XML_LOCATION:
-                        content = xmlString
-                        outZip.writestr(inZipInfo.filename, content)
-                    else:
-                        content = infile.read().decode("utf-8")
-                        outZip.writestr(inZipInfo.filename, content)
+        return {
+            field: prop.element.text
+            for field, prop in self.__index.items()
+            if prop.element.text
+        }
+
+    def _write(self) -> None:
+        replacements = {}
+        for location in sorted(self.__changed):
+            xml_string = ElementTree.tostring(self.__parts[location]).decode("utf-8")
+            replacements[location] = (XML_DECLARATION + xml_string).encode("utf-8")
+        if not replacements:
+            return
+
+        with open(self.__path, "rb") as source, atomic.replace(self.__path) as target:
+            rewrite_zip(source, target, replacements)
+        self.__changed.clear()
@@ -1,8 +1,13 @@
-from typing import Any, Dict, List
+import logging
+import mmap
+import zlib
+from typing import Any, Dict, List, Optional
 
-from PyPDF2 import PdfFileMerger, PdfFileReader  # type: ignore
-
-from .base import BaseParser
+from . import atomic
+from .base import BaseParser, Region
+from .detect import Detection
+from .mimes import PDF_MIMES
+from .pdfsyntax import PdfDocument, PdfError
 
 FIELD_DISCLAIMER = "You can specify your own fields. Make sure they start with /"
 FIELD_TITLE = "/Title"
@@ -15,6 +20,25 @@ FIELD_CREATOR = "/Creator"
 FIELD_PRODUCER = "/Producer"
 FIELD_TRAPPED = "/Trapped"
 
+# rewrite the whole document instead of appending an incremental update, so old
+# values are physically removed from the file
+OPTION_COMPACT = "compact"
+
+END_OF_FILE = b"%%EOF"
+# stream dictionary entries describing the data, used to name its region
+STREAM_DESCRIPTION_KEYS = ["/Type", "/Subtype", "/Filter"]
+
+
+def stream_name(num: int, dictionary: Dict[str, Any]) -> str:
+    """Name a stream after its number and kind, eg. stream 7 /Image /DCTDecode"""
+    parts = [f"stream {num}"]
+    for key in STREAM_DESCRIPTION_KEYS:
+        value = dictionary.get(key)
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, str):
+                parts.append(item)
+    return " ".join(parts)
+
 
 class PDFParser(BaseParser):
     def get_fields(self) -> List[str]:
@@ -33,19 +57,58 @@ class PDFParser(BaseParser):
 
     @staticmethod
     def supported_mimes() -> List[str]:
-        return ["application/pdf", "application/pdf-x"]
+        return PDF_MIMES
+
+    @classmethod
+    def may_have_field(cls, field: str) -> bool:
+        # documents can hold any field
+        return field.startswith("/")
 
-    def __init__(self) -> None:
-        super().__init__()
-        self.metadata: Dict[str, str] = dict()
+    def __init__(self, detection: Optional[Detection] = None) -> None:
+        super().__init__(detection)
+        self.metadata: Dict[str, Any] = dict()
         self.filename = str()
+        # None when the document could only be read with PyPDF2
+        self.__document: Optional[PdfDocument] = None
 
-    def parse(self, filename: str) -> None:
+    def _parse(self, filename: str) -> None:
         self.filename = filename
-        metadata = PdfFileReader(filename).getDocumentInfo()
-        self.metadata = dict()
-        for field in metadata:
-            self.metadata[field] = metadata[field]
+        try:
+            with open(filename, "rb") as f:
+                self.__document = PdfDocument(f)
+                self.metadata = self.__document.info()
+        except (PdfError, ValueError, LookupError, TypeError, zlib.error) as e:
+            logging.debug(f"Falling back to PyPDF2 for {filename}: {e}")
+            self.__document = None
+            self.metadata = self.__read_full()
+
+    def __read_full(self) -> Dict[str, Any]:
+        # PyPDF2 is only imported when the document needs it
+        from PyPDF2 import PdfFileReader  # type: ignore
+
+        metadata = PdfFileReader(self.filename).getDocumentInfo()
+        return {field: metadata[field] for field in metadata}
+
+    def regions(self) -> List[Region]:
+        regions: List[Region] = []
+        with open(self.filename, "rb") as f:
+            try:
+                spans = PdfDocument(f).stream_spans()
+            except (PdfError, ValueError, LookupError, TypeError, zlib.error) as e:
+                logging.debug(f"Cannot locate the streams of {self.filename}: {e}")
+                spans = []
+            for num, dictionary, offset, length in spans:
+                regions.append(Region(stream_name(num, dictionary), offset, length))
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = data.rfind(END_OF_FILE)
+                if end >= 0:
+                    end += len(END_OF_FILE)
+                    while data[end : end + 1] in (b"\r", b"\n"):
+                        end += 1
+                    if end < len(data):
+                        regions.append(Region("trailing data", end, len(data) - end))
+        return regions
 
     def set_field(self, field: str, value: Any) -> None:
         super().set_field(field, value)
@@ -59,11 +122,29 @@ class PDFParser(BaseParser):
             raise ValueError("Bad name for field")
         del self.metadata[field]
 
-    def write(self) -> None:
+    def clear(self) -> None:
+        # the disclaimer is not a real field, so the generic clear cannot be used
+        self.metadata.clear()
+
+    def _write(self) -> None:
+        if self.__document is None or self.options.get(OPTION_COMPACT):
+            self.__write_full()
+            return
+
+        with atomic.patch(self.filename) as f:
+            self.__document.append_info(f, self.metadata)
+            # later writes have to chain to the section that was just appended
+            self.__document = PdfDocument(f)
+        self.written_in_place = True
+
+    def __write_full(self) -> None:
+        from PyPDF2 import PdfFileMerger  # type: ignore
+
         pdf_merger = PdfFileMerger()
         pdf_merger.append(self.filename)
         pdf_merger.addMetadata(self.metadata)
-        pdf_merger.write(self.filename)
+        with atomic.replace(self.filename) as f:
+            pdf_merger.write(f)
 
     def get_all_values(self) -> Dict[str, str]:
         return self.metadata
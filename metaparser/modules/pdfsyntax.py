@@ -0,0 +1,678 @@
+"""Minimal PDF object reader and writer for the document information dictionary
+
+Only the trailer, the cross-reference sections and the objects they point to are
+read, the page tree and content streams are never loaded.
+"""
+import os
+import re
+import zlib
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+WHITESPACE = b"\x00\t\n\x0c\r "
+DELIMITERS = b"()<>[]{}/%"
+# bytes the tail of the file is searched for the startxref keyword
+TAIL_SIZES = [1024, 64 * 1024]
+# first read when loading an indirect object, grown until the object fits
+OBJECT_WINDOW = 4096
+
+# PDFDocEncoding characters that differ from Latin-1
+PDF_DOC_ENCODING = {
+    0x18: "˘",
+    0x19: "ˇ",
+    0x1A: "ˆ",
+    0x1B: "˙",
+    0x1C: "˝",
+    0x1D: "˛",
+    0x1E: "˚",
+    0x1F: "˜",
+    0x80: "•",
+    0x81: "†",
+    0x82: "‡",
+    0x83: "…",
+    0x84: "—",
+    0x85: "–",
+    0x86: "ƒ",
+    0x87: "⁄",
+    0x88: "‹",
+    0x89: "›",
+    0x8A: "−",
+    0x8B: "‰",
+    0x8C: "„",
+    0x8D: "“",
+    0x8E: "”",
+    0x8F: "‘",
+    0x90: "’",
+    0x91: "‚",
+    0x92: "™",
+    0x93: "ﬁ",
+    0x94: "ﬂ",
+    0x95: "Ł",
+    0x96: "Œ",
+    0x97: "Š",
+    0x98: "Ÿ",
+    0x99: "Ž",
+    0x9A: "ı",
+    0x9B: "ł",
+    0x9C: "œ",
+    0x9D: "š",
+    0x9E: "ž",
+    0xA0: "€",
+}
+PDF_DOC_DECODING = {v: k for k, v in PDF_DOC_ENCODING.items()}
+
+ESCAPES = {
+    ord("n"): b"\n",
+    ord("r"): b"\r",
+    ord("t"): b"\t",
+    ord("b"): b"\b",
+    ord("f"): b"\f",
+    ord("("): b"(",
+    ord(")"): b")",
+    ord("\\"): b"\\",
+}
+
+# entries of a cross-reference stream dictionary that do not belong to the trailer
+XREF_STREAM_KEYS = [
+    "/Type",
+    "/W",
+    "/Index",
+    "/Length",
+    "/Filter",
+    "/DecodeParms",
+    "/Prev",
+    "/XRefStm",
+]
+
+OBJECT_HEADER = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+NUMBER = re.compile(rb"[+-]?(\d+\.?\d*|\.\d+)$")
+
+
+class PdfError(Exception):
+    """The file cannot be handled without a full PDF library"""
+
+
+class Incomplete(Exception):
+    """More data is needed to parse the object"""
+
+
+class Name(str):
+    """PDF name object, stored with its leading slash"""
+
+
+class Reference:
+    def __init__(self, num: int, gen: int) -> None:
+        self.num = num
+        self.gen = gen
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, Reference)
+            and self.num == other.num
+            and self.gen == other.gen
+        )
+
+    def __hash__(self) -> int:
+        return hash((self.num, self.gen))
+
+    def __repr__(self) -> str:
+        return f"{self.num} {self.gen} R"
+
+
+class Stream:
+    def __init__(self, dictionary: Dict[str, Any], data: bytes) -> None:
+        self.dictionary = dictionary
+        self.data = data
+
+
+def decode_text(raw: bytes) -> str:
+    if raw.startswith(b"\xfe\xff"):
+        return raw[2:].decode("utf-16-be", errors="replace")
+    if raw.startswith(b"\xef\xbb\xbf"):
+        return raw[3:].decode("utf-8", errors="replace")
+    return "".join(PDF_DOC_ENCODING.get(b, chr(b)) for b in raw)
+
+
+def encode_text(text: str) -> bytes:
+    try:
+        return bytes(PDF_DOC_DECODING.get(c, ord(c)) for c in text)
+    except ValueError:  # not representable in PDFDocEncoding
+        return b"\xfe\xff" + text.encode("utf-16-be")
+
+
+class ObjectParser:
+    def __init__(self, data: bytes, final: bool = True) -> None:
+        self.data = data
+        # whether data ends with the file, otherwise running out of it is Incomplete
+        self.final = final
+
+    def skip_whitespace(self, pos: int) -> int:
+        data = self.data
+        while pos < len(data):
+            if data[pos] in WHITESPACE:
+                pos += 1
+            elif data[pos] == ord("%"):
+                while pos < len(data) and data[pos] not in b"\r\n":
+                    pos += 1
+            else:
+                return pos
+        raise Incomplete()
+
+    def read_token(self, pos: int) -> Tuple[bytes, int]:
+        start = pos
+        data = self.data
+        while pos < len(data) and data[pos] not in WHITESPACE + DELIMITERS:
+            pos += 1
+        if pos == len(data) and not self.final:
+            raise Incomplete()
+        return data[start:pos], pos
+
+    def parse(self, pos: int) -> Tuple[Any, int]:
+        pos = self.skip_whitespace(pos)
+        data = self.data
+        if data.startswith(b"<<", pos):
+            return self.parse_dictionary(pos + 2)
+        char = data[pos : pos + 1]
+        if char == b"<":
+            return self.parse_hex_string(pos + 1)
+        if char == b"(":
+            return self.parse_literal_string(pos + 1)
+        if char == b"[":
+            return self.parse_array(pos + 1)
+        if char == b"/":
+            return self.parse_name(pos + 1)
+
+        token, end = self.read_token(pos)
+        if token == b"true":
+            return True, end
+        if token == b"false":
+            return False, end
+        if token == b"null":
+            return None, end
+        if not NUMBER.match(token):
+            raise PdfError(f"Unexpected token {token[:20]!r} at {pos}")
+        if b"." in token:
+            return float(token), end
+
+        # an integer might be the start of an indirect reference "num gen R"
+        try:
+            gen_pos = self.skip_whitespace(end)
+            gen, gen_end = self.read_token(gen_pos)
+            if gen.isdigit():
+                r_pos = self.skip_whitespace(gen_end)
+                if self.data[r_pos : r_pos + 1] == b"R":
+                    return Reference(int(token), int(gen)), r_pos + 1
+        except Incomplete:
+            if not self.final:
+                raise
+        return int(token), end
+
+    def parse_dictionary(self, pos: int) -> Tuple[Dict[str, Any], int]:
+        result: Dict[str, Any] = {}
+        while True:
+            pos = self.skip_whitespace(pos)
+            if self.data.startswith(b">>", pos):
+                return result, pos + 2
+            key, pos = self.parse(pos)
+            if not isinstance(key, Name):
+                raise PdfError(f"Dictionary key is not a name at {pos}")
+            result[key], pos = self.parse(pos)
+
+    def parse_array(self, pos: int) -> Tuple[List[Any], int]:
+        result: List[Any] = []
+        while True:
+            pos = self.skip_whitespace(pos)
+            if self.data[pos : pos + 1] == b"]":
+                return result, pos + 1
+            value, pos = self.parse(pos)
+            result.append(value)
+
+    def parse_name(self, pos: int) -> Tuple[Name, int]:
+        token, end = self.read_token(pos)
+        name = re.sub(rb"#([0-9a-fA-F]{2})", lambda m: bytes([int(m[1], 16)]), token)
+        return Name("/" + name.decode("utf-8", errors="replace")), end
+
+    def parse_hex_string(self, pos: int) -> Tuple[bytes, int]:
+        end = self.data.find(b">", pos)
+        if end < 0:
+            raise Incomplete()
+        digits = bytes(c for c in self.data[pos:end] if c not in WHITESPACE)
+        if len(digits) % 2:
+            digits += b"0"
+        return bytes.fromhex(digits.decode("ascii")), end + 1
+
+    def parse_literal_string(self, pos: int) -> Tuple[bytes, int]:
+        data = self.data
+        result = bytearray()
+        depth = 1
+        while True:
+            if pos >= len(data):
+                raise Incomplete()
+            char = data[pos]
+            if char == ord("\\"):
+                pos += 1
+                if pos >= len(data):
+                    raise Incomplete()
+                char = data[pos]
+                if char in ESCAPES:
+                    result += ESCAPES[char]
+                    pos += 1
+                elif char in b"01234567":
+                    end = pos
+                    while end < pos + 3 and data[end : end + 1].isdigit():
+                        end += 1
+                    result.append(int(data[pos:end], 8) & 0xFF)
+                    pos = end
+                elif char in b"\r\n":  # line continuation
+                    pos += 2 if data.startswith(b"\r\n", pos) else 1
+                else:
+                    pos += 1
+                continue
+            if char == ord("("):
+                depth += 1
+            elif char == ord(")"):
+                depth -= 1
+                if depth == 0:
+                    return bytes(result), pos + 1
+            elif char == ord("\r"):  # end of lines are normalized to \n
+                char = ord("\n")
+                if data.startswith(b"\r\n", pos):
+                    pos += 1
+            result.append(char)
+            pos += 1
+
+
+def serialize(value: Any) -> bytes:
+    if isinstance(value, Name):
+        return b"/" + re.sub(
+            rb"[^!-~]|[()<>\[\]{}/%#]",
+            lambda m: b"#%02X" % m[0][0],
+            value[1:].encode("utf-8"),
+        )
+    if isinstance(value, str):
+        return serialize(encode_text(value))
+    if isinstance(value, bytes):
+        if all(32 <= b < 127 for b in value):
+            escaped = re.sub(rb"([()\\])", rb"\\\1", value)
+            return b"(" + escaped + b")"
+        return b"<" + value.hex().upper().encode("ascii") + b">"
+    if isinstance(value, bool):
+        return b"true" if value else b"false"
+    if value is None:
+        return b"null"
+    if isinstance(value, (int, float)):
+        return str(value).encode("ascii")
+    if isinstance(value, Reference):
+        return f"{value.num} {value.gen} R".encode("ascii")
+    if isinstance(value, list):
+        return b"[" + b" ".join(serialize(v) for v in value) + b"]"
+    if isinstance(value, dict):
+        items = b" ".join(
+            serialize(Name(k)) + b" " + serialize(v) for k, v in value.items()
+        )
+        return b"<< " + items + b" >>"
+    raise PdfError(f"Cannot serialize {type(value).__name__}")
+
+
+def png_unpredict(data: bytes, columns: int) -> bytes:
+    result = bytearray()
+    previous = bytearray(columns)
+    for start in range(0, len(data), columns + 1):
+        kind = data[start]
+        row = bytearray(data[start + 1 : start + 1 + columns])
+        for i in range(len(row)):
+            left = row[i - 1] if i else 0
+            up = previous[i]
+            up_left = previous[i - 1] if i else 0
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                predictor = (
+                    left if pa <= pb and pa <= pc else up if pb <= pc else up_left
+                )
+                row[i] = (row[i] + predictor) & 0xFF
+            elif kind != 0:
+                raise PdfError(f"Unknown PNG predictor {kind}")
+        result += row
+        previous = row
+    return bytes(result)
+
+
+def decode_stream(stream: Stream) -> bytes:
+    filters = stream.dictionary.get("/Filter", [])
+    params = stream.dictionary.get("/DecodeParms", [])
+    if not isinstance(filters, list):
+        filters = [filters]
+    if not isinstance(params, list):
+        params = [params]
+
+    data = stream.data
+    for i, name in enumerate(filters):
+        if name != "/FlateDecode":
+            raise PdfError(f"Unsupported stream filter {name}")
+        data = zlib.decompress(data)
+        param = params[i] if i < len(params) and params[i] else {}
+        predictor = param.get("/Predictor", 1)
+        if predictor >= 10:
+            colors = param.get("/Colors", 1) * param.get("/BitsPerComponent", 8) // 8
+            data = png_unpredict(data, param.get("/Columns", 1) * colors)
+        elif predictor != 1:
+            raise PdfError(f"Unsupported predictor {predictor}")
+    return data
+
+
+class XrefSection:
+    """A single cross-reference table or stream, with the trailer it belongs to"""
+
+    def __init__(self, trailer: Dict[str, Any]) -> None:
+        self.trailer = trailer
+        # classic tables as (first object, count, position of the entries, width)
+        self.subsections: List[Tuple[int, int, int, int]] = []
+        # decoded cross-reference stream entries as object -> (type, field 2, field 3)
+        self.entries: Dict[int, Tuple[int, int, int]] = {}
+
+
+class PdfDocument:
+    """Reads the trailer and document information of a PDF through its xref"""
+
+    def __init__(self, file: BinaryIO) -> None:
+        # only used while reading, the document is not kept open
+        self.file = file
+        file.seek(0, os.SEEK_END)
+        self.size = file.tell()
+        self.startxref = self.find_startxref()
+        self.sections: List[XrefSection] = []
+
+        offset: Optional[int] = self.startxref
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            section = self.read_section(offset)
+            self.sections.append(section)
+            hybrid = section.trailer.get("/XRefStm")
+            if isinstance(hybrid, int) and hybrid not in seen:
+                seen.add(hybrid)
+                self.sections.append(self.read_section(hybrid))
+            offset = section.trailer.get("/Prev")
+
+        self.trailer = self.sections[0].trailer
+        self.uses_xref_stream = self.trailer.get("/Type") == "/XRef"
+        if "/Encrypt" in self.trailer:
+            raise PdfError("Encrypted documents are not supported")
+
+    def read(self, offset: int, size: int) -> bytes:
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def find_startxref(self) -> int:
+        for size in TAIL_SIZES:
+            tail = self.read(max(self.size - size, 0), size)
+            position = tail.rfind(b"startxref")
+            if position >= 0:
+                parser = ObjectParser(tail)
+                token, _ = parser.read_token(parser.skip_whitespace(position + 9))
+                return int(token)
+        raise PdfError("startxref not found")
+
+    def read_section(self, offset: int) -> XrefSection:
+        head = self.read(offset, 4)
+        if head == b"xref":
+            return self.read_table(offset + 4)
+        stream = self.read_object_at(offset)
+        if not isinstance(stream, Stream) or stream.dictionary.get("/Type") != "/XRef":
+            raise PdfError(f"No cross-reference section at {offset}")
+        return self.read_stream_section(stream)
+
+    def read_table(self, pos: int) -> XrefSection:
+        subsections = []
+        while True:
+            line = self.read(pos, 64)
+            parser = ObjectParser(line, final=False)
+            start = parser.skip_whitespace(0)
+            if line.startswith(b"trailer", start):
+                trailer = self.read_object_at(pos + start + 7, header=False)
+                if not isinstance(trailer, dict):
+                    raise PdfError("Invalid trailer")
+                break
+            first, end = parser.read_token(start)
+            count, end = parser.read_token(parser.skip_whitespace(end))
+            # the entries start on the next line and should be 20 bytes each,
+            # some writers use a single byte end of line instead
+            while line[end : end + 1] in (b" ", b"\r", b"\n"):
+                end += 1
+            entry = self.read(pos + end, 21)
+            single_eol = entry[18:19] in (b"\r", b"\n") and entry[18:20] != b"\r\n"
+            width = 19 if single_eol else 20
+            subsections.append((int(first), int(count), pos + end, width))
+            pos += end + int(count) * width
+
+        section = XrefSection(trailer)
+        section.subsections = subsections
+        return section
+
+    def read_stream_section(self, stream: Stream) -> XrefSection:
+        dictionary = stream.dictionary
+        data = decode_stream(stream)
+        widths = dictionary["/W"]
+        index = dictionary.get("/Index", [0, dictionary["/Size"]])
+
+        section = XrefSection(dictionary)
+        pos = 0
+        for first, count in zip(index[::2], index[1::2]):
+            for num in range(first, first + count):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[pos : pos + width], "big"))
+                    pos += width
+                kind = fields[0] if widths[0] else 1
+                section.entries[num] = (kind, fields[1], fields[2])
+        if pos > len(data):
+            raise PdfError("Truncated cross-reference stream")
+        return section
+
+    def lookup(self, num: int) -> Optional[Tuple[int, int, int]]:
+        """Find the newest xref entry of an object as (type, field 2, field 3)"""
+        for section in self.sections:
+            if num in section.entries:
+                return section.entries[num]
+            for first, count, pos, width in section.subsections:
+                if first <= num < first + count:
+                    entry = self.read(pos + (num - first) * width, width).split()
+                    kind = 1 if entry[2] == b"n" else 0
+                    return kind, int(entry[0]), int(entry[1])
+        return None
+
+    def get_object(self, reference: Reference) -> Any:
+        entry = self.lookup(reference.num)
+        if entry is None or entry[0] == 0:
+            return None
+        if entry[0] == 1:
+            return self.read_object_at(entry[1])
+        return self.read_compressed_object(entry[1], entry[2])
+
+    def resolve(self, value: Any) -> Any:
+        if isinstance(value, Reference):
+            return self.get_object(value)
+        return value
+
+    def read_object_at(self, offset: int, header: bool = True) -> Any:
+        return self.read_growing(
+            offset, lambda data, final: self.parse_indirect(data, final, header)
+        )
+
+    def read_growing(self, offset: int, parse: Callable[[bytes, bool], Any]) -> Any:
+        """Parse what starts at offset, reading more of the file until it fits"""
+        window = OBJECT_WINDOW
+        while True:
+            data = self.read(offset, window)
+            final = len(data) < window
+            try:
+                return parse(data, final)
+            except Incomplete:
+                if final:
+                    raise PdfError(f"Truncated object at {offset}")
+                window *= 4
+
+    def parse_indirect(self, data: bytes, final: bool, header: bool) -> Any:
+        if not header:
+            return ObjectParser(data, final).parse(0)[0]
+
+        value, pos = self.parse_head(data, final)
+        if pos is None:
+            return value
+        length = self.stream_length(value)
+        if pos + length > len(data):
+            if final:
+                raise PdfError("Truncated stream")
+            raise Incomplete()
+        return Stream(value, data[pos : pos + length])
+
+    @staticmethod
+    def parse_head(data: bytes, final: bool) -> Tuple[Any, Optional[int]]:
+        """Parse an indirect object up to the data of a stream
+
+        Return the object, the dictionary of a stream, and the position of the
+        stream data, None if the object is not a stream.
+        """
+        match = OBJECT_HEADER.match(data)
+        if not match:
+            raise PdfError("Missing object header")
+        parser = ObjectParser(data, final)
+        value, pos = parser.parse(match.end())
+        if not isinstance(value, dict):
+            return value, None
+
+        pos = parser.skip_whitespace(pos)
+        if len(data) < pos + 8 and not final:
+            raise Incomplete()
+        if not data.startswith(b"stream", pos):
+            return value, None
+        pos += 6
+        pos += 2 if data.startswith(b"\r\n", pos) else 1
+        return value, pos
+
+    def stream_length(self, dictionary: Dict[str, Any]) -> int:
+        length = self.resolve(dictionary.get("/Length"))
+        if not isinstance(length, int):
+            raise PdfError("Stream without length")
+        return length
+
+    def object_offsets(self) -> Dict[int, int]:
+        """Return the offsets of the objects not stored in object streams"""
+        offsets: Dict[int, int] = {}
+        # the oldest section first, the entries of newer ones replace its
+        for section in reversed(self.sections):
+            entries = dict(section.entries)
+            for first, count, pos, width in section.subsections:
+                table = self.read(pos, count * width)
+                for i in range(count):
+                    entry = table[i * width : (i + 1) * width].split()
+                    if len(entry) == 3:
+                        kind = 1 if entry[2] == b"n" else 0
+                        entries[first + i] = (kind, int(entry[0]), int(entry[1]))
+            for num, (kind, offset, _) in entries.items():
+                if kind == 1:
+                    offsets[num] = offset
+                else:
+                    offsets.pop(num, None)
+        return offsets
+
+    def stream_spans(self) -> List[Tuple[int, Dict[str, Any], int, int]]:
+        """Return the number, dictionary, data offset and length of every stream
+
+        Only the dictionaries are read, never the data of the streams.
+        """
+        spans = []
+        for num, offset in sorted(self.object_offsets().items()):
+            value, pos = self.read_growing(offset, self.parse_head)
+            if pos is not None:
+                spans.append((num, value, offset + pos, self.stream_length(value)))
+        return spans
+
+    def read_compressed_object(self, stream_num: int, index: int) -> Any:
+        stream = self.get_object(Reference(stream_num, 0))
+        if not isinstance(stream, Stream):
+            raise PdfError(f"Object stream {stream_num} not found")
+        data = decode_stream(stream)
+        first = stream.dictionary["/First"]
+        numbers = data[:first].split()
+        offset = int(numbers[index * 2 + 1])
+        return ObjectParser(data).parse(first + offset)[0]
+
+    def info_reference(self) -> Optional[Reference]:
+        reference = self.trailer.get("/Info")
+        return reference if isinstance(reference, Reference) else None
+
+    def info(self) -> Dict[str, Any]:
+        """Return the document information with strings decoded as text"""
+        info = self.resolve(self.trailer.get("/Info"))
+        if not isinstance(info, dict):
+            return {}
+        result = {}
+        for key, value in info.items():
+            value = self.resolve(value)
+            if isinstance(value, bytes):
+                value = decode_text(value)
+            result[key] = value
+        return result
+
+    def append_info(self, file: BinaryIO, info: Dict[str, Any]) -> None:
+        """Save a new information dictionary as an incremental update"""
+        reference = self.info_reference()
+        size = self.trailer.get("/Size", 0)
+        if reference is None:
+            reference = Reference(size, 0)
+        size = max(size, reference.num + 1)
+
+        file.seek(-1, os.SEEK_END)
+        if file.read(1) not in (b"\n", b"\r"):
+            file.write(b"\n")
+        info_offset = file.tell()
+        file.write(b"%d %d obj\n" % (reference.num, reference.gen))
+        file.write(serialize(info) + b"\nendobj\n")
+
+        trailer = {k: v for k, v in self.trailer.items() if k not in XREF_STREAM_KEYS}
+        trailer["/Info"] = reference
+        trailer["/Prev"] = self.startxref
+
+        xref_offset = file.tell()
+        if self.uses_xref_stream:
+            # files with cross-reference streams are updated with a stream as well
+            xref_num = size
+            trailer["/Size"] = size + 1
+            entries = [(reference.num, info_offset, reference.gen)]
+            entries.append((xref_num, xref_offset, 0))
+            self.write_xref_stream(file, xref_num, trailer, entries)
+        else:
+            trailer["/Size"] = size
+            # the free list head is repeated, some readers expect every section to
+            # start with object 0
+            file.write(b"xref\n0 1\n0000000000 65535 f\r\n%d 1\n" % reference.num)
+            file.write(b"%010d %05d n\r\n" % (info_offset, reference.gen))
+            file.write(b"trailer\n" + serialize(trailer) + b"\n")
+        file.write(b"startxref\n%d\n%%%%EOF\n" % xref_offset)
+
+    @staticmethod
+    def write_xref_stream(
+        file: BinaryIO,
+        num: int,
+        trailer: Dict[str, Any],
+        entries: List[Tuple[int, int, int]],
+    ) -> None:
+        offset_width = max(4, (max(e[1] for e in entries).bit_length() + 7) // 8)
+        data = b"".join(
+            b"\x01" + offset.to_bytes(offset_width, "big") + gen.to_bytes(2, "big")
+            for _, offset, gen in sorted(entries)
+        )
+        dictionary = dict(trailer)
+        dictionary["/Type"] = Name("/XRef")
+        dictionary["/W"] = [1, offset_width, 2]
+        dictionary["/Index"] = [i for num, _, _ in sorted(entries) for i in (num, 1)]
+        dictionary["/Length"] = len(data)
+        file.write(b"%d 0 obj\n" % num + serialize(dictionary) + b"\nstream\n")
+        file.write(data + b"\nendstream\nendobj\n")
@@ -0,0 +1,116 @@
+import csv
+import json
+import sys
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, TextIO, Type
+
+from .engine import FileResult
+
+FORMAT_TEXT = "text"
+FORMAT_NDJSON = "ndjson"
+FORMAT_JSON = "json"
+FORMAT_CSV = "csv"
+FORMATS = [FORMAT_TEXT, FORMAT_NDJSON, FORMAT_JSON, FORMAT_CSV]
+
+CSV_COLUMNS = ["path", "mime", "parser", "field", "value", "seconds", "error"]
+
+
+def create_record(result: FileResult, fields: Any = None) -> Dict[str, Any]:
+    """Return the structured record of a processed file
+
+    fields holds the encoded values, or the field names for the fields command,
+    and is None for files without a parser.
+    """
+    return {
+        "path": result.path,
+        "mime": result.mime,
+        "parser": result.parser,
+        "fields": fields,
+        "cached": result.cached,
+        "timings": result.timings,
+        "error": result.error,
+    }
+
+
+class RecordWriter(ABC):
+    """Writes one record per file, each record is flushed as soon as it is written"""
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+
+    @abstractmethod
+    def write(self, record: Dict[str, Any]) -> None:
+        pass
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+class NdjsonWriter(RecordWriter):
+    def write(self, record: Dict[str, Any]) -> None:
+        self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+class JsonWriter(RecordWriter):
+    """Writes a JSON array, streamed element by element"""
+
+    def __init__(self, stream: TextIO) -> None:
+        super().__init__(stream)
+        self.count = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        separator = ",\n" if self.count else "[\n"
+        self.stream.write(separator + json.dumps(record, ensure_ascii=False))
+        self.stream.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        self.stream.write("\n]\n" if self.count else "[]\n")
+        super().close()
+
+
+class CsvWriter(RecordWriter):
+    """Writes a row per field, strings are written as is and other values as JSON
+
+    Files without fields get a single row with empty field and value columns.
+    """
+
+    def __init__(self, stream: TextIO) -> None:
+        super().__init__(stream)
+        self.writer = csv.writer(stream)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        prefix = [record["path"], record["mime"], record["parser"]]
+        suffix = [record["timings"].get("total"), record["error"]]
+        fields = record["fields"]
+        rows: List[List[Any]] = []
+        if isinstance(fields, dict):
+            rows = [[k, encode_cell(v)] for k, v in fields.items()]
+        elif isinstance(fields, list):
+            rows = [[field, None] for field in fields]
+        for row in rows or [[None, None]]:
+            self.writer.writerow(prefix + row + suffix)
+        self.stream.flush()
+
+
+def encode_cell(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+WRITERS: Dict[str, Type[RecordWriter]] = {
+    FORMAT_NDJSON: NdjsonWriter,
+    FORMAT_JSON: JsonWriter,
+    FORMAT_CSV: CsvWriter,
+}
+
+
+def create_writer(
+    output_format: str, stream: Optional[TextIO] = None
+) -> Optional[RecordWriter]:
+    """Return the writer for a structured format, None for text output"""
+    writer = WRITERS.get(output_format)
+    return writer(stream or sys.stdout) if writer is not None else None
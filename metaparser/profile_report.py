@@ -0,0 +1,159 @@
+"""Aggregation of the file profiles of a run into the --profile report"""
+import bisect
+import cProfile
+import heapq
+import os
+import pstats
+import shutil
+import tempfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .engine import FileResult
+from .profiling import READ_BYTES, STAGES, WRITTEN_BYTES, Profile
+
+# upper bounds of the latency histogram buckets, 1 ms doubling up to about 16 s
+BUCKETS = [0.001 * 2**i for i in range(15)]
+DEFAULT_SLOWEST = 10
+HISTOGRAM_WIDTH = 40
+
+
+class Latencies:
+    """Histogram of the total seconds spent on the files of a parser"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        # the last bucket counts the files slower than all the bounds
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.stages: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+
+    def add(self, seconds: float, profile: Dict[str, float]) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        for stage in STAGES:
+            self.stages[stage] += profile.get(stage, 0.0)
+
+    def percentile(self, fraction: float) -> float:
+        """Upper bound of the bucket the percentile falls into"""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+
+class Profiler(Profile):
+    """Aggregates the profiles of the files of a run into the --profile report
+
+    With a stats file the run is also profiled with cProfile: the main process
+    while the profiler is entered, and the worker processes chunk by chunk.
+    """
+
+    def __init__(
+        self, slowest: int = DEFAULT_SLOWEST, stats_file: Optional[str] = None
+    ) -> None:
+        super().__init__()
+        self.slowest = slowest
+        self.stats_file = stats_file
+        self.parsers: Dict[str, Latencies] = {}
+        self.read_bytes = 0
+        self.written_bytes = 0
+        self.__slowest: List[Tuple[float, str]] = []
+        self.__profile: Optional[cProfile.Profile] = None
+
+    def __enter__(self) -> "Profiler":
+        if self.stats_file is not None:
+            self.stats_directory = tempfile.mkdtemp(prefix="metaparser-profile-")
+            self.__profile = cProfile.Profile()
+            self.__profile.enable()
+        return self
+
+    def __exit__(self, *args) -> None:
+        directory = self.stats_directory
+        if self.__profile is None or self.stats_file is None or directory is None:
+            return
+
+        self.__profile.disable()
+        stats = pstats.Stats(self.__profile)
+        for name in os.listdir(directory):
+            stats.add(os.path.join(directory, name))
+        stats.dump_stats(self.stats_file)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def add(self, result: FileResult) -> None:
+        if result.profile is None:
+            # processed from the cache, nothing was parsed
+            return
+
+        seconds = result.timings.get("total", 0.0)
+        parser = result.parser or "(none)"
+        self.parsers.setdefault(parser, Latencies()).add(seconds, result.profile)
+        self.read_bytes += int(result.profile.get(READ_BYTES, 0))
+        self.written_bytes += int(result.profile.get(WRITTEN_BYTES, 0))
+        if len(self.__slowest) < self.slowest:
+            heapq.heappush(self.__slowest, (seconds, result.path))
+        elif self.slowest:
+            heapq.heappushpop(self.__slowest, (seconds, result.path))
+
+    def report(self) -> List[str]:
+        """Return the lines of the report"""
+        lines = ["Profile:"]
+        write = lines.append
+        for name, latencies in sorted(self.parsers.items()):
+            mean = latencies.total / latencies.count
+            write(
+                f"{name}: {latencies.count} file(s), mean {format_seconds(mean)}, "
+                f"p50 <= {format_seconds(latencies.percentile(0.5))}, "
+                f"p90 <= {format_seconds(latencies.percentile(0.9))}, "
+                f"p99 <= {format_seconds(latencies.percentile(0.99))}, "
+                f"max {format_seconds(latencies.max)}"
+            )
+            stages = ", ".join(
+                f"{stage} {format_seconds(seconds / latencies.count)}"
+                for stage, seconds in latencies.stages.items()
+            )
+            write(f"  mean per stage: {stages}")
+            for line in histogram(latencies.buckets):
+                write(f"  {line}")
+
+        read = format_bytes(self.read_bytes)
+        write(f"read {read}, written {format_bytes(self.written_bytes)}")
+        if self.__slowest:
+            write(f"slowest {len(self.__slowest)} file(s):")
+            for seconds, path in sorted(self.__slowest, reverse=True):
+                write(f"  {format_seconds(seconds)} {path}")
+        if self.stats_file is not None:
+            write(f"cProfile stats saved to {self.stats_file}")
+        return lines
+
+
+def histogram(buckets: List[int]) -> Iterator[str]:
+    largest = max(buckets)
+    for i, count in enumerate(buckets):
+        if not count:
+            continue
+        label = f"<= {format_seconds(BUCKETS[i])}" if i < len(BUCKETS) else "slower"
+        bar = "#" * max(1, count * HISTOGRAM_WIDTH // largest)
+        yield f"{label:>10} {count:>7} {bar}"
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 0.001:
+        return f"{seconds * 1000000:.0f} us"
+    if seconds < 1:
+        return f"{seconds * 1000:.1f} ms"
+    return f"{seconds:.2f} s"
+
+
+def format_bytes(size: int) -> str:
+    value = float(size)
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TiB"
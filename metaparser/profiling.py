@@ -0,0 +1,129 @@
+"""Timing hooks around the processing stages of a file
+
+The hooks only check a global while no file is being profiled, so they can stay
+on the hot paths. Files are profiled inside record(), which collects the seconds
+spent in every stage and the bytes the process read and wrote meanwhile.
+"""
+import contextlib
+import cProfile
+import functools
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple, TypeVar
+
+STAGE_SNIFF = "sniff"
+STAGE_PARSE = "parse"
+STAGE_MUTATE = "mutate"
+STAGE_WRITE = "write"
+STAGES = [STAGE_SNIFF, STAGE_PARSE, STAGE_MUTATE, STAGE_WRITE]
+
+# bytes passed to read and write calls, taken from /proc/self/io on Linux
+READ_BYTES = "read_bytes"
+WRITTEN_BYTES = "written_bytes"
+
+# profile of the file being processed, None while profiling is off
+_current: Optional[Dict[str, float]] = None
+# stages being timed, nested hooks of the same stage are only counted once, eg.
+# set_field of a parser calling the one of BaseParser
+_running: Set[str] = set()
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def timed(stage: str) -> Callable[[F], F]:
+    """Decorate a function to add the time spent in it to the stage"""
+
+    def decorate(function: F) -> F:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current is None or stage in _running:
+                return function(*args, **kwargs)
+
+            _running.add(stage)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _running.discard(stage)
+                profile = _current
+                if profile is not None:
+                    seconds = time.perf_counter() - start
+                    profile[stage] = profile.get(stage, 0.0) + seconds
+
+        return wrapper  # type: ignore
+
+    return decorate
+
+
+def io_counters() -> Optional[Tuple[int, int]]:
+    """Return the bytes read and written by the process, None if unknown"""
+    try:
+        with open("/proc/self/io", "rb") as f:
+            lines = f.read().split(b"\n")
+    except OSError:
+        return None
+
+    counters: Dict[bytes, int] = {}
+    for line in lines:
+        name, _, value = line.partition(b": ")
+        if value:
+            counters[name] = int(value)
+    return counters[b"rchar"], counters[b"wchar"]
+
+
+@contextlib.contextmanager
+def record(profile: Optional[Dict[str, float]]) -> Iterator[None]:
+    """Collect the stage timings and I/O of the block into profile, if not None"""
+    global _current
+    if profile is None:
+        yield
+        return
+
+    previous, _current = _current, profile
+    before = io_counters()
+    try:
+        yield
+    finally:
+        _current = previous
+        after = io_counters()
+        if before is not None and after is not None:
+            profile[READ_BYTES] = after[0] - before[0]
+            profile[WRITTEN_BYTES] = after[1] - before[1]
+
+
+class Profile:
+    """Profiling settings of a run, see profile_report.Profiler"""
+
+    def __init__(self) -> None:
+        # worker processes dump their cProfile stats to this directory, None if
+        # the run is not profiled with cProfile
+        self.stats_directory: Optional[str] = None
+
+
+# cProfile of a worker process and the directory its stats are dumped to
+_worker_profile: Optional[cProfile.Profile] = None
+_worker_directory: Optional[str] = None
+
+
+def start_worker(directory: Optional[str]) -> None:
+    """Profile the chunks of this worker process, if given a stats directory"""
+    global _worker_profile, _worker_directory
+    if directory is not None:
+        _worker_profile = cProfile.Profile()
+        _worker_directory = directory
+
+
+@contextlib.contextmanager
+def profile_chunk() -> Iterator[None]:
+    if _worker_profile is None or _worker_directory is None:
+        yield
+        return
+
+    _worker_profile.enable()
+    try:
+        yield
+    finally:
+        _worker_profile.disable()
+        # the stats are cumulative, the last dump of every worker is merged
+        path = os.path.join(_worker_directory, f"{os.getpid()}.prof")
+        _worker_profile.dump_stats(path)
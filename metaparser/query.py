@@ -0,0 +1,100 @@
+"""Predicates on the values of a file, used by the find command
+
+    FIELD=REGEX            a value of the field matches the regular expression
+    FIELD exists           the field has a non-empty value
+    entropy(FIELD)>X       a string value of the field has an entropy above X,
+                           <, >= and <= work too
+
+List values match if any of their elements does, other values are compared as
+strings. Field names are the ones print shows.
+"""
+import operator
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List
+
+import metaparser.utils as utils
+
+ENTROPY_PATTERN = re.compile(
+    r"entropy\((?P<field>.+)\)\s*(?P<op><=|>=|<|>)\s*(?P<x>.+)"
+)
+EXISTS_PATTERN = re.compile(r"(?P<field>[^=]+?)\s+exists")
+
+OPERATORS: Dict[str, Callable[[float, float], bool]] = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def texts(value: Any) -> List[str]:
+    """The strings a value is matched as"""
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value if v is not None]
+    return [] if value is None else [str(value)]
+
+
+class Predicate(ABC):
+    """A condition on the values of a single field"""
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+
+    @abstractmethod
+    def matches(self, values: Dict[str, Any]) -> bool:
+        pass
+
+
+class Exists(Predicate):
+    def matches(self, values: Dict[str, Any]) -> bool:
+        return any(texts(values.get(self.field)))
+
+
+class Matches(Predicate):
+    def __init__(self, field: str, pattern: str) -> None:
+        super().__init__(field)
+        self.pattern = re.compile(pattern)
+
+    def matches(self, values: Dict[str, Any]) -> bool:
+        return any(self.pattern.search(text) for text in texts(values.get(self.field)))
+
+
+class Entropy(Predicate):
+    def __init__(self, field: str, op: str, threshold: float) -> None:
+        super().__init__(field)
+        self.op = op
+        self.threshold = threshold
+
+    def matches(self, values: Dict[str, Any]) -> bool:
+        value = values.get(self.field)
+        items = value if isinstance(value, (list, tuple)) else [value]
+        strings = [v for v in items if isinstance(v, str)]
+        compare = OPERATORS[self.op]
+        return any(compare(e, self.threshold) for e in utils.entropies(strings))
+
+
+def parse(text: str) -> Predicate:
+    """Parse a predicate, raises ValueError if it is not valid"""
+    text = text.strip()
+    match = ENTROPY_PATTERN.fullmatch(text)
+    if match:
+        try:
+            threshold = float(match["x"])
+        except ValueError:
+            raise ValueError(f"{match['x']!r} is not a number") from None
+        return Entropy(match["field"].strip(), match["op"], threshold)
+
+    match = EXISTS_PATTERN.fullmatch(text)
+    if match:
+        return Exists(match["field"])
+
+    field, equals, pattern = text.partition("=")
+    if not equals or not field.strip():
+        raise ValueError(
+            f"{text!r} is not one of FIELD=REGEX, FIELD exists or entropy(FIELD)>X"
+        )
+    try:
+        return Matches(field.strip(), pattern)
+    except re.error as e:
+        raise ValueError(f"invalid regular expression {pattern!r}: {e}") from None
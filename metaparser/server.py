@@ -0,0 +1,184 @@
+"""Long running server answering metaparser requests on a Unix domain socket
+
+The server saves the interpreter startup, the imports and the libmagic setup on
+every file: an asyncio front end accepts the connections and hands each request
+to a pool of worker processes, which import all the parsers and open the
+libmagic handle once when they start. See client.py for the protocol.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import signal
+import socket
+import stat
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterator, Dict
+
+from . import client, engine, output, tasks
+from .modules.auto import REGISTRY
+from .modules.detect import detect_mime
+
+
+def create_task(message: Dict[str, Any]) -> engine.Task:
+    command = message.get("command")
+    field = str(message.get("field") or "")
+    options = message.get("options") or {}
+    if command in (client.COMMAND_SET, client.COMMAND_DELETE) and not field:
+        raise ValueError(f"{command} needs a field")
+    if command == client.COMMAND_SET and "value" not in message:
+        raise ValueError(f"{command} needs a value")
+
+    if command == client.COMMAND_DETECT:
+        return tasks.DetectTask(quiet=True)
+    if command == client.COMMAND_PRINT:
+        return tasks.PrintTask(quiet=True)
+    if command == client.COMMAND_SET:
+        return tasks.SetTask(field, message["value"], options)
+    if command == client.COMMAND_DELETE:
+        return tasks.DeleteTask(field, options)
+    if command == client.COMMAND_CLEAR:
+        return tasks.ClearTask(options)
+    raise ValueError(f"unknown command {command}")
+
+
+def handle(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Process a request in a worker process and return the record of the file"""
+    path = message.get("file")
+    if not isinstance(path, str) or not os.path.isabs(path):
+        raise ValueError("file has to be an absolute path")
+
+    task = create_task(message)
+    result = engine.process_file(task, path)
+    record = output.create_record(result, result.values)
+    record["modified"] = result.modified
+    record["in_place"] = result.in_place
+    return record
+
+
+def _warm_up() -> None:
+    # Ctrl+C reaches the whole process group, the server stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # imports every parser and opens the libmagic handle before the first request
+    REGISTRY.parsers()
+    detect_mime("", b"")
+
+
+def _ready() -> None:
+    pass
+
+
+def _claim(path: str) -> None:
+    """Remove the socket a server that did not shut down cleanly left at path
+
+    Raises FileExistsError when a server still answers on it or when it is not a
+    socket, they are never replaced.
+    """
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise FileExistsError(f"A server is already listening on {path}")
+
+
+class Server:
+    def __init__(self, path: str, jobs: int) -> None:
+        self.path = path
+        self.jobs = jobs or os.cpu_count() or 1
+        # requests on the same file are handled one after another, so concurrent
+        # writes cannot overwrite each other
+        self.__locks: Dict[str, asyncio.Lock] = {}
+        self.__users: Counter = Counter()
+        self.__executor: ProcessPoolExecutor
+
+    def serve(self) -> None:
+        """Serve requests until interrupted or terminated"""
+        asyncio.run(self.__serve())
+
+    async def __serve(self) -> None:
+        _claim(self.path)
+
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(self.jobs, initializer=_warm_up) as executor:
+            self.__executor = executor
+            await loop.run_in_executor(executor, _ready)
+            # the socket is created accessible to the user only, changing its mode
+            # after the bind would leave a window for other users to connect
+            umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(
+                    self.__connection, path=self.path, limit=client.MAX_LINE
+                )
+            finally:
+                os.umask(umask)
+            logging.info(f"Serving on {self.path} with {self.jobs} worker(s)")
+            stopped = loop.create_future()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, stopped.set_result, signum)
+            try:
+                async with server:
+                    signum = await stopped
+                    logging.info(f"Stopping on {signal.Signals(signum).name}")
+            finally:
+                os.unlink(self.path)
+
+    async def __connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.__respond(line)
+                data = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                writer.write(data + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            # ValueError is raised for lines longer than the limit
+            logging.warning(f"Dropping connection: {e}")
+        finally:
+            writer.close()
+
+    async def __respond(self, line: bytes) -> Dict[str, Any]:
+        try:
+            message = json.loads(line)
+            if not isinstance(message, dict):
+                raise ValueError("expected an object")
+            async with self.__lock(message.get("file")):
+                record = await asyncio.get_running_loop().run_in_executor(
+                    self.__executor, handle, message
+                )
+        except ValueError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            logging.error("Failed to handle request", exc_info=True)
+            return {"error": f"{type(e).__name__}: {e}"}
+
+        return {"record": record}
+
+    @contextlib.asynccontextmanager
+    async def __lock(self, path: Any) -> AsyncIterator[None]:
+        # links and relative parts of the path lead to the same lock
+        key = os.path.realpath(path) if isinstance(path, str) else str(path)
+        lock = self.__locks.setdefault(key, asyncio.Lock())
+        self.__users[key] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            # locks are dropped once nobody waits for them
+            self.__users[key] -= 1
+            if not self.__users[key]:
+                del self.__users[key]
+                del self.__locks[key]
@@ -0,0 +1,181 @@
+"""Mergeable sketches summarizing the values of a corpus in bounded memory
+
+Every sketch has a fixed size whatever the number of values added to it, two
+sketches of the same size merge into the one of all their values, so runs over
+parts of a corpus can be combined into a single report.
+"""
+import base64
+import hashlib
+import heapq
+import json
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+# registers of a HyperLogLog are 2**precision bytes, the standard error of its
+# estimates is about 1.04 / sqrt(2**precision), 1.6% for 4 KiB
+DEFAULT_PRECISION = 12
+# values a SpaceSaving counts, the top ones are exact when the corpus has fewer
+# distinct values, and close otherwise for the frequent ones
+DEFAULT_CAPACITY = 100
+# characters of a value kept by a SpaceSaving, longer ones are cut short
+MAX_VALUE_LENGTH = 200
+
+
+def hash64(value: str) -> int:
+    digest = hashlib.blake2b(value.encode("utf-8", "surrogatepass"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big")
+
+
+class HyperLogLog:
+    """Estimates the number of distinct values added"""
+
+    def __init__(self, precision: int = DEFAULT_PRECISION) -> None:
+        if not 4 <= precision <= 18:
+            raise ValueError("precision has to be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        x = hash64(value)
+        bits = 64 - self.precision
+        index = x >> bits
+        # position of the leftmost 1 in the remaining bits
+        rank = bits - (x & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches of different precisions")
+        self.registers = bytearray(
+            max(a, b) for a, b in zip(self.registers, other.registers)
+        )
+
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "precision": self.precision,
+            "registers": base64.b64encode(self.registers).decode("ascii"),
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "HyperLogLog":
+        sketch = HyperLogLog(data["precision"])
+        registers = base64.b64decode(data["registers"])
+        if len(registers) != len(sketch.registers):
+            raise ValueError("registers do not match the precision")
+        sketch.registers = bytearray(registers)
+        return sketch
+
+
+class SpaceSaving:
+    """Counts the most frequent values, see Metwally et al., Efficient
+    Computation of Frequent and Top-k Elements in Data Streams
+
+    A value added while all the counters are taken replaces the least counted
+    one and inherits its count, which becomes the error of the new value.
+    Counts are never underestimated and overestimated by at most their error.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        if capacity < 1:
+            raise ValueError("capacity has to be positive")
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # min-heap of (count, value) with one entry per counted value, counts only
+        # grow so an entry may be behind its value's count, it is only refreshed
+        # once it reaches the top
+        self.__heap: List[Tuple[int, str]] = []
+
+    def add(self, value: str, count: int = 1) -> None:
+        value = value[:MAX_VALUE_LENGTH]
+        if value in self.counts:
+            self.counts[value] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[value] = count
+            self.errors[value] = 0
+            heapq.heappush(self.__heap, (count, value))
+            return
+
+        floor, smallest = self.__smallest()
+        del self.counts[smallest]
+        del self.errors[smallest]
+        self.counts[value] = floor + count
+        self.errors[value] = floor
+        heapq.heapreplace(self.__heap, (floor + count, value))
+
+    def __smallest(self) -> Tuple[int, str]:
+        """Return the least count and its value, refreshing the entries on top"""
+        heap = self.__heap
+        while True:
+            count, value = heap[0]
+            current = self.counts[value]
+            if current == count:
+                return count, value
+            heapq.heapreplace(heap, (current, value))
+
+    def __heapify(self) -> None:
+        self.__heap = [(count, value) for value, count in self.counts.items()]
+        heapq.heapify(self.__heap)
+
+    def floor(self) -> int:
+        """Most times a value without a counter may have been added"""
+        if len(self.counts) < self.capacity:
+            return 0
+        return self.__smallest()[0]
+
+    def merge(self, other: "SpaceSaving") -> None:
+        # values without a counter in a sketch get its floor, see Agarwal et al.,
+        # Mergeable Summaries
+        floor, other_floor = self.floor(), other.floor()
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        for value in self.counts.keys() | other.counts.keys():
+            counts[value] = self.counts.get(value, floor) + other.counts.get(
+                value, other_floor
+            )
+            errors[value] = self.errors.get(value, floor) + other.errors.get(
+                value, other_floor
+            )
+        kept = sorted(counts, key=lambda v: (-counts[v], v))[: self.capacity]
+        self.counts = {v: counts[v] for v in kept}
+        self.errors = {v: errors[v] for v in kept}
+        self.__heapify()
+
+    def top(self, n: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        """Return the n most counted values with their counts and errors"""
+        values = sorted(self.counts, key=lambda v: (-self.counts[v], v))
+        return [(v, self.counts[v], self.errors[v]) for v in values[:n]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "counts": [[v, c, self.errors[v]] for v, c in self.counts.items()],
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "SpaceSaving":
+        sketch = SpaceSaving(data["capacity"])
+        for value, count, error in data["counts"][: sketch.capacity]:
+            sketch.counts[value] = count
+            sketch.errors[value] = error
+        sketch.__heapify()
+        return sketch
+
+
+def stringify(value: Any) -> str:
+    """Return the string a value is counted as, values are encoded for JSON"""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
@@ -0,0 +1,198 @@
+"""Corpus-wide statistics of the metadata, for the stats command
+
+Files are counted per MIME type, and every field of a MIME type gets the number
+of files holding it, a HyperLogLog of its distinct values and a SpaceSaving of
+its most frequent ones. Lists of strings count each of their elements. Memory only
+grows with the number of MIME types and fields, not with the number of files,
+and statistics saved by separate runs merge into the ones of the whole corpus.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from .engine import FileResult
+from .modules import atomic
+from .modules.detect import UNKNOWN_MIME
+from .sketches import HyperLogLog, SpaceSaving, stringify
+
+# version of the saved statistics, files of other versions cannot be merged
+FORMAT_VERSION = 1
+# fields tracked per MIME type, bounds memory when documents carry arbitrary
+# fields, eg. custom properties, the files of the others are only counted
+MAX_FIELDS = 256
+
+
+class FieldStats:
+    def __init__(self) -> None:
+        # number of files holding the field
+        self.files = 0
+        self.distinct = HyperLogLog()
+        self.top = SpaceSaving()
+
+    def add(self, value: Any) -> None:
+        self.files += 1
+        # lists of strings, eg. authors, count every one, others like the track
+        # number and total of a song count as a whole
+        items = value
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            items = [value]
+        for item in items:
+            string = stringify(item)
+            self.distinct.add(string)
+            self.top.add(string)
+
+    def merge(self, other: "FieldStats") -> None:
+        self.files += other.files
+        self.distinct.merge(other.distinct)
+        self.top.merge(other.top)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "distinct": self.distinct.to_dict(),
+            "top": self.top.to_dict(),
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "FieldStats":
+        stats = FieldStats()
+        stats.files = data["files"]
+        stats.distinct = HyperLogLog.from_dict(data["distinct"])
+        stats.top = SpaceSaving.from_dict(data["top"])
+        return stats
+
+
+class MimeStats:
+    def __init__(self) -> None:
+        self.files = 0
+        # files that could not be parsed
+        self.failed = 0
+        self.fields: Dict[str, FieldStats] = {}
+        # occurrences of the fields over MAX_FIELDS
+        self.untracked = 0
+
+    def field(self, name: str) -> Optional[FieldStats]:
+        stats = self.fields.get(name)
+        if stats is None and len(self.fields) < MAX_FIELDS:
+            stats = self.fields[name] = FieldStats()
+        return stats
+
+    def merge(self, other: "MimeStats") -> None:
+        self.files += other.files
+        self.failed += other.failed
+        self.untracked += other.untracked
+        for name, field_stats in other.fields.items():
+            stats = self.field(name)
+            if stats is None:
+                self.untracked += field_stats.files
+            else:
+                stats.merge(field_stats)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "failed": self.failed,
+            "untracked": self.untracked,
+            "fields": {k: v.to_dict() for k, v in self.fields.items()},
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> "MimeStats":
+        stats = MimeStats()
+        stats.files = data["files"]
+        stats.failed = data["failed"]
+        stats.untracked = data["untracked"]
+        stats.fields = {k: FieldStats.from_dict(v) for k, v in data["fields"].items()}
+        return stats
+
+
+class Statistics:
+    def __init__(self) -> None:
+        self.mimes: Dict[str, MimeStats] = {}
+
+    def mime(self, name: str) -> MimeStats:
+        stats = self.mimes.get(name)
+        if stats is None:
+            stats = self.mimes[name] = MimeStats()
+        return stats
+
+    def add(self, result: FileResult) -> None:
+        """Count a result of a cacheable task, files without a parser have no fields"""
+        stats = self.mime(result.mime or UNKNOWN_MIME)
+        stats.files += 1
+        if result.error is not None:
+            stats.failed += 1
+            return
+        for name, value in (result.values or {}).items():
+            if value == "" or not any(v is not None for v in as_list(value)):
+                continue
+            field_stats = stats.field(name)
+            if field_stats is None:
+                stats.untracked += 1
+            else:
+                field_stats.add(value)
+
+    def merge(self, other: "Statistics") -> None:
+        for name, mime_stats in other.mimes.items():
+            self.mime(name).merge(mime_stats)
+
+    def save(self, path: str) -> None:
+        data = {
+            "version": FORMAT_VERSION,
+            "mimes": {k: v.to_dict() for k, v in self.mimes.items()},
+        }
+        with atomic.replace(path) as f:
+            f.write(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    @staticmethod
+    def load(path: str) -> "Statistics":
+        """Read saved statistics, raises ValueError if they are not valid"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} does not hold statistics of this version")
+
+        statistics = Statistics()
+        try:
+            for name, mime_stats in data["mimes"].items():
+                statistics.mimes[name] = MimeStats.from_dict(mime_stats)
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"{path} holds broken statistics: {e!r}") from None
+        return statistics
+
+    def report(self, top: int = 5) -> List[str]:
+        lines = []
+        for name, mime_stats in sorted(
+            self.mimes.items(), key=lambda item: item[1].files, reverse=True
+        ):
+            line = f"{name}: {mime_stats.files} file(s)"
+            if mime_stats.failed:
+                line += f", {mime_stats.failed} failed"
+            lines.append(line)
+            fields = sorted(
+                mime_stats.fields.items(), key=lambda item: item[1].files, reverse=True
+            )
+            for field, stats in fields:
+                distinct = stats.distinct.count()
+                lines.append(
+                    f"  {field}: {stats.files} file(s), ~{distinct} distinct value(s)"
+                )
+                for value, count, error in stats.top.top(top):
+                    if error and count - error <= 1:
+                        # may have been seen once, like any value evicted
+                        continue
+                    count_text = f"{count - error}-{count}" if error else f"{count}"
+                    lines.append(f"    {count_text}: {shorten(value)}")
+            if mime_stats.untracked:
+                lines.append(
+                    f"  {mime_stats.untracked} occurrence(s) of untracked fields"
+                )
+        return lines
+
+
+def as_list(value: Any) -> List[Any]:
+    return value if isinstance(value, list) else [value]
+
+
+def shorten(value: str, width: int = 60) -> str:
+    value = value.replace("\n", " ")
+    return value if len(value) <= width else value[: width - 3] + "..."
@@ -0,0 +1,329 @@
+import logging
+import mimetypes
+import os
+import time
+from typing import Any, Dict, List, Optional, Type
+
+from . import deep, utils
+from .engine import FileResult, Task
+from .manifest import Operation
+from .modules import atomic
+from .modules.auto import ParserFactory
+from .modules.base import BaseParser, image_extension, print_values
+from .modules.detect import sniff
+from .query import Predicate
+
+
+def write(parser: BaseParser, path: str) -> None:
+    file = os.path.basename(path)
+    if parser.write():
+        print(f"Updating {file}" + (" in place" if parser.written_in_place else ""))
+    else:
+        logging.info(f"Not updating {file} as no value changed")
+
+
+class DetectTask(Task):
+    def run(self, path: str, result: FileResult) -> None:
+        result.mime = sniff(path).mime
+        if not self.quiet:
+            print(f"{path}: {result.mime}")
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        # files are only sniffed, never parsed
+        pass
+
+
+class SetTask(Task):
+    modifies = True
+
+    def __init__(
+        self, field: str, value: str, options: Optional[Dict[str, Any]] = None
+    ) -> None:
+        super().__init__(options)
+        self.field = field
+        self.value = value
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        file = os.path.basename(path)
+        try:
+            parser.set_field(self.field, self.value)
+        except KeyError:
+            logging.warning(f"Field {self.field} not present in {file}")
+        write(parser, path)
+
+
+class DeleteTask(Task):
+    modifies = True
+
+    def __init__(self, field: str, options: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__(options)
+        self.field = field
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        file = os.path.basename(path)
+        try:
+            parser.delete_field(self.field)
+        except KeyError:
+            logging.warning(f"Field {self.field} not present in {file}")
+        write(parser, path)
+
+
+class ClearTask(Task):
+    modifies = True
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        parser.clear()
+        write(parser, path)
+
+
+class ApplyTask(Task):
+    """Applies all the manifest operations of a file before writing it once"""
+
+    modifies = True
+
+    def __init__(
+        self,
+        operations: Dict[str, List[Operation]],
+        options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        super().__init__(options)
+        self.operations = operations
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        file = os.path.basename(path)
+        for operation in self.operations.get(path, []):
+            try:
+                operation.apply(parser)
+            except (KeyError, ValueError) as e:
+                logging.error(f"Cannot {operation} in {file}: {e!r}")
+        write(parser, path)
+
+
+class ReadTask(Task):
+    """Only reads the values into the results, for callers of the Python API"""
+
+    cacheable = True
+
+    def __init__(self, options: Optional[Dict[str, Any]] = None) -> None:
+        super().__init__(options, quiet=True)
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        pass
+
+    def process_values(
+        self, path: str, values: Dict[str, Any], parser: Type[BaseParser]
+    ) -> None:
+        pass
+
+
+class PrintTask(Task):
+    cacheable = True
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        print(f"{os.path.basename(path)}:")
+        parser.print()
+        print()
+
+    def process_values(
+        self, path: str, values: Dict[str, Any], parser: Type[BaseParser]
+    ) -> None:
+        print(f"{os.path.basename(path)}:")
+        # printed like the values of the parser, eg. tuples stay tuples
+        print_values(parser.decode_values(values))
+        print()
+
+
+class FindTask(Task):
+    """Prints the paths of the files whose values match all the predicates
+
+    Formats that cannot hold a field of the predicates are skipped before the
+    file is parsed, and unless sniff_all, before it is even opened when the MIME
+    type guessed from its name already rules it out. Files with a misleading
+    extension are then missed. Files processed from the cache are skipped by the
+    same rules, so a run finds the same files with and without the cache.
+    """
+
+    cacheable = True
+    # the predicates match the encoded values, the same as those of the cache
+    needs_values = True
+
+    def __init__(
+        self, predicates: List[Predicate], sniff_all: bool = False, end: str = "\n"
+    ) -> None:
+        super().__init__()
+        self.predicates = predicates
+        self.sniff_all = sniff_all
+        # printed after every path, eg. a NUL for xargs -0
+        self.end = end
+        # whether files of a parser can hold all the fields, checked once per parser
+        self.__candidates: Dict[Type[BaseParser], bool] = {}
+
+    def accepts(self, parser: Type[BaseParser]) -> bool:
+        candidate = self.__candidates.get(parser)
+        if candidate is None:
+            candidate = all(parser.may_have_field(p.field) for p in self.predicates)
+            self.__candidates[parser] = candidate
+        return candidate
+
+    def ruled_out(self, path: str) -> bool:
+        """Check if the MIME type guessed from the name rules the file out"""
+        if self.sniff_all:
+            return False
+        mime, _ = mimetypes.guess_type(path, strict=False)
+        if mime is None:
+            return False
+        parser = ParserFactory.get_parser(mime)
+        return parser is None or not self.accepts(parser)
+
+    def run(self, path: str, result: FileResult) -> None:
+        if self.ruled_out(path):
+            result.skipped = True
+            return
+        super().run(path, result)
+        if result.values is not None:
+            self.match(path, result.values)
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        # matched in run, on the values it encoded for the result
+        pass
+
+    def process_values(
+        self, path: str, values: Dict[str, Any], parser: Type[BaseParser]
+    ) -> None:
+        if self.accepts(parser) and not self.ruled_out(path):
+            self.match(path, values)
+
+    def match(self, path: str, values: Dict[str, Any]) -> None:
+        """Print the path if the encoded values match all the predicates"""
+        if all(p.matches(values) for p in self.predicates):
+            print(path, end=self.end)
+
+
+class ExtractImagesTask(Task):
+    """Saves the embedded pictures of every file to an output directory
+
+    Pictures of a file are named after its path relative to root, eg. the first
+    one of root/album/track.mp3 is saved as output/album/track.mp3-image-1.jpg.
+    """
+
+    def __init__(self, output: str, root: str, quiet: bool = False) -> None:
+        super().__init__(quiet=quiet)
+        self.output = output
+        self.root = root
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        images = parser.images()
+        if not images:
+            return
+
+        base = os.path.join(self.output, os.path.relpath(path, self.root))
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        for i, (mime, data) in enumerate(images, start=1):
+            image = f"{base}-image-{i}{image_extension(mime)}"
+            with atomic.replace(image) as f:
+                f.write(data)
+            print(f"Saving image as {image}")
+
+
+class EntropyTask(Task):
+    """Reports string values with a high entropy
+
+    The workers only collect the values, they are scored in batches in the main
+    process, which remembers the scores of values repeating across files.
+    """
+
+    cacheable = True
+    batch_size = 256
+    needs_values = True
+
+    def __init__(self, min_entropy: float, quiet: bool = False) -> None:
+        super().__init__(quiet=quiet)
+        self.min_entropy = min_entropy
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        pass
+
+    def process_values(
+        self, path: str, values: Dict[str, Any], parser: Type[BaseParser]
+    ) -> None:
+        pass
+
+    def finish(self, results: List[FileResult]) -> None:
+        strings = [
+            v
+            for result in results
+            for v in (result.values or {}).values()
+            if isinstance(v, str)
+        ]
+        scores = dict(zip(strings, utils.entropies(strings)))
+        for result in results:
+            if result.values is None:
+                continue
+            result.values = {
+                k: v
+                for k, v in result.values.items()
+                if isinstance(v, str) and scores[v] > self.min_entropy
+            }
+            if not self.quiet:
+                result.output = self.render(result.path, result.values)
+
+    @staticmethod
+    def render(path: str, values: Dict[str, Any]) -> str:
+        if len(values) == 0:
+            return ""
+
+        lines = [f"{os.path.basename(path)}:"]
+        lines.extend(f"{k}: {v}" for k, v in values.items())
+        return "\n".join(lines) + "\n\n"
+
+
+class DeepEntropyTask(Task):
+    """Reports the windows of high entropy in the embedded data of every file
+
+    The regions of a file, see BaseParser.regions, are scanned with deep.scan,
+    findings are printed or, for structured output, stored as the values.
+    """
+
+    def __init__(
+        self,
+        window: int = deep.DEFAULT_WINDOW,
+        step: int = deep.DEFAULT_STEP,
+        min_entropy: float = deep.DEFAULT_MIN_ENTROPY,
+        quiet: bool = False,
+    ) -> None:
+        super().__init__(quiet=quiet)
+        self.window = window
+        self.step = step
+        self.min_entropy = min_entropy
+
+    def run(self, path: str, result: FileResult) -> None:
+        if not self.quiet:
+            super().run(path, result)
+            return
+
+        parser = self.open(path, result)
+        if parser is None:
+            return
+
+        start = time.perf_counter()
+        findings = self.scan(parser, path)
+        result.timings["scan"] = time.perf_counter() - start
+        result.values = {"findings": [f._asdict() for f in findings]}
+
+    def process(self, parser: BaseParser, path: str) -> None:
+        findings = self.scan(parser, path)
+        if not findings:
+            return
+
+        print(f"{os.path.basename(path)}:")
+        for f in findings:
+            print(
+                f"{f.region} at {f.offset}-{f.offset + f.length}"
+                f" ({f.length} bytes): {f.entropy:.2f} bits/byte"
+            )
+        print()
+
+    def scan(self, parser: BaseParser, path: str) -> List[deep.Finding]:
+        return deep.scan(
+            path, parser.regions(), self.window, self.step, self.min_entropy
+        )
@@ -1,8 +1,130 @@
+import base64
+import collections
+import datetime
+import enum
+import functools
+import importlib
 import math
+from typing import Any, Dict, List, Sequence
+
+# strings at least this long are counted with numpy when it is installed
+NUMPY_MIN_LENGTH = 256
+# batches with at least this many characters to score are scored with numpy at once
+NUMPY_MIN_BATCH = 4096
+# entropies of up to this many strings are remembered, values repeat a lot across a
+# corpus, eg. producers, authors or software names
+MEMO_SIZE = 65536
+# longer strings are not remembered, they rarely repeat and would be kept alive
+MEMO_MAX_LENGTH = 1024
+# code points take 21 bits, batches combine them with the index of their string
+CODE_POINT_BITS = 21
+
+_memo: Dict[str, float] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy() -> Any:
+    """Return the numpy module, None if it is not installed"""
+    try:
+        # imported by name, so type checkers do not need numpy either
+        return importlib.import_module("numpy")
+    except ImportError:
+        return None
+
+
+def _code_points(numpy: Any, string: str) -> Any:
+    return numpy.frombuffer(string.encode("utf-32-le"), dtype=numpy.uint32)
+
+
+def _count_entropy(string: str) -> float:
+    length = len(string)
+    numpy = _numpy() if length >= NUMPY_MIN_LENGTH else None
+    if numpy is None:
+        counts = collections.Counter(string).values()
+        return -sum(c / length * math.log2(c / length) for c in counts)
+
+    codes = _code_points(numpy, string)
+    p = numpy.unique(codes, return_counts=True)[1] / length
+    return float(-(p * numpy.log2(p)).sum())
+
+
+def _remember(string: str, value: float) -> None:
+    if len(string) > MEMO_MAX_LENGTH:
+        return
+    if len(_memo) >= MEMO_SIZE:
+        _memo.clear()
+    _memo[string] = value
 
 
 def entropy(string: str) -> float:
-    prob = [float(string.count(c)) / len(string) for c in dict.fromkeys(list(string))]
-    entropy = -sum([p * math.log(p) / math.log(2.0) for p in prob])
+    """Shannon entropy of the characters of the string, in bits"""
+    value = _memo.get(string)
+    if value is None:
+        value = _count_entropy(string) if string else 0.0
+        _remember(string, value)
+    return value
+
+
+def entropies(strings: Sequence[str]) -> List[float]:
+    """Score many strings at once, large batches are vectorized with numpy"""
+    missing = [s for s in dict.fromkeys(strings) if s and s not in _memo]
+    numpy = _numpy() if sum(map(len, missing)) >= NUMPY_MIN_BATCH else None
+    if numpy is None:
+        scores = {s: _count_entropy(s) for s in missing}
+    else:
+        scores = dict(zip(missing, _batch_entropy(numpy, missing)))
+    for string, value in scores.items():
+        _remember(string, value)
+
+    return [scores[s] if s in scores else entropy(s) for s in strings]
+
+
+def _batch_entropy(numpy: Any, strings: List[str]) -> List[float]:
+    # count (string index, code point) pairs in one pass over all the characters
+    lengths = numpy.fromiter(map(len, strings), dtype=numpy.int64, count=len(strings))
+    codes = _code_points(numpy, "".join(strings)).astype(numpy.uint64)
+    index = numpy.repeat(numpy.arange(len(strings), dtype=numpy.uint64), lengths)
+    keys, counts = numpy.unique(
+        (index << numpy.uint64(CODE_POINT_BITS)) | codes, return_counts=True
+    )
+    owner = (keys >> numpy.uint64(CODE_POINT_BITS)).astype(numpy.int64)
+    p = counts / lengths[owner]
+    totals = numpy.bincount(owner, weights=-p * numpy.log2(p), minlength=len(strings))
+    return totals.tolist()
+
+
+def encode_value(value: Any) -> Any:
+    """Convert a metadata value to the types JSON can represent
+
+    Strings, numbers, booleans and None are kept, sequences become lists, mappings
+    get string keys, bytes are base64 encoded and dates and times use ISO 8601.
+    Embedded images, eg. eyed3 image frames, become objects with "mime_type",
+    "description" and base64 "data", other iterable objects become lists and
+    anything else, eg. eyed3 dates or enums, becomes its str().
+    """
+    if isinstance(value, enum.Enum):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [encode_value(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): encode_value(v) for k, v in value.items()}
+    if hasattr(value, "image_data"):
+        return {
+            "mime_type": encode_value(getattr(value, "mime_type", None)),
+            "description": encode_value(getattr(value, "description", None)),
+            "data": encode_value(value.image_data),
+        }
+    if hasattr(value, "__iter__"):
+        return [encode_value(v) for v in value]
+
+    return str(value)
+
 
-    return entropy
+def encode_values(values: Dict[str, Any]) -> Dict[str, Any]:
+    return {str(k): encode_value(v) for k, v in values.items()}
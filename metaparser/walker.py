@@ -0,0 +1,152 @@
+"""Streaming directory walker with filters checked before any file is opened
+
+Directories are read with os.scandir, whose entries carry the file type and, once
+stat'ed, the size and device. Files are yielded as the entries stream in, so a
+directory with millions of files does not have to be listed first, and filtered
+out files and pruned directories are never opened.
+"""
+import fnmatch
+import logging
+import mimetypes
+import os
+from typing import Iterator, List, Optional, Set, Tuple
+
+# symbolic links are ignored
+SYMLINKS_SKIP = "skip"
+# links to files are walked, links to directories are not descended into
+SYMLINKS_FILES = "files"
+# links to files and directories are followed, each directory is walked once
+SYMLINKS_FOLLOW = "follow"
+SYMLINK_POLICIES = [SYMLINKS_SKIP, SYMLINKS_FILES, SYMLINKS_FOLLOW]
+
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_size(text: str) -> int:
+    """Parse a size in bytes with an optional binary unit, eg. 512, 64k or 1.5G"""
+    text = text.strip().lower().removesuffix("ib").removesuffix("b")
+    number, unit = text, ""
+    if text and text[-1] in SIZE_UNITS:
+        number, unit = text[:-1], text[-1]
+    size = float(number) * SIZE_UNITS[unit]
+    if size < 0:
+        raise ValueError("size cannot be negative")
+    return int(size)
+
+
+class Filters:
+    """Files a walk yields, the defaults yield every file like os.walk"""
+
+    def __init__(
+        self,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        mimes: Optional[List[str]] = None,
+        max_depth: Optional[int] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        symlinks: str = SYMLINKS_FILES,
+        one_file_system: bool = False,
+    ) -> None:
+        # globs matched against the name, or the path relative to the walked
+        # directory for globs with a slash, files have to match one include and
+        # no exclude, excluded directories are not descended into
+        self.include = include or []
+        self.exclude = exclude or []
+        # globs of the MIME types guessed from the file names, eg. image/*
+        self.mimes = mimes or []
+        # files directly in the walked directory have a depth of 1
+        self.max_depth = max_depth
+        self.min_size = min_size
+        self.max_size = max_size
+        self.symlinks = symlinks
+        # do not descend into directories on other file systems
+        self.one_file_system = one_file_system
+
+    @property
+    def sizes(self) -> bool:
+        return self.min_size is not None or self.max_size is not None
+
+    def matches(self, patterns: List[str], name: str, relative: str) -> bool:
+        return any(
+            fnmatch.fnmatchcase(relative if "/" in p else name, p) for p in patterns
+        )
+
+    def accepts_directory(self, entry: os.DirEntry, relative: str) -> bool:
+        return not self.matches(self.exclude, entry.name, relative)
+
+    def accepts_file(self, entry: os.DirEntry, relative: str) -> bool:
+        name = entry.name
+        if self.include and not self.matches(self.include, name, relative):
+            return False
+        if self.matches(self.exclude, name, relative):
+            return False
+        if self.mimes:
+            mime, _ = mimetypes.guess_type(name, strict=False)
+            if mime is None or not any(fnmatch.fnmatch(mime, p) for p in self.mimes):
+                return False
+        if self.sizes:
+            size = entry.stat().st_size
+            if self.min_size is not None and size < self.min_size:
+                return False
+            if self.max_size is not None and size > self.max_size:
+                return False
+        return True
+
+
+def walk(path: str, filters: Optional[Filters] = None) -> Iterator[str]:
+    """Yield the paths of the files under the directory that pass the filters"""
+    filters = filters or Filters()
+    follow = filters.symlinks == SYMLINKS_FOLLOW
+    root_device = os.stat(path).st_dev
+    # directories already walked when following links, (device, inode)
+    visited: Set[Tuple[int, int]] = set()
+    if follow:
+        st = os.stat(path)
+        visited.add((st.st_dev, st.st_ino))
+
+    # (directory, path relative to the walked one, depth of its files)
+    stack: List[Tuple[str, str, int]] = [(path, "", 1)]
+    while stack:
+        directory, relative, depth = stack.pop()
+        directories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    entry_relative = relative + entry.name
+                    try:
+                        link = entry.is_symlink()
+                        if link and filters.symlinks == SYMLINKS_SKIP:
+                            continue
+                        if entry.is_dir(follow_symlinks=follow):
+                            if filters.accepts_directory(entry, entry_relative):
+                                directories.append((entry, entry_relative))
+                        elif entry.is_file() and filters.accepts_file(
+                            entry, entry_relative
+                        ):
+                            yield entry.path
+                    except OSError as e:
+                        # eg. a broken link or a file removed meanwhile
+                        logging.debug(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logging.warning(f"Cannot list {directory}: {e}")
+            continue
+
+        if filters.max_depth is not None and depth >= filters.max_depth:
+            continue
+        # pushed in reverse, so directories are walked in the order they were listed
+        for entry, entry_relative in reversed(directories):
+            try:
+                if filters.one_file_system or follow:
+                    st = entry.stat()
+                    if filters.one_file_system and st.st_dev != root_device:
+                        continue
+                    if follow:
+                        key = (st.st_dev, st.st_ino)
+                        if key in visited:
+                            continue
+                        visited.add(key)
+            except OSError as e:
+                logging.debug(f"Skipping {entry.path}: {e}")
+                continue
+            stack.append((entry.path, entry_relative + "/", depth + 1))
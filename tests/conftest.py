@@ -0,0 +1,21 @@
+import os
+from typing import Dict
+
+import pytest
+
+import benchmarks.corpus as corpus
+
+
+@pytest.fixture
+def files(tmp_path) -> Dict[str, str]:
+    """A small file of every format of the benchmark corpus, by format"""
+    paths = corpus.generate(str(tmp_path), size=4096, tags=3)
+    return dict(zip(corpus.FORMATS, paths))
+
+
+@pytest.fixture
+def text_file(tmp_path) -> str:
+    path = os.path.join(tmp_path, "notes.txt")
+    with open(path, "w") as f:
+        f.write("no metadata here\n")
+    return path
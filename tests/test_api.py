@@ -0,0 +1,63 @@
+import contextlib
+import os
+
+import pytest
+
+import metaparser
+
+
+def fields(path):
+    (record,) = metaparser.scan(path)
+    return record.fields
+
+
+def test_scan_yields_a_record_per_file(files, text_file):
+    directory = os.path.dirname(text_file)
+    records = {os.path.basename(r.path): r for r in metaparser.scan(directory)}
+
+    assert len(records) == len(files) + 1
+    assert records["notes.txt"].parser is None
+    docx = records["docx-00000.docx"]
+    assert docx.parser == "OpenXmlParser" and docx.error is None
+    assert docx.fields["title"].startswith("meeting")
+
+
+def test_edits_are_made_without_consuming_the_records(files):
+    records = metaparser.set_field([files["mp3"], files["docx"]], "title", "New")
+
+    assert [r.modified for r in records] == [True, True]
+    assert records[0].output.startswith("Updating mp3-00000.mp3")
+    assert fields(files["mp3"])["title"] == "New"
+    assert fields(files["docx"])["title"] == "New"
+
+    metaparser.delete_field(files["docx"], "title")
+    assert "title" not in fields(files["docx"])
+
+
+def test_open_file_saves_when_the_block_exits(files):
+    with metaparser.open_file(files["pdf"]) as file:
+        file.set("/Title", "Edited")
+    assert fields(files["pdf"])["/Title"] == "Edited"
+
+    with pytest.raises(RuntimeError):
+        with metaparser.open_file(files["pdf"]) as file:
+            file.set("/Title", "Not saved")
+            raise RuntimeError()
+    assert fields(files["pdf"])["/Title"] == "Edited"
+
+
+def test_open_file_of_unsupported_file(text_file):
+    with pytest.raises(metaparser.UnsupportedFileError):
+        with metaparser.open_file(text_file):
+            pass
+
+
+def test_open_file_does_not_redirect_stdout(files, monkeypatch):
+    def redirect(target):
+        raise AssertionError("stdout redirected")
+
+    monkeypatch.setattr(contextlib, "redirect_stdout", redirect)
+    with metaparser.open(files["mp3"]) as file:
+        file.set("title", "Opened")
+    assert file.record().modified
+    assert file.fields["title"] == "Opened"
@@ -0,0 +1,137 @@
+import os
+import stat
+
+import pytest
+
+from metaparser.modules import atomic
+
+OLD_TIME_NS = 1_000_000_000 * 10**9
+
+
+def make_file(tmp_path, content=b"old content", mode=0o640):
+    path = os.path.join(tmp_path, "file.bin")
+    with open(path, "wb") as f:
+        f.write(content)
+    os.chmod(path, mode)
+    os.utime(path, ns=(OLD_TIME_NS, OLD_TIME_NS))
+    return path
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def temp_files(tmp_path):
+    return [n for n in os.listdir(tmp_path) if n.startswith(atomic.TEMP_PREFIX)]
+
+
+def test_replace_keeps_the_mode_and_advances_the_modification_time(tmp_path):
+    path = make_file(tmp_path)
+    with atomic.replace(path) as f:
+        f.write(b"new")
+
+    st = os.stat(path)
+    assert read(path) == b"new"
+    assert stat.S_IMODE(st.st_mode) == 0o640
+    assert st.st_mtime_ns > OLD_TIME_NS
+    assert temp_files(tmp_path) == []
+
+
+def test_replace_keeps_the_owner_and_group(tmp_path):
+    path = make_file(tmp_path)
+    # only root may give the file away, others can still pick one of their groups
+    uid, gid = (1234, 5678) if os.geteuid() == 0 else (os.getuid(), os.getgroups()[-1])
+    os.chown(path, uid, gid)
+    # chown clears the setgid bit
+    os.chmod(path, 0o2750)
+    with atomic.replace(path) as f:
+        f.write(b"new")
+
+    st = os.stat(path)
+    assert (st.st_uid, st.st_gid) == (uid, gid)
+    assert stat.S_IMODE(st.st_mode) == 0o2750
+
+
+def test_replace_keeps_extended_attributes(tmp_path):
+    path = make_file(tmp_path)
+    try:
+        os.setxattr(path, "user.origin", b"scanner")
+    except (AttributeError, OSError):
+        pytest.skip("no extended attributes here")
+    with atomic.replace(path) as f:
+        f.write(b"new")
+    assert os.getxattr(path, "user.origin") == b"scanner"
+
+
+def test_new_files_get_the_mode_of_the_umask(tmp_path):
+    path = os.path.join(tmp_path, "new.json")
+    mask = os.umask(0o027)
+    try:
+        with atomic.replace(path) as f:
+            f.write(b"{}")
+    finally:
+        os.umask(mask)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+
+def test_failed_replace_keeps_the_original(tmp_path):
+    path = make_file(tmp_path)
+    with pytest.raises(RuntimeError):
+        with atomic.replace(path) as f:
+            f.write(b"partial")
+            raise RuntimeError()
+    assert read(path) == b"old content"
+    assert temp_files(tmp_path) == []
+
+
+def test_replace_copy_starts_from_the_original(tmp_path):
+    path = make_file(tmp_path)
+    with atomic.replace_copy(path) as temp:
+        with open(temp, "ab") as f:
+            f.write(b" and more")
+        assert read(path) == b"old content"
+    assert read(path) == b"old content and more"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+
+
+def test_patch_writes_in_place(tmp_path):
+    path = make_file(tmp_path)
+    inode = os.stat(path).st_ino
+    with atomic.patch(path) as f:
+        f.seek(4)
+        f.write(b"NEW")
+
+    st = os.stat(path)
+    assert read(path) == b"old NEWtent"
+    assert st.st_ino == inode
+    assert st.st_mtime_ns > OLD_TIME_NS
+
+
+def test_batch_renames_on_commit(tmp_path):
+    path = make_file(tmp_path)
+    patched = os.path.join(tmp_path, "patched.bin")
+    with open(patched, "wb") as f:
+        f.write(b"abc")
+
+    with atomic.batch() as writes:
+        with atomic.replace(path) as f:
+            f.write(b"new")
+        with atomic.patch(patched) as f:
+            f.write(b"x")
+        assert read(path) == b"old content"
+        assert len(temp_files(tmp_path)) == 1
+        assert writes.commit() == {}
+
+    assert read(path) == b"new"
+    assert read(patched) == b"xbc"
+    assert temp_files(tmp_path) == []
+
+
+def test_batch_discards_uncommitted_replacements(tmp_path):
+    path = make_file(tmp_path)
+    with atomic.batch():
+        with atomic.replace(path) as f:
+            f.write(b"new")
+    assert read(path) == b"old content"
+    assert temp_files(tmp_path) == []
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from metaparser import utils
+from metaparser.modules.auto import ParserFactory
+
+
+def parse(path):
+    parser = ParserFactory.create_parser_for_file(path)
+    parser.parse(path)
+    return parser
+
+
+@pytest.fixture
+def encodings(monkeypatch):
+    """Number of times values were encoded"""
+    calls = []
+    encode_values = utils.encode_values
+
+    def counting(values):
+        calls.append(values)
+        return encode_values(values)
+
+    monkeypatch.setattr(utils, "encode_values", counting)
+    return calls
+
+
+def test_reading_does_not_encode_the_values(files, encodings):
+    parser = parse(files["mp3"])
+    parser.get_all_values()
+    assert not parser.write()
+    assert encodings == []
+
+
+@pytest.mark.parametrize("kind", ["jpeg", "mp3", "mp4", "pdf", "docx"])
+def test_only_changed_values_are_written(files, kind):
+    path = files[kind]
+    field = next(f for f in parse(path).get_all_values() if f != "images")
+    mtime_ns = os.stat(path).st_mtime_ns
+
+    parser = parse(path)
+    value = parser.get_all_values()[field]
+    parser.set_field(field, value[0] if isinstance(value, list) else value)
+    assert not parser.write()
+    assert os.stat(path).st_mtime_ns == mtime_ns
+
+    parser.set_field(field, "changed value")
+    assert parser.write() and parser.written
+    value = parse(path).get_all_values()[field]
+    assert value in ("changed value", ["changed value"])
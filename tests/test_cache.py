@@ -0,0 +1,90 @@
+import os
+import subprocess
+import sys
+
+from click.testing import CliRunner
+
+from metaparser.__main__ import cli
+from metaparser.cache import MetadataCache
+
+
+def print_directory(directory, cache_file):
+    result = CliRunner().invoke(
+        cli, ["print", "-f", directory, "--cache", "--cache-file", cache_file]
+    )
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_print_from_the_cache_matches_the_parsed_output(files, tmp_path_factory):
+    directory = os.path.dirname(files["mp3"])
+    cache_file = os.path.join(tmp_path_factory.mktemp("cache"), "metadata.sqlite")
+
+    cold = print_directory(directory, cache_file)
+    with MetadataCache(cache_file) as cache:
+        assert cache.stats()["entries"] == len(files)
+    warm = print_directory(directory, cache_file)
+    assert warm == cold
+    assert "track_num: (None, None)" in cold
+    assert "images: [image/jpeg (" in cold
+
+
+def open_cache(tmp_path, **kwargs):
+    return MetadataCache(os.path.join(tmp_path, "metadata.sqlite"), **kwargs)
+
+
+def test_entries_are_hit_until_the_file_changes(files, tmp_path_factory):
+    path = files["pdf"]
+    with open_cache(tmp_path_factory.mktemp("cache")) as cache:
+        cache.store(path, os.stat(path), "application/pdf", {"/Title": "x"})
+        entry = cache.lookup(os.stat(path))
+        assert entry.mime == "application/pdf" and entry.values == {"/Title": "x"}
+
+        with open(path, "ab") as f:
+            f.write(b"\n")
+        assert cache.lookup(os.stat(path)) is None
+        assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_invalidated_entries_are_dropped(files, tmp_path_factory):
+    path = files["pdf"]
+    with open_cache(tmp_path_factory.mktemp("cache")) as cache:
+        cache.store(path, os.stat(path), "application/pdf", {})
+        cache.invalidate(path)
+        assert cache.lookup(os.stat(path)) is None
+
+
+def test_prune_removes_the_entries_of_changed_and_missing_files(files, tmp_path):
+    cache_directory = os.path.join(tmp_path, "cache")
+    with open_cache(cache_directory) as cache:
+        for path in files.values():
+            cache.store(path, os.stat(path), "application/octet-stream", {})
+        os.unlink(files["png"])
+        with open(files["pdf"], "ab") as f:
+            f.write(b"\n")
+        assert cache.prune() == (2, 0)
+        assert cache.stats()["entries"] == len(files) - 2
+
+
+def test_evict_removes_the_least_recently_used_entries(files, tmp_path):
+    paths = list(files.values())
+    with open_cache(os.path.join(tmp_path, "cache")) as cache:
+        for path in paths:
+            cache.store(path, os.stat(path), "application/octet-stream", {})
+        cache.commit()
+        # the first file is used again, so the second one is the oldest
+        assert cache.lookup(os.stat(paths[0])) is not None
+        cache.commit()
+        entry_size = cache.stats()["bytes"] // len(paths)
+        cache.max_size = entry_size * (len(paths) - 2)
+        assert cache.evict() >= 2
+        assert cache.lookup(os.stat(paths[1])) is None
+        assert cache.lookup(os.stat(paths[0])) is not None
+
+
+def test_sqlite_is_only_imported_with_a_cache():
+    code = "import sys, metaparser.__main__; print('sqlite3' in sys.modules)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "False"
@@ -0,0 +1,50 @@
+import os
+import zipfile
+
+import eyed3.id3
+from exif import Image
+from mutagen.mp4 import MP4
+from PyPDF2 import PdfFileReader
+
+import benchmarks.corpus as corpus
+from metaparser.modules.auto import ParserFactory
+
+
+def read_all(paths):
+    contents = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            contents[os.path.basename(path)] = f.read()
+    return contents
+
+
+def test_corpus_is_reproducible(tmp_path):
+    first = corpus.generate(str(tmp_path / "a"), count=2, size=4096, tags=3)
+    second = corpus.generate(str(tmp_path / "b"), count=2, size=4096, tags=3)
+    other = corpus.generate(str(tmp_path / "c"), count=2, size=4096, tags=3, seed=1)
+    assert len(first) == 2 * len(corpus.FORMATS)
+    assert read_all(first) == read_all(second)
+    assert read_all(first).keys() == read_all(other).keys()
+    assert read_all(first) != read_all(other)
+
+
+def test_reference_libraries_read_the_corpus(files):
+    with open(files["jpeg"], "rb") as f:
+        assert Image(f).has_exif
+    tag = eyed3.id3.Tag()
+    assert tag.parse(files["mp3"]) and tag.title
+    assert MP4(files["mp4"]).tags
+    with open(files["pdf"], "rb") as f:
+        assert PdfFileReader(f).getDocumentInfo().title
+    for kind in ["docx", "xlsx", "pptx"]:
+        with zipfile.ZipFile(files[kind]) as document:
+            assert document.testzip() is None
+
+
+def test_parsers_read_the_tags(files):
+    for kind, path in files.items():
+        assert os.path.getsize(path) >= 4096, kind
+        parser = ParserFactory.create_parser_for_file(path)
+        parser.parse(path)
+        if kind != "png":
+            assert len(parser.get_all_values()) >= 3, kind
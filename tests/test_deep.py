@@ -0,0 +1,97 @@
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from metaparser import deep, utils
+from metaparser.modules.base import Region
+
+
+def entropy(chunk):
+    counts = Counter(chunk).values()
+    return -sum(c / len(chunk) * math.log2(c / len(chunk)) for c in counts)
+
+
+def reference(data, region, window, step, min_entropy):
+    """Windows every step from the region start, the last one ends with it"""
+    start = min(region.offset, len(data))
+    end = min(start + region.length, len(data))
+    if end - start <= window:
+        offsets = [start] if end > start else []
+    else:
+        offsets = list(range(start, end - window + 1, step))
+        if offsets[-1] + window < end:
+            offsets.append(end - window)
+    findings = []
+    for offset in offsets:
+        size = min(window, end - offset)
+        score = entropy(data[offset : offset + size])
+        if score <= min_entropy:
+            continue
+        if findings and offset <= findings[-1][0] + findings[-1][1]:
+            first, _, best = findings[-1]
+            findings[-1] = (first, offset + size - first, max(best, score))
+        else:
+            findings.append((offset, size, score))
+    return [deep.Finding(region.name, *finding) for finding in findings]
+
+
+@pytest.fixture
+def blob(tmp_path):
+    """Zeros with random runs at unaligned offsets"""
+    generator = random.Random(0)
+    data = bytearray(300_000)
+    for offset, length in [(5_000, 3_000), (70_001, 40_000), (200_123, 2_999)]:
+        data[offset : offset + length] = generator.randbytes(length)
+    path = tmp_path / "blob.bin"
+    path.write_bytes(data)
+    return str(path), bytes(data)
+
+
+REGIONS = [
+    Region("whole", 0, 300_000),
+    Region("unaligned", 1_234, 250_321),
+    Region("short", 70_100, 700),
+    Region("truncated", 299_000, 10_000),
+    Region("outside", 400_000, 10),
+]
+
+
+@pytest.mark.parametrize("use_numpy", [False, True], ids=["python", "numpy"])
+@pytest.mark.parametrize("window,step", [(4096, 1024), (1024, 1024), (3000, 500)])
+def test_windows_match_the_reference(blob, monkeypatch, use_numpy, window, step):
+    if use_numpy:
+        pytest.importorskip("numpy")
+        # several chunks, so windows span the carried blocks
+        monkeypatch.setattr(deep, "CHUNK_SIZE", 16 * 1024)
+    else:
+        monkeypatch.setattr(utils, "_numpy", lambda: None)
+    path, data = blob
+    for region in REGIONS:
+        findings = deep.scan(path, [region], window, step, min_entropy=1.0)
+        expected = reference(data, region, window, step, 1.0)
+        assert [f[:3] for f in findings] == [f[:3] for f in expected], region
+        assert [f.entropy for f in findings] == pytest.approx(
+            [f.entropy for f in expected], abs=1e-4
+        )
+
+
+def test_random_runs_are_found(blob):
+    path, _ = blob
+    findings = deep.scan(path, [REGIONS[0]], 1024, 256, min_entropy=7.0)
+    runs = [(5_000, 8_000), (70_001, 110_001), (200_123, 203_122)]
+    assert len(findings) == len(runs)
+    for finding, (start, end) in zip(findings, runs):
+        # windows straddling an edge of the run qualify depending on its share
+        assert abs(finding.offset - start) < 1024
+        assert abs(finding.offset + finding.length - end) < 1024
+        assert finding.entropy > 7.0
+
+
+def test_invalid_windows(blob):
+    path, _ = blob
+    with pytest.raises(ValueError):
+        deep.scan(path, REGIONS, window=1000, step=300)
+    with pytest.raises(ValueError):
+        deep.scan(path, REGIONS, window=100, step=0)
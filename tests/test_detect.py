@@ -0,0 +1,51 @@
+import pytest
+
+from metaparser.modules import detect
+from metaparser.modules.detect import UNKNOWN_MIME, sniff
+
+MIMES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "mp3": "audio/mpeg",
+    "mp4": "video/mp4",
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+
+@pytest.fixture
+def no_libmagic(monkeypatch):
+    def from_buffer(*args, **kwargs):
+        raise AssertionError("libmagic consulted")
+
+    monkeypatch.setattr(detect.magic, "from_buffer", from_buffer)
+
+
+def test_signatures_skip_libmagic(files, no_libmagic):
+    for kind, path in files.items():
+        detection = sniff(path)
+        assert detection.mime == MIMES[kind], kind
+        with open(path, "rb") as f:
+            assert detection.header == f.read(detect.HEADER_SIZE)
+
+
+def test_unsupported_files_skip_libmagic_unless_exact(text_file, no_libmagic):
+    assert sniff(text_file, exact=False).mime == UNKNOWN_MIME
+    with pytest.raises(AssertionError):
+        sniff(text_file)
+
+
+def test_libmagic_is_asked_about_possible_formats(tmp_path, monkeypatch):
+    # an MPEG audio frame without an ID3 tag in front of it
+    path = tmp_path / "song"
+    path.write_bytes(b"\xff\xfb\x90\x64" + bytes(1000))
+    monkeypatch.setattr(detect.magic, "from_buffer", lambda *a, **k: "audio/mpeg")
+    assert sniff(str(path), exact=False).mime == "audio/mpeg"
+
+
+def test_zip_archives_are_told_apart_by_extension(files, tmp_path):
+    path = tmp_path / "archive.zip"
+    path.write_bytes(open(files["docx"], "rb").read())
+    assert detect.match_signature(str(path), path.read_bytes()) is None
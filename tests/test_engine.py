@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from metaparser import engine, tasks
+from metaparser.cache import MetadataCache
+from metaparser.modules.mp3 import Mp3Parser
+
+
+class FailingTask(engine.Task):
+    def process(self, parser, path):
+        raise ValueError("broken")
+
+
+def outputs(results):
+    return [(r.path, r.mime, r.parser, r.error, r.skipped) for r in results]
+
+
+def test_task_is_abstract():
+    with pytest.raises(TypeError):
+        engine.Task()  # type: ignore
+
+
+def test_process_values_of_task_that_is_not_cacheable():
+    task = tasks.SetTask("title", "x")
+    with pytest.raises(TypeError, match="SetTask is not cacheable"):
+        task.process_values("file.mp3", {}, Mp3Parser)
+
+
+def test_results_follow_the_order_of_the_paths(files, text_file):
+    paths = [text_file] + list(files.values())
+    results = list(engine.run(tasks.PrintTask(), paths))
+
+    assert [r.path for r in results] == paths
+    assert results[0].skipped and results[0].parser is None
+    assert all(r.error is None for r in results)
+    assert results[1].output.startswith("jpeg-00000.jpg:\n")
+
+
+def test_workers_produce_the_same_results(files, text_file):
+    paths = list(files.values()) + [text_file]
+    sequential = outputs(engine.run(tasks.PrintTask(), paths))
+    parallel = outputs(engine.run(tasks.PrintTask(), paths, jobs=2))
+    assert parallel == sequential
+
+
+def test_failures_are_stored_in_the_results(files):
+    (result,) = engine.run(FailingTask(), [files["pdf"]])
+    assert result.error == "ValueError: broken"
+    assert "Traceback" in result.traceback
+
+
+class CrashingTask(engine.Task):
+    def process(self, parser, path):
+        if path.endswith(".pdf"):
+            os._exit(1)
+
+
+def test_worker_crash_fails_only_its_files(files, monkeypatch):
+    monkeypatch.setattr(engine, "CHUNK_SIZE", 1)
+    monkeypatch.setattr(engine, "QUEUE_DEPTH", 1)
+    paths = [files["pdf"]] + [files[kind] for kind in ["jpeg", "png", "mp3"] * 3]
+    results = list(engine.run(CrashingTask(), paths, jobs=2))
+
+    assert [r.path for r in results] == paths
+    assert results[0].error.startswith("BrokenProcessPool")
+    # files submitted after the crash are processed by a new pool
+    assert all(r.error is None for r in results[-3:])
+
+
+def test_values_are_encoded_only_when_read(files, tmp_path_factory):
+    paths = [files["mp3"], files["pdf"]]
+    assert all(r.values is None for r in engine.run(tasks.PrintTask(), paths))
+    assert all(r.values for r in engine.run(tasks.PrintTask(quiet=True), paths))
+    assert all(r.values for r in engine.run(tasks.EntropyTask(0.0), paths))
+
+    cache_file = str(tmp_path_factory.mktemp("cache") / "metadata.sqlite")
+    with MetadataCache(cache_file) as cache:
+        assert all(r.values for r in engine.run(tasks.PrintTask(), paths, cache=cache))
+    with MetadataCache(cache_file) as cache:
+        assert all(r.cached for r in engine.run(tasks.PrintTask(), paths, cache=cache))
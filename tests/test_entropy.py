@@ -0,0 +1,58 @@
+import math
+import random
+
+import pytest
+
+from metaparser import utils
+
+
+@pytest.fixture(autouse=True)
+def empty_memo(monkeypatch):
+    monkeypatch.setattr(utils, "_memo", {})
+
+
+@pytest.fixture
+def no_numpy(monkeypatch):
+    monkeypatch.setattr(utils, "_numpy", lambda: None)
+
+
+def strings(seed=0):
+    generator = random.Random(seed)
+    alphabet = "abcdefgh ąęß€😀"
+    return [
+        "".join(generator.choices(alphabet, k=generator.randrange(1, 600)))
+        for _ in range(50)
+    ] + ["", "same", "same"]
+
+
+@pytest.mark.parametrize(
+    "string,bits", [("", 0.0), ("aaaa", 0.0), ("ab", 1.0), ("abcd", 2.0)]
+)
+def test_entropy(string, bits, no_numpy):
+    assert utils.entropy(string) == bits
+
+
+def test_numpy_scores_match(monkeypatch):
+    pytest.importorskip("numpy")
+    with monkeypatch.context() as patch:
+        patch.setattr(utils, "_numpy", lambda: None)
+        expected = [utils.entropy(s) for s in strings()]
+    utils._memo.clear()
+    monkeypatch.setattr(utils, "NUMPY_MIN_LENGTH", 1)
+    monkeypatch.setattr(utils, "NUMPY_MIN_BATCH", 1)
+    assert [utils.entropy(s) for s in strings()] == pytest.approx(expected)
+    utils._memo.clear()
+    assert utils.entropies(strings()) == pytest.approx(expected)
+
+
+def test_batch_matches_single_scores(no_numpy):
+    batch = utils.entropies(strings())
+    utils._memo.clear()
+    assert batch == [utils.entropy(s) for s in strings()]
+
+
+def test_short_scores_are_memoized(no_numpy):
+    short, long = "abc" * 10, "abc" * utils.MEMO_MAX_LENGTH
+    utils.entropies([short, long])
+    assert short in utils._memo and long not in utils._memo
+    assert utils.entropy(long) == pytest.approx(math.log2(3))
@@ -0,0 +1,77 @@
+import os
+
+from exif import Image
+
+from metaparser.modules.auto import ParserFactory
+from metaparser.modules.exif import find_app1
+
+
+def parse(path):
+    parser = ParserFactory.create_parser_for_file(path)
+    parser.parse(path)
+    return parser
+
+
+def split(path):
+    """Return the bytes before the EXIF segment, the segment and the rest"""
+    with open(path, "rb") as f:
+        data = f.read()
+    segment, insert_at = find_app1(data)
+    if segment is None:
+        return data[:insert_at], b"", data[insert_at:]
+    return (
+        data[: segment.offset],
+        data[segment.offset : segment.end],
+        data[segment.end :],
+    )
+
+
+def read(path, field):
+    with open(path, "rb") as f:
+        return Image(f).get(field)
+
+
+def test_shrinking_edit_is_written_in_place(files):
+    path = files["jpeg"]
+    size = os.path.getsize(path)
+    before, _, after = split(path)
+    parser = parse(path)
+    parser.set_field("make", "short")
+    parser.delete_field("model")
+    assert parser.write()
+    assert parser.written_in_place
+
+    assert os.path.getsize(path) == size
+    assert split(path)[0] == before and split(path)[2] == after
+    assert read(path, "make") == "short"
+    assert read(path, "model") is None
+
+
+def test_growing_edit_splices_the_segment(files):
+    path = files["jpeg"]
+    before, segment, after = split(path)
+    description = "d" * 4 * len(segment)
+    parser = parse(path)
+    parser.set_field("image_description", description)
+    assert parser.write()
+    assert not parser.written_in_place
+
+    new_before, new_segment, new_after = split(path)
+    assert (new_before, new_after) == (before, after)
+    assert len(new_segment) > len(description)
+    assert read(path, "image_description") == description
+    assert parse(path).get_all_values()["image_description"] == description
+
+
+def test_segment_is_created(files):
+    path = files["jpeg"]
+    before, _, after = split(path)
+    with open(path, "wb") as f:
+        f.write(before + after)
+
+    parser = parse(path)
+    assert parser.get_all_values() == {}
+    parser.set_field("make", "created")
+    assert parser.write()
+    assert read(path, "make") == "created"
+    assert split(path)[2] == after
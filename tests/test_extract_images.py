@@ -0,0 +1,45 @@
+import os
+import shutil
+
+import eyed3
+import eyed3.id3
+from click.testing import CliRunner
+
+from metaparser.__main__ import cli
+from metaparser.modules.auto import ParserFactory
+
+
+def test_mp3_parse_only_reads_the_tag(files, monkeypatch):
+    def load(*args, **kwargs):
+        raise AssertionError("audio frames scanned")
+
+    monkeypatch.setattr(eyed3, "load", load)
+    parser = ParserFactory.create_parser_for_file(files["mp3"])
+    parser.parse(files["mp3"])
+    assert parser.get_all_values()["title"]
+    assert [mime for mime, _ in parser.images()] == ["image/jpeg"]
+
+
+def test_extract_images(files, tmp_path, tmp_path_factory):
+    album = tmp_path / "album"
+    album.mkdir()
+    shutil.copy(files["mp3"], album / "track.mp3")
+    output = tmp_path_factory.mktemp("images")
+
+    result = CliRunner().invoke(
+        cli, ["extract-images", "-f", str(tmp_path), "-o", str(output), "-j", "2"]
+    )
+    assert result.exit_code == 0, result.output
+
+    tag = eyed3.id3.Tag()
+    tag.parse(files["mp3"])
+    data = tag.images[0].image_data
+    saved = sorted(
+        os.path.relpath(os.path.join(directory, name), output)
+        for directory, _, names in os.walk(output)
+        for name in names
+    )
+    assert saved == ["album/track.mp3-image-1.jpg", "mp3-00000.mp3-image-1.jpg"]
+    for name in saved:
+        with open(os.path.join(output, name), "rb") as f:
+            assert f.read() == data
@@ -0,0 +1,59 @@
+import os
+import shutil
+
+from click.testing import CliRunner
+
+from metaparser import utils
+from metaparser.__main__ import cli
+
+
+def find(directory, *arguments):
+    result = CliRunner().invoke(cli, ["find", "-f", directory, *arguments])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def names(output, separator="\n"):
+    return sorted(os.path.basename(p) for p in output.split(separator) if p)
+
+
+def test_find_prints_the_matching_files(files):
+    directory = os.path.dirname(files["mp3"])
+    assert names(find(directory, "title=^meeting")) == ["docx-00000.docx"]
+    assert names(find(directory, "/Title exists")) == ["pdf-00000.pdf"]
+    assert len(names(find(directory, "title exists"))) == 5
+
+
+def test_limit_and_print0(files):
+    directory = os.path.dirname(files["mp3"])
+    output = find(directory, "--limit", "2", "-0", "title exists")
+    assert output.endswith("\0") and "\n" not in output
+    assert len(names(output, "\0")) == 2
+
+
+def test_misleading_extensions_need_sniff_all(files, tmp_path_factory):
+    directory = os.path.dirname(files["mp3"])
+    # a PDF named like a picture, JPEG files cannot hold /Title
+    shutil.copy(files["pdf"], os.path.join(directory, "scan.jpg"))
+    cache_file = os.path.join(tmp_path_factory.mktemp("cache"), "metadata.sqlite")
+    cache = ["--cache", "--cache-file", cache_file]
+
+    assert names(find(directory, "/Title exists")) == ["pdf-00000.pdf"]
+    sniffed = names(find(directory, "--sniff-all", *cache, "/Title exists"))
+    assert sniffed == ["pdf-00000.pdf", "scan.jpg"]
+    # the cached file is skipped by its name like an uncached one
+    assert names(find(directory, *cache, "/Title exists")) == ["pdf-00000.pdf"]
+
+
+def test_values_are_encoded_once(files, monkeypatch):
+    directory = os.path.dirname(files["mp3"])
+    encoded = []
+    encode_values = utils.encode_values
+    monkeypatch.setattr(
+        utils,
+        "encode_values",
+        lambda values: encoded.append(values) or encode_values(values),
+    )
+    found = names(find(directory, "--sniff-all", "title exists"))
+    # every file that can hold a title is parsed and encoded once
+    assert len(encoded) == len(found) == 5
@@ -0,0 +1,111 @@
+import json
+import os
+import time
+
+from click.testing import CliRunner
+
+from metaparser import journal
+from metaparser.__main__ import cli
+from metaparser.engine import FileResult
+
+
+def write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def result(path, error=None, modified=False):
+    r = FileResult(path)
+    r.error = error
+    r.modified = modified
+    return r
+
+
+def test_resume_skips_the_done_files_and_retries_failed_ones(tmp_path):
+    done, failed, new = (os.path.join(tmp_path, n) for n in ["a", "b", "c"])
+    for path in (done, failed, new):
+        write(path, "x")
+    journal_path = os.path.join(tmp_path, "run.journal")
+    with journal.Journal(journal_path) as j:
+        j.record(result(done, modified=True))
+        j.record(result(failed, error="OSError: disk full"))
+
+    with journal.Journal(journal_path, resume=True) as j:
+        assert list(j.pending([done, failed, new])) == [failed, new]
+        assert j.done_count == 1
+
+
+def test_files_changed_since_are_not_done(tmp_path):
+    path = os.path.join(tmp_path, "a")
+    write(path, "before")
+    st = os.stat(path)
+    journal_path = os.path.join(tmp_path, "run.journal")
+    with journal.Journal(journal_path) as j:
+        j.record(result(path))
+
+    # same size and modification time, only the change time tells
+    time.sleep(0.05)
+    write(path, "after!")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    with journal.Journal(journal_path, resume=True) as j:
+        assert not j.is_done(path)
+
+
+def test_pending_is_lazy(tmp_path):
+    journal_path = os.path.join(tmp_path, "run.journal")
+    paths = iter(["a", "b", "c"])
+    with journal.Journal(journal_path, resume=True) as j:
+        pending = j.pending(paths)
+        assert next(pending) == "a"
+        assert next(paths) == "b"
+
+
+def test_broken_last_line_is_ignored(tmp_path):
+    path = os.path.join(tmp_path, "a")
+    write(path, "x")
+    st = os.stat(path)
+    journal_path = os.path.join(tmp_path, "run.journal")
+    with open(journal_path, "w") as f:
+        line = [path, st.st_mtime_ns, st.st_ctime_ns, st.st_size, "unchanged"]
+        f.write(json.dumps(line) + "\n")
+        f.write("5\n")
+        f.write('["cut sh')
+
+    with journal.Journal(journal_path, resume=True) as j:
+        assert j.is_done(path)
+        j.record(result(path))
+    with open(journal_path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 4 and json.loads(lines[3])[0] == path
+
+
+def test_resumed_run_only_processes_the_remaining_files(files, tmp_path):
+    journal_path = os.path.join(tmp_path, "run.journal")
+    directory = os.path.dirname(files["mp3"])
+    runner = CliRunner()
+    arguments = ["set", "-f", directory, "--journal", journal_path, "title", "x"]
+
+    first = runner.invoke(cli, arguments)
+    assert first.exit_code == 0, first.output
+    second = runner.invoke(cli, arguments + ["--resume"])
+    assert second.exit_code == 0, second.output
+    # the journal is in the walked directory too, skipped as unsupported
+    assert second.output.startswith(f"{len(files) + 1} file(s) recorded as done")
+    assert f"{len(files)} file(s) already done" in second.output
+    assert "0 file(s) modified" in second.output
+
+
+def test_resumed_apply_reports_the_files_left_first(files, tmp_path):
+    journal_path = os.path.join(tmp_path, "run.journal")
+    manifest_path = os.path.join(tmp_path, "edits.jsonl")
+    rows = [{"file": files[kind], "action": "clear"} for kind in ["mp3", "pdf"]]
+    write(manifest_path, "".join(json.dumps(row) + "\n" for row in rows))
+    arguments = ["apply", "-f", manifest_path, "--journal", journal_path]
+    runner = CliRunner()
+
+    first = runner.invoke(cli, arguments)
+    assert first.exit_code == 0, first.output
+    write(files["pdf"], "changed since")
+    second = runner.invoke(cli, arguments + ["--resume"])
+    assert second.exit_code == 0, second.output
+    assert second.output.splitlines()[0] == "1 file(s) already done, 1 left"
@@ -0,0 +1,104 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from metaparser import manifest
+from metaparser.__main__ import cli
+from metaparser.modules.auto import ParserFactory
+
+
+def values(path):
+    parser = ParserFactory.create_parser_for_file(path)
+    parser.parse(path)
+    return parser.get_all_values()
+
+
+@pytest.fixture
+def rows(files):
+    return [
+        {"file": files["docx"], "action": "set", "field": "title", "value": "one"},
+        {"file": files["pdf"], "action": "set", "field": "/Title", "value": "two"},
+        {"file": files["docx"], "action": "delete", "field": "subject"},
+        {"file": files["docx"], "action": "set", "field": "creator", "value": "me"},
+        {"file": files["pdf"], "action": "set", "field": "/Nope", "value": "x"},
+        {"file": files["mp3"], "action": "clear"},
+    ]
+
+
+def write_jsonl(path, rows):
+    with open(path, "w") as f:
+        f.writelines(json.dumps(row) + "\n" for row in rows)
+    return str(path)
+
+
+def write_csv(path, rows):
+    with open(path, "w") as f:
+        f.write("file,action,field,value\n")
+        for row in rows:
+            f.write(
+                f"{row['file']},{row['action']},"
+                f"{row.get('field', '')},{row.get('value', '')}\n"
+            )
+    return str(path)
+
+
+@pytest.mark.parametrize("writer", [write_jsonl, write_csv])
+def test_operations_are_grouped_by_file(files, rows, tmp_path_factory, writer):
+    directory = tmp_path_factory.mktemp("manifest")
+    suffix = ".csv" if writer is write_csv else ".jsonl"
+    operations = manifest.read(writer(directory / f"edits{suffix}", rows))
+    assert list(operations) == [files["docx"], files["pdf"], files["mp3"]]
+    assert [str(op) for op in operations[files["docx"]]] == [
+        "set title",
+        "delete subject",
+        "set creator",
+    ]
+    assert operations[files["pdf"]][0].value == "two"
+
+
+@pytest.mark.parametrize(
+    "row,error",
+    [
+        ({"action": "set", "field": "title"}, "missing file"),
+        ({"file": "a", "action": "rename", "field": "title"}, "unknown action"),
+        ({"file": "a", "action": "delete"}, "delete needs a field"),
+    ],
+)
+def test_invalid_rows(tmp_path, row, error):
+    path = write_jsonl(
+        tmp_path / "edits.jsonl", [{"file": "a", "action": "clear"}, row]
+    )
+    with pytest.raises(manifest.ManifestError, match=f":2: {error}"):
+        manifest.read(path)
+
+
+def test_apply_writes_every_file_once(files, rows, tmp_path_factory):
+    path = write_jsonl(tmp_path_factory.mktemp("manifest") / "edits.jsonl", rows)
+    result = CliRunner().invoke(cli, ["apply", "-f", path])
+    assert result.exit_code == 0, result.output
+    updates = [line for line in result.output.splitlines() if "Updating" in line]
+    assert sorted(line.split()[1] for line in updates) == [
+        "docx-00000.docx",
+        "mp3-00000.mp3",
+        "pdf-00000.pdf",
+    ]
+
+    docx = values(files["docx"])
+    assert docx["title"] == "one" and docx["creator"] == "me"
+    assert "subject" not in docx
+    # the failing operation does not stop the others of the file
+    assert values(files["pdf"])["/Title"] == "two"
+    assert not values(files["mp3"]).get("title")
+
+
+def test_malformed_manifest_is_a_usage_error(tmp_path):
+    path = tmp_path / "edits.jsonl"
+    path.write_text('{"file": "a", "action": "clear"}\n{not json\n')
+    with pytest.raises(manifest.ManifestError, match=f"^{path}:2: "):
+        manifest.read(str(path))
+
+    result = CliRunner().invoke(cli, ["apply", "-f", str(path)])
+    assert result.exit_code == 2
+    assert f"Invalid value for MANIFEST: {path}:2: " in result.output
+    assert result.exception is None or isinstance(result.exception, SystemExit)
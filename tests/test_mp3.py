@@ -0,0 +1,71 @@
+import os
+
+import eyed3.id3
+
+from metaparser.modules import mp3
+from metaparser.modules.auto import ParserFactory
+from metaparser.modules.base import OPTION_PADDING
+
+
+def parse(path, **options):
+    parser = ParserFactory.create_parser_for_file(path, options)
+    parser.parse(path)
+    return parser
+
+
+def read_tag(path):
+    tag = eyed3.id3.Tag()
+    tag.parse(path)
+    return tag
+
+
+def audio(path):
+    with open(path, "rb") as f:
+        f.seek(read_tag(path).file_info.tag_size)
+        return f.read()
+
+
+def test_small_edit_is_written_in_place(files):
+    path = files["mp3"]
+    size = os.path.getsize(path)
+    data = audio(path)
+    parser = parse(path)
+    parser.set_field("title", "short")
+    assert parser.write()
+    assert parser.written_in_place
+    assert read_tag(path).title == "short"
+    assert os.path.getsize(path) == size
+    assert audio(path) == data
+
+
+def test_growing_tag_reserves_padding(files):
+    path = files["mp3"]
+    size = os.path.getsize(path)
+    data = audio(path)
+    title = "x" * 4 * size
+    parser = parse(path, **{OPTION_PADDING: 2048})
+    parser.set_field("title", title)
+    assert parser.write()
+    assert not parser.written_in_place
+    tag = read_tag(path)
+    assert tag.title == title
+    assert tag.file_info.tag_size >= len(title) + 2048
+    assert audio(path) == data
+
+    # the reserved padding takes the next edit in place
+    parser = parse(path)
+    parser.set_field("album", "y" * 1024)
+    assert parser.write()
+    assert parser.written_in_place
+    assert read_tag(path).album == "y" * 1024
+    assert audio(path) == data
+
+
+def test_saves_through_eyed3_without_render(files, monkeypatch):
+    monkeypatch.setattr(mp3, "CAN_RENDER", False)
+    path = files["mp3"]
+    parser = parse(path)
+    parser.set_field("title", "saved")
+    assert parser.write()
+    assert not parser.written_in_place
+    assert read_tag(path).title == "saved"
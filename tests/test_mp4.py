@@ -0,0 +1,64 @@
+import os
+import struct
+
+from mutagen.easymp4 import EasyMP4
+
+from metaparser.modules.auto import ParserFactory
+from metaparser.modules.base import OPTION_PADDING
+
+
+def parse(path, **options):
+    parser = ParserFactory.create_parser_for_file(path, options)
+    parser.parse(path)
+    return parser
+
+
+def media_data(path):
+    """Return the payload of the top level mdat box"""
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset < len(data):
+        size, kind = struct.unpack(">I4s", data[offset : offset + 8])
+        if kind == b"mdat":
+            return data[offset + 8 : offset + size]
+        offset += size
+    raise AssertionError("no mdat box")
+
+
+def test_small_edit_is_written_in_place(files):
+    path = files["mp4"]
+    size = os.path.getsize(path)
+    media = media_data(path)
+    parser = parse(path)
+    parser.set_field("title", "short")
+    parser.delete_field("album")
+    assert parser.write()
+    assert parser.written_in_place
+
+    assert os.path.getsize(path) == size
+    assert media_data(path) == media
+    tags = EasyMP4(path)
+    assert tags["title"] == ["short"]
+    assert "album" not in tags
+
+
+def test_growing_tags_reserve_padding(files):
+    path = files["mp4"]
+    media = media_data(path)
+    comment = "c" * 4 * os.path.getsize(path)
+    parser = parse(path, **{OPTION_PADDING: 2048})
+    parser.set_field("comment", comment)
+    assert parser.write()
+    assert not parser.written_in_place
+    assert EasyMP4(path)["comment"] == [comment]
+    assert media_data(path) == media
+
+    # the reserved padding takes the next edit in place
+    parser = parse(path)
+    parser.set_field("genre", "g" * 1024)
+    assert parser.write()
+    assert parser.written_in_place
+    tags = EasyMP4(path)
+    assert tags["genre"] == ["g" * 1024] and tags["comment"] == [comment]
+    assert media_data(path) == media
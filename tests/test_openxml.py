@@ -0,0 +1,114 @@
+import xml.etree.ElementTree as ElementTree
+import zipfile
+
+import pytest
+
+from metaparser.modules import openXml
+from metaparser.modules.auto import ParserFactory
+
+
+def parse(path):
+    parser = ParserFactory.create_parser_for_file(path)
+    parser.parse(path)
+    return parser
+
+
+def members(path):
+    with zipfile.ZipFile(path) as document:
+        assert document.testzip() is None
+        return {info.filename: document.read(info) for info in document.infolist()}
+
+
+@pytest.fixture(params=[True, False], ids=["raw copy", "recompress"])
+def raw_copy(request, monkeypatch):
+    monkeypatch.setattr(openXml, "RAW_COPY", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("kind", ["docx", "xlsx", "pptx"])
+def test_rewrite_only_changes_the_replaced_part(files, kind, raw_copy):
+    path = files[kind]
+    before = members(path)
+    parser = parse(path)
+    parser.set_field("title", "rewritten")
+    parser.set_field("app:Company", "Initech")
+    assert parser.write()
+
+    after = members(path)
+    assert list(after) == list(before)
+    changed = {name for name in before if before[name] != after[name]}
+    assert changed == {"docProps/core.xml", "docProps/app.xml"}
+    values = parse(path).get_all_values()
+    assert values["title"] == "rewritten"
+    assert values["app:Company"] == "Initech"
+
+
+def test_docx_reopens_in_python_docx(tmp_path, raw_copy):
+    docx = pytest.importorskip("docx")
+    path = str(tmp_path / "report.docx")
+    document = docx.Document()
+    document.add_paragraph("body text")
+    document.save(path)
+
+    parser = parse(path)
+    parser.set_field("title", "round trip")
+    assert parser.write()
+
+    document = docx.Document(path)
+    assert document.core_properties.title == "round trip"
+    assert document.paragraphs[-1].text == "body text"
+
+
+def test_xlsx_reopens_in_openpyxl(tmp_path, raw_copy):
+    openpyxl = pytest.importorskip("openpyxl")
+    path = str(tmp_path / "sheet.xlsx")
+    workbook = openpyxl.Workbook()
+    workbook.active["A1"] = "cell"
+    workbook.save(path)
+
+    parser = parse(path)
+    parser.set_field("title", "round trip")
+    assert parser.write()
+
+    workbook = openpyxl.load_workbook(path)
+    assert workbook.properties.title == "round trip"
+    assert workbook.active["A1"].value == "cell"
+
+
+def custom_properties(path):
+    with zipfile.ZipFile(path) as document:
+        root = ElementTree.fromstring(document.read("docProps/custom.xml"))
+    return {
+        node.get("name"): (node.get("pid"), node[0].text)
+        for node in root.iter(openXml.CUSTOM_PROPERTY_TAG)
+    }
+
+
+def test_property_model(files):
+    path = files["docx"]
+    parser = parse(path)
+    before = custom_properties(path)
+    parser.set_field("custom:Client", "ACME")
+    parser.set_field("custom:Project", "Apollo")
+    parser.set_field("lastPrinted", "2022-01-01T00:00:00Z")
+    parser.set_field("app:Manager", "Boss")
+    parser.delete_field("subject")
+    with pytest.raises(KeyError):
+        parser.set_field("app:Unknown", "x")
+    assert parser.write()
+
+    properties = custom_properties(path)
+    pids = [int(pid) for pid, _ in before.values()] + [openXml.CUSTOM_FIRST_PID - 1]
+    assert properties["Client"] == (str(max(pids) + 1), "ACME")
+    assert properties["Project"] == (str(max(pids) + 2), "Apollo")
+    values = parse(path).get_all_values()
+    assert values["custom:Client"] == "ACME"
+    assert values["lastPrinted"] == "2022-01-01T00:00:00Z"
+    assert values["app:Manager"] == "Boss"
+    assert "subject" not in values
+
+    parser = parse(path)
+    parser.clear()
+    assert parser.write()
+    assert parse(path).get_all_values() == {}
+    assert custom_properties(path) == {}
@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+
+import pytest
+
+from metaparser import output
+from metaparser.engine import FileResult
+
+
+def records():
+    parsed = FileResult("a.mp3")
+    parsed.mime, parsed.parser = "audio/mpeg", "Mp3Parser"
+    parsed.timings = {"total": 0.5}
+    unsupported = FileResult("notes.txt")
+    return [
+        output.create_record(parsed, {"title": "Song", "track_num": [1, 2]}),
+        output.create_record(unsupported),
+    ]
+
+
+def write(output_format):
+    stream = io.StringIO()
+    writer = output.create_writer(output_format, stream)
+    for record in records():
+        writer.write(record)
+    writer.close()
+    return stream.getvalue()
+
+
+def test_record_writer_is_abstract():
+    with pytest.raises(TypeError):
+        output.RecordWriter(io.StringIO())  # type: ignore
+
+
+def test_text_output_has_no_writer():
+    assert output.create_writer(output.FORMAT_TEXT) is None
+
+
+def test_ndjson_writes_a_line_per_record():
+    lines = write(output.FORMAT_NDJSON).splitlines()
+    assert [json.loads(line) for line in lines] == records()
+
+
+def test_json_writes_an_array():
+    assert json.loads(write(output.FORMAT_JSON)) == records()
+    stream = io.StringIO()
+    output.create_writer(output.FORMAT_JSON, stream).close()
+    assert json.loads(stream.getvalue()) == []
+
+
+def test_csv_writes_a_row_per_field():
+    rows = list(csv.reader(io.StringIO(write(output.FORMAT_CSV))))
+    assert rows[0] == output.CSV_COLUMNS
+    assert rows[1] == ["a.mp3", "audio/mpeg", "Mp3Parser", "title", "Song", "0.5", ""]
+    assert rows[2][3:5] == ["track_num", "[1, 2]"]
+    assert rows[3] == ["notes.txt", "", "", "", "", "", ""]
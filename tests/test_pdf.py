@@ -0,0 +1,60 @@
+from PyPDF2 import PdfFileReader
+
+from metaparser.modules.auto import ParserFactory
+from metaparser.modules.pdf import OPTION_COMPACT
+
+
+def parse(path, **options):
+    parser = ParserFactory.create_parser_for_file(path, options)
+    parser.parse(path)
+    return parser
+
+
+def info(path):
+    with open(path, "rb") as f:
+        metadata = PdfFileReader(f).getDocumentInfo()
+        return {field: str(metadata[field]) for field in metadata}
+
+
+def test_info_matches_pypdf2(files):
+    values = parse(files["pdf"]).get_all_values()
+    assert {field: str(value) for field, value in values.items()} == info(files["pdf"])
+
+
+def test_edits_are_appended(files):
+    path = files["pdf"]
+    with open(path, "rb") as f:
+        original = f.read()
+    title = info(path)["/Title"]
+
+    parser = parse(path)
+    parser.set_field("/Title", "first")
+    parser.set_field("/Author", "ACME")
+    assert parser.write()
+    assert parser.written_in_place
+    # the second update chains to the first one
+    parser.set_field("/Title", "second")
+    parser.delete_field("/Author")
+    assert parser.write()
+
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data.startswith(original)
+    assert title.encode() in data
+    values = info(path)
+    assert values["/Title"] == "second"
+    assert "/Author" not in values
+    assert parse(path).get_all_values()["/Title"] == "second"
+
+
+def test_compact_write_drops_old_values(files):
+    path = files["pdf"]
+    title = info(path)["/Title"]
+    parser = parse(path, **{OPTION_COMPACT: True})
+    parser.set_field("/Title", "compacted")
+    assert parser.write()
+    assert not parser.written_in_place
+
+    with open(path, "rb") as f:
+        assert title.encode() not in f.read()
+    assert info(path)["/Title"] == "compacted"
@@ -0,0 +1,49 @@
+import os
+
+from click.testing import CliRunner
+
+from metaparser import profiling
+from metaparser.__main__ import cli
+
+
+@profiling.timed(profiling.STAGE_PARSE)
+def parse(depth=0):
+    if depth:
+        parse(depth - 1)
+
+
+def test_stages_are_only_timed_while_recording():
+    parse()
+    profile = {}
+    with profiling.record(profile):
+        parse(depth=3)
+    assert set(profile) >= {profiling.STAGE_PARSE}
+    assert profile[profiling.STAGE_PARSE] > 0
+
+    timed = profile[profiling.STAGE_PARSE]
+    parse()
+    assert profile[profiling.STAGE_PARSE] == timed
+
+
+def test_nested_stage_is_counted_once(monkeypatch):
+    ticks = iter(range(100))
+    monkeypatch.setattr(profiling.time, "perf_counter", lambda: next(ticks))
+    profile = {}
+    with profiling.record(profile):
+        parse(depth=3)
+    # one start and one end reading for the outermost call only
+    assert profile[profiling.STAGE_PARSE] == 1
+
+
+def test_profile_report(files, tmp_path, tmp_path_factory):
+    stats = str(tmp_path_factory.mktemp("profile") / "run.prof")
+    result = CliRunner().invoke(
+        cli,
+        ["print", "-f", str(tmp_path), "--profile-slowest", "2"]
+        + ["--profile-stats", stats],
+    )
+    assert result.exit_code == 0, result.output
+    report = result.output[result.output.index("Profile:") :]
+    assert "slowest 2 file(s):" in report
+    assert f"cProfile stats saved to {stats}" in report
+    assert os.path.getsize(stats) > 0
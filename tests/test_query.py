@@ -0,0 +1,46 @@
+import pytest
+
+from metaparser import query
+
+
+def matches(predicate, values):
+    return query.parse(predicate).matches(values)
+
+
+def test_predicate_is_abstract():
+    with pytest.raises(TypeError):
+        query.Predicate("title")  # type: ignore
+
+
+def test_regular_expressions_search_every_element_of_lists():
+    assert matches("title=^Intro", {"title": ["Outro", "Intro"]})
+    assert matches("track_num=2", {"track_num": [1, 2]})
+    assert not matches("title=^Intro", {"title": "Outro"})
+    assert not matches("title=.", {})
+
+
+def test_field_names_may_hold_spaces_and_equal_signs_split_once():
+    predicate = query.parse("app:Doc Security=a=b")
+    assert predicate.field == "app:Doc Security"
+    assert predicate.matches({"app:Doc Security": "a=b"})
+
+
+def test_exists_ignores_empty_values():
+    assert matches("artist exists", {"artist": "A"})
+    assert not matches("artist exists", {"artist": ""})
+    assert not matches("artist exists", {"artist": [None]})
+    assert not matches("artist exists", {})
+
+
+def test_entropy_compares_the_strings_of_the_field():
+    values = {"comment": ["aaaa", "abcdefgh"], "bpm": 120}
+    assert matches("entropy(comment)>2.5", values)
+    assert matches("entropy(comment) <= 0", values)
+    assert not matches("entropy(comment)>3", values)
+    assert not matches("entropy(bpm)>=0", values)
+
+
+@pytest.mark.parametrize("text", ["title", "=x", "title=[", "entropy(title)>high"])
+def test_invalid_predicates(text):
+    with pytest.raises(ValueError):
+        query.parse(text)
@@ -0,0 +1,75 @@
+import subprocess
+import sys
+
+import pytest
+
+from metaparser.modules import auto
+from metaparser.modules.auto import ParserRegistry
+from metaparser.modules.base import BaseParser
+
+
+class PluginParser(BaseParser):
+    @staticmethod
+    def supported_mimes():
+        return ["text/x-plugin", "image/png"]
+
+
+class EntryPoint:
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+
+    def load(self):
+        if isinstance(self.target, Exception):
+            raise self.target
+        return self.target
+
+
+class EntryPoints(list):
+    def select(self, group):
+        assert group == auto.PLUGIN_GROUP
+        return self
+
+
+@pytest.fixture
+def plugins(monkeypatch):
+    entry_points = EntryPoints(
+        [EntryPoint("broken", ImportError("missing")), EntryPoint("ok", PluginParser)]
+    )
+    monkeypatch.setattr(auto.importlib.metadata, "entry_points", lambda: entry_points)
+    return entry_points
+
+
+def test_startup_imports_no_parser():
+    modules = ["eyed3", "mutagen", "PyPDF2", "exif", "metaparser.modules.mp3"]
+    code = (
+        "import sys, metaparser.__main__; "
+        f"print([m for m in {modules!r} if m in sys.modules])"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.strip() == "[]"
+
+
+def test_parsers_are_imported_on_first_use(plugins):
+    registry = ParserRegistry()
+    registry.register("metaparser.modules.pdf:PDFParser", ["application/pdf"])
+    parser = registry.get("application/pdf")
+    assert parser.__name__ == "PDFParser"
+    assert registry.get("application/pdf") is parser
+
+
+def test_builtin_parsers_win_over_plugins(plugins):
+    registry = ParserRegistry()
+    for parser, mimes in auto.BUILTIN_PARSERS:
+        registry.register(parser, mimes)
+    assert registry.get("image/png").__name__ == "ExifParser"
+    assert registry.get("text/x-plugin") is PluginParser
+    assert registry.has_plugins()
+    assert PluginParser in registry.parsers()
+
+
+def test_no_plugins(monkeypatch):
+    monkeypatch.setattr(auto.importlib.metadata, "entry_points", EntryPoints)
+    registry = ParserRegistry()
+    assert registry.get("text/x-plugin") is None
+    assert not registry.has_plugins()
@@ -0,0 +1,106 @@
+import os
+import signal
+import socket
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+from click.testing import CliRunner
+
+from metaparser import client, server
+from metaparser.__main__ import cli
+from metaparser.modules.auto import ParserFactory
+
+
+def test_handle(files):
+    record = server.handle({"command": "print", "file": files["pdf"]})
+    assert record["fields"]["/Title"]
+    assert not record["modified"]
+
+    message = {"command": "set", "file": files["pdf"], "field": "/Title"}
+    record = server.handle(dict(message, value="served"))
+    assert record["modified"] and record["in_place"]
+    parser = ParserFactory.create_parser_for_file(files["pdf"])
+    parser.parse(files["pdf"])
+    assert parser.get_all_values()["/Title"] == "served"
+
+
+@pytest.mark.parametrize(
+    "message,error",
+    [
+        ({"command": "print", "file": "relative.pdf"}, "absolute path"),
+        ({"command": "set", "file": "/a.pdf"}, "set needs a field"),
+        ({"command": "set", "file": "/a.pdf", "field": "/Title"}, "needs a value"),
+        ({"command": "rename", "file": "/a.pdf"}, "unknown command"),
+    ],
+)
+def test_invalid_requests(message, error):
+    with pytest.raises(ValueError, match=error):
+        server.handle(message)
+
+
+@pytest.fixture
+def running_server(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("server") / "metaparser.sock")
+    code = "from metaparser.__main__ import entry_point; entry_point()"
+    process = subprocess.Popen(
+        [sys.executable, "-c", code, "serve", "--socket", path, "--jobs", "1"]
+    )
+    deadline = time.monotonic() + 30
+    while not os.path.exists(path):
+        assert process.poll() is None and time.monotonic() < deadline
+        time.sleep(0.05)
+    yield path
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(30) == 0
+    assert not os.path.exists(path)
+
+
+def test_server(files, running_server):
+    assert stat.S_IMODE(os.stat(running_server).st_mode) == 0o600
+    record = client.request(running_server, {"command": "detect", "file": files["mp3"]})
+    assert record["mime"] == "audio/mpeg"
+    record = client.request(
+        running_server,
+        {"command": "set", "file": files["mp3"], "field": "title", "value": "x"},
+    )
+    assert record["modified"]
+    record = client.request(running_server, {"command": "print", "file": files["mp3"]})
+    assert record["fields"]["title"] == "x"
+    with pytest.raises(client.ServerError, match="absolute path"):
+        client.request(running_server, {"command": "print", "file": "a.mp3"})
+
+
+def test_print_matches_local_print(files, running_server):
+    # the MP3 has a track number and an embedded picture, encoded in the record
+    local = CliRunner().invoke(cli, ["print", "-f", files["mp3"]])
+    served = CliRunner().invoke(
+        cli, ["print", "-f", files["mp3"], "--server", running_server]
+    )
+    assert local.exit_code == 0 and served.exit_code == 0, served.output
+    assert "track_num: (" in local.output and "images: [image/jpeg" in local.output
+    assert served.output == local.output
+
+
+def test_running_server_is_not_replaced(files, running_server):
+    result = CliRunner().invoke(cli, ["serve", "--socket", running_server])
+    assert result.exit_code == 1
+    assert "already listening" in result.output
+    record = client.request(running_server, {"command": "detect", "file": files["pdf"]})
+    assert record["mime"] == "application/pdf"
+
+
+def test_only_stale_sockets_are_removed(tmp_path):
+    stale = str(tmp_path / "stale.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.bind(stale)
+    server._claim(stale)
+    assert not os.path.exists(stale)
+
+    other = tmp_path / "other.sock"
+    other.write_text("not a socket")
+    with pytest.raises(FileExistsError, match="not a socket"):
+        server._claim(str(other))
+    assert other.read_text() == "not a socket"
@@ -0,0 +1,89 @@
+import collections
+import random
+
+import pytest
+
+from metaparser.sketches import HyperLogLog, SpaceSaving
+
+
+def stream(n, distinct, seed=0):
+    """Values with a skewed, Zipf like, distribution"""
+    generator = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    return [f"v{i}" for i in generator.choices(range(distinct), weights, k=n)]
+
+
+def check_bounds(sketch, values):
+    truth = collections.Counter(values)
+    assert sum(sketch.counts.values()) == len(values)
+    for value, count, error in sketch.top():
+        assert truth[value] <= count <= truth[value] + error
+        assert error <= len(values) // sketch.capacity
+    # every value more frequent than the floor keeps a counter
+    for value, count in truth.items():
+        if count > sketch.floor():
+            assert value in sketch.counts
+
+
+@pytest.mark.parametrize("distinct", [10, 1000])
+def test_hyperloglog_error(distinct):
+    sketch = HyperLogLog()
+    for i in range(distinct):
+        sketch.add(f"value {i}")
+        sketch.add(f"value {i}")
+    # three standard errors of the default precision
+    assert abs(sketch.count() - distinct) <= max(1, 0.05 * distinct)
+
+
+def test_hyperloglog_merge():
+    a, b, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+    for i in range(5000):
+        (a if i % 2 else b).add(str(i))
+        both.add(str(i))
+    a.merge(b)
+    assert a.registers == both.registers
+    assert HyperLogLog.from_dict(a.to_dict()).registers == a.registers
+
+
+def test_space_saving_is_exact_below_capacity():
+    values = stream(2000, 50)
+    sketch = SpaceSaving(capacity=50)
+    for value in values:
+        sketch.add(value)
+    truth = collections.Counter(values)
+    assert sketch.top() == [
+        (value, count, 0)
+        for value, count in sorted(truth.items(), key=lambda item: (-item[1], item[0]))
+    ]
+
+
+def test_space_saving_error_bounds():
+    values = stream(20000, 2000)
+    sketch = SpaceSaving(capacity=50)
+    for value in values:
+        sketch.add(value)
+    check_bounds(sketch, values)
+    assert sketch.floor() == min(sketch.counts.values())
+    assert sketch.top(1)[0][0] == "v0"
+
+
+def test_space_saving_merge_and_serialization():
+    values = stream(20000, 2000, seed=1)
+    first, second = SpaceSaving(capacity=50), SpaceSaving(capacity=50)
+    for i, value in enumerate(values):
+        (first if i < len(values) // 2 else second).add(value)
+    first = SpaceSaving.from_dict(first.to_dict())
+    first.merge(second)
+    assert first.top(3)[0][0] == "v0"
+    truth = collections.Counter(values)
+    for value, count, error in first.top():
+        assert truth[value] <= count <= truth[value] + error
+
+    # the restored sketch keeps counting, replacing its least counted values
+    restored = SpaceSaving.from_dict(first.to_dict())
+    extra = stream(5000, 2000, seed=2)
+    for value in extra:
+        restored.add(value)
+        first.add(value)
+    assert restored.top() == first.top()
+    assert len(restored.counts) == restored.capacity
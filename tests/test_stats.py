@@ -0,0 +1,40 @@
+import json
+
+from click.testing import CliRunner
+
+import benchmarks.corpus as corpus
+from metaparser.__main__ import cli
+
+
+def stats(*args):
+    result = CliRunner().invoke(cli, ["stats", *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_report(files, tmp_path):
+    report = stats("-f", str(tmp_path), "--top", "1")
+    lines = report.splitlines()
+    assert "audio/mpeg: 1 file(s)" in lines
+    assert "application/pdf: 1 file(s)" in lines
+    assert any(line.startswith("  /Title: 1 file(s), ~1 distinct") for line in lines)
+
+
+def test_saved_statistics_merge_into_the_whole_corpus(tmp_path, tmp_path_factory):
+    corpus.generate(str(tmp_path / "a"), count=3, size=4096, tags=3, seed=0)
+    corpus.generate(str(tmp_path / "b"), count=3, size=4096, tags=3, seed=1)
+    saved = tmp_path_factory.mktemp("stats")
+
+    stats("-f", str(tmp_path / "a"), "--save", str(saved / "a.json"))
+    stats("-f", str(tmp_path / "b"), "--save", str(saved / "b.json"))
+    merged = stats("--merge", str(saved / "a.json"), "--merge", str(saved / "b.json"))
+    assert merged == stats("-f", str(tmp_path))
+    assert "image/jpeg: 6 file(s)" in merged.splitlines()
+
+
+def test_merge_rejects_other_files(tmp_path):
+    path = tmp_path / "other.json"
+    path.write_text(json.dumps({"version": 0}))
+    result = CliRunner().invoke(cli, ["stats", "--merge", str(path)])
+    assert result.exit_code == 2
+    assert "does not hold statistics of this version" in result.output
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+from click.testing import CliRunner
+
+from metaparser import walker
+from metaparser.__main__ import cli
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name, size in [
+        ("a.jpg", 10),
+        ("b.txt", 2000),
+        ("sub/c.jpg", 3000),
+        ("sub/deeper/d.pdf", 10),
+        ("skip/e.jpg", 10),
+    ]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+    return tmp_path
+
+
+def walked(tree, **filters):
+    paths = walker.walk(str(tree), walker.Filters(**filters))
+    return sorted(os.path.relpath(path, tree) for path in paths)
+
+
+@pytest.mark.parametrize(
+    "text,size",
+    [("512", 512), ("64k", 65536), ("1.5G", 1610612736), ("2 MiB", 2097152)],
+)
+def test_parse_size(text, size):
+    assert walker.parse_size(text) == size
+
+
+@pytest.mark.parametrize("text", ["", "-1k", "ten", "inf", "nan"])
+def test_cli_rejects_invalid_sizes(tree, text):
+    result = CliRunner().invoke(cli, ["detect", "-f", str(tree), "--max-size", text])
+    assert result.exit_code == 2
+    assert "is not a size" in result.output
+
+
+def test_filters(tree):
+    assert walked(tree) == [
+        "a.jpg",
+        "b.txt",
+        "skip/e.jpg",
+        "sub/c.jpg",
+        "sub/deeper/d.pdf",
+    ]
+    assert walked(tree, include=["*.jpg"], exclude=["skip"]) == ["a.jpg", "sub/c.jpg"]
+    assert walked(tree, exclude=["sub/*.jpg"]) == [
+        "a.jpg",
+        "b.txt",
+        "skip/e.jpg",
+        "sub/deeper/d.pdf",
+    ]
+    assert walked(tree, mimes=["application/pdf"]) == ["sub/deeper/d.pdf"]
+    assert walked(tree, max_depth=2) == ["a.jpg", "b.txt", "skip/e.jpg", "sub/c.jpg"]
+    assert walked(tree, min_size=1000, max_size=2500) == ["b.txt"]
+
+
+def test_symlinks(tree):
+    os.symlink(tree / "sub", tree / "link")
+    os.symlink(tree / "a.jpg", tree / "f.jpg")
+    files = walked(tree, symlinks=walker.SYMLINKS_FILES)
+    assert "f.jpg" in files and "link/c.jpg" not in files
+    files = walked(tree, symlinks=walker.SYMLINKS_SKIP)
+    assert "f.jpg" not in files
+    # the linked directory is walked once, under one of its two paths
+    files = walked(tree, symlinks=walker.SYMLINKS_FOLLOW)
+    assert len([path for path in files if path.endswith("c.jpg")]) == 1